@@ -1,17 +1,25 @@
 import os
 import json
-from dotenv import load_dotenv
+import time
 
-import paho.mqtt.client as paho
+from lazyImport import lazyImport # Heavy modules load on first use, so bots start fast
+load_dotenv = lazyImport('dotenv', 'load_dotenv')
+paho = lazyImport('paho.mqtt.client')
 from paho import mqtt
-import time
 
-from colorama import Fore # For colored output
+Fore = lazyImport('colorama', 'Fore') # For colored output
+
+WorldModel = lazyImport('worldModel', 'WorldModel') # NumPy loads with the first game state
+batchPolicy = lazyImport('batchPolicy')
 import random
+from tracing import correlationProperties
 
 
 game_over = False
-playerViews = {}
+world_models = {} # WorldModel of every player, keyed by their game_state topic, or of every team in team vision games
+player_teams = {} # Team game_state topic of every player, in team vision games
+lobby_config = {'height': 10, 'width': 10, 'visionRadius': 2, 'lineOfSight': False, 'teamVision': False} # Updated from the lobby's config topic when the game starts
+playerCodes = {} # Codes of the 5x5 window around every player, the input of batchPolicy.chooseDirections
 
 # setting callbacks for different events to see if it works, print the message etc.
 def on_connect(client, userdata, flags, rc, properties=None):
@@ -69,51 +77,41 @@ def on_message(client, userdata, msg):
             print(f"Invalid JSON: {msg.payload}")
         return
 
+    if msg.topic.endswith('/config'):
+        # A new game is starting, size the world models for its board
+        lobby_config.update(game_state)
+        world_models.clear()
+        player_teams.clear()
+        print(Fore.WHITE + 'Lobby configuration: ' + str(game_state))
+        return
+
+    if '/team/' in msg.topic:
+        # Team vision, one observation for the whole team arrives before the positions of its players
+        if msg.topic not in world_models:
+            world_models[msg.topic] = WorldModel(lobby_config['height'], lobby_config['width'], lobby_config['visionRadius'], lobby_config['lineOfSight'])
+        world_models[msg.topic].update_team(game_state)
+        for name in game_state['teammateNames']:
+            player_teams[name] = msg.topic
+        return
+
     if 'currentPosition' in game_state:
-        current_position = game_state['currentPosition']
-        # print(Fore.GREEN + 'Current Position: ' + str(current_position))
-
-        walls = game_state.get('walls', [])
-        # print(Fore.BLUE + 'Walls: ' + str(walls))
-        coins = {
-            'Coin1': game_state.get('coin1', []),
-            'Coin2': game_state.get('coin2', []),
-            'Coin3': game_state.get('coin3', []),
-        }
-        # print(Fore.YELLOW + 'Coins: ' + str(coins))
-
-        teammate_positions = game_state.get('teammatePositions', [])
-        # print(Fore.CYAN + 'Teammate Positions: ' + str(teammate_positions))
-
-        enemy_positions = game_state.get('enemyPositions', [])
-        # print(Fore.RED + 'Enemy Positions: ' + str(enemy_positions))
-
-        player_view = [['None' for _ in range(5)] for _ in range(5)]  # creates 5x5 square of Nones
-
-        # Calculating the starting row and column for the view
-        start_row, start_col = [pos - 2 for pos in current_position]
-
-        # Update the player's view based on their current position
-        update_player_view(player_view, current_position, start_row, start_col)
-
-        # Update the player's view with walls, coins, teammates, and enemies
-        for wall in walls:
-            update_view(player_view, wall, start_row, start_col, 'Wall')
-        for coin_type, coin_positions in coins.items():
-            for coin in coin_positions:
-                update_view(player_view, coin, start_row, start_col, coin_type)
-        for teammate in teammate_positions:
-            update_view(player_view, teammate, start_row, start_col, 'Teammate')
-        for enemy in enemy_positions:
-            update_view(player_view, enemy, start_row, start_col, 'Enemy')
+        if lobby_config['teamVision']:
+            # Team vision, look at the team's world model from the player's position
+            world_model = world_models[player_teams[msg.topic.split('/')[2]]]
+            world_model.locate(game_state['currentPosition'])
+        else:
+            # Merge the observation into the player's world model and look at the window around them
+            if msg.topic not in world_models:
+                world_models[msg.topic] = WorldModel(lobby_config['height'], lobby_config['width'], lobby_config['visionRadius'], lobby_config['lineOfSight'])
+            world_model = world_models[msg.topic]
+            world_model.update(game_state)
+        player_view = world_model.view(2) # choose_direction plans on a 5x5 board
 
         # Print the player's view
         print()
         print(Fore.WHITE + msg.topic)
 
-        global playerViews
-
-        playerViews[msg.topic] = player_view #stores player's 5x5 grid
+        playerCodes[msg.topic] = world_model.codes(2)
 
         #displays the 5x5 grid with colors
         for row in player_view:
@@ -139,42 +137,6 @@ def on_message(client, userdata, msg):
     # print(Fore.WHITE + "message: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
 
 
-def update_player_view(view, position, start_row, start_col):
-    '''adds '.' for positions in view that do not exist. For when player is on the edge of the game board'''
-    x, y = position
-    if y > 7:
-        for val in range(5):
-            view[val][4] = '.'
-        if y > 8:
-            for val in range(5):
-                view[val][3] = '.'
-    if y < 2:
-        for val in range(5):
-            view[val][0] = '.'
-        if y < 1:
-            for val in range(5):
-                view[val][1] = '.'
-    if x > 7:
-        for val in range(5):
-            view[4][val] = '.'
-        if x > 8:
-            for val in range(5):
-                view[3][val] = '.'
-    if x < 2:
-        for val in range(5):
-            view[0][val] = '.'
-        if x < 1:
-            for val in range(5):
-                view[1][val] = '.'
-    view[position[0] - start_row][position[1] - start_col] = 'Player' #adds player to center of view
-
-
-def update_view(view, position, start_row, start_col, item):
-    try:
-        view[position[0] - start_row][position[1] - start_col] = item
-    except IndexError:
-        pass  # Ignore positions outside of the player's view
-
 def choose_direction(board):
     '''choose direction for player to move'''
     coins_priority = ['Coin3', 'Coin2', 'Coin1']
@@ -252,7 +214,9 @@ if __name__ == '__main__':
 
     client.subscribe(f"games/{lobby_name}/lobby")
     client.subscribe(f'games/{lobby_name}/+/game_state')
+    client.subscribe(f'games/{lobby_name}/team/+/game_state')
     client.subscribe(f'games/{lobby_name}/scores')
+    client.subscribe(f'games/{lobby_name}/config')
 
     client.publish("new_game", json.dumps({'lobby_name':lobby_name,
                                             'team_name':'ATeam',
@@ -280,19 +244,19 @@ if __name__ == '__main__':
             time.sleep(1)
 
     directions = ["UP", "DOWN", "LEFT", "RIGHT"] #possible movement directions
+    tick = 0
     client.loop_start()
     while not game_over:
         try:
-            for player in players:
-                time.sleep(0.1)
-                
-                playerGrid = playerViews[f'games/{lobby_name}/{player}/game_state'] #retrieves corresponding players 5x5 grid
-
-                command = choose_direction(playerGrid) #chooses a direction based off of player's view
-
+            tick += 1
+            # Every player of the fleet decides at once on the latest game states, the same moves choose_direction picks on their 5x5 grids
+            codes = [playerCodes[f'games/{lobby_name}/{player}/game_state'] for player in players]
+            commands = [batchPolicy.MOVES[move] for move in batchPolicy.chooseDirections(codes)]
+            for player, command in zip(players, commands):
                 #sends chosen movements to game
                 if command in directions:
-                    client.publish(f"games/{lobby_name}/{player}/move", command)
+                    # The id comes back with the resulting game_state and shows up in the server's trace
+                    client.publish(f"games/{lobby_name}/{player}/move", command, properties=correlationProperties(f'{player}-{tick}'))
                 else:
                     print("Not a Valid Direction")
             time.sleep(1.5)
@@ -15,11 +15,13 @@
 #
 import time
 import random
-import numpy as np
 
 import paho.mqtt.client as paho
 from paho import mqtt
-import matplotlib.pyplot as plt
+
+from lazyImport import lazyImport # Only the plotting loop needs these
+np = lazyImport('numpy')
+plt = lazyImport('matplotlib.pyplot')
 
 
 
@@ -1,13 +1,30 @@
 import os
 import json
-import copy
-from collections import OrderedDict
+import threading
+import time
+from collections import OrderedDict, deque
 
-import paho.mqtt.client as paho
+from lazyImport import lazyImport # Heavy modules load on first use, so the server connects fast
+paho = lazyImport('paho.mqtt.client')
 from paho import mqtt
-from dotenv import load_dotenv
-
-from InputTypes import NewPlayer
+load_dotenv = lazyImport('dotenv', 'load_dotenv')
+
+# pydantic loads with the first message to validate
+NewPlayer = lazyImport('InputTypes', 'NewPlayer')
+Start = lazyImport('InputTypes', 'Start')
+LeaderboardQuery = lazyImport('InputTypes', 'LeaderboardQuery')
+ProfileRequest = lazyImport('InputTypes', 'ProfileRequest')
+MovePlan = lazyImport('InputTypes', 'MovePlan')
+QueueJoin = lazyImport('InputTypes', 'QueueJoin')
+from admission import AdmissionController
+from gamePool import GamePool
+from leaderboard import Leaderboard
+from matchmaking import Matchmaker
+from publisher import PublishPipeline
+from profiling import LobbyProfiler
+from memory import MemoryAccountant
+from hibernation import LobbyHibernator
+from tracing import Tracer, correlationId
 from game import Game
 from moveset import Moveset
 
@@ -57,12 +74,80 @@ def on_message(client, userdata, msg):
         :param userdata: userdata is set when initiating the client, here it is userdata=None
         :param msg: the message with topic and payload
     """
-    print("message: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-    topic_list = msg.topic.split("/")
+    correlation_id = correlationId(msg)
+    # The hibernation sweep changes the same state from its own thread
+    with client.tracer.span('on_message', topic=msg.topic, correlationId=correlation_id), client.state_lock:
+        client.correlation_id = correlation_id
+        topic_list = msg.topic.split("/")
+
+        if client.supervisor is not None:
+            # Forget the lobbies whose worker processes have finished
+            if client.supervisor.finished:
+                for lobby_name in client.supervisor.pop_finished():
+                    remove_lobby(client, lobby_name)
+            # Moves and plans of lobbies running in a worker are handled by the worker
+            if topic_list[-1] in ('move', 'plan') and len(topic_list) == 4 and topic_list[1] in client.supervisor.workers:
+                return
+
+        # Admin topics are routed by their second level, e.g. admin/profile/{lobby}
+        route = topic_list[1] if topic_list[0] == 'admin' and len(topic_list) > 1 else topic_list[-1]
+        handlers = admin_dispatch if topic_list[0] == 'admin' else dispatch
+
+        # Validate it is input we can deal with
+        if route not in handlers.keys():
+            return
+
+        # Drop anything over the rate limits before paying for parsing or dispatch
+        players = lobby_roster(client, topic_list[1]) if topic_list[0] == 'games' and len(topic_list) > 2 else None
+        if not client.admission.admit(topic_list, players, payload_lobby(msg.payload) if route == 'new_game' else None):
+            if players is not None and client.admission.should_notify(topic_list[1]):
+                publish_error_to_lobby(client, topic_list[1], "Overloaded: messages are being dropped, slow down")
+            return
+
+        if topic_list[0] == 'games':
+            wake_lobby(client, topic_list[1])
+
+        print("message: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+        with client.tracer.span('dispatch', route=route):
+            if client.profiler.active and topic_list[0] == 'games' and topic_list[1] in client.profiler.active:
+                profiled_dispatch(client, route, topic_list, msg.payload)
+            else:
+                handlers[route](client, topic_list, msg.payload)
+
+
+def lobby_roster(client, lobby_name):
+    """
+        :return: the players of the lobby's running game, empty for a lobby that hasn't started or is hibernated,
+                 None if the lobby doesn't exist. Moves only count once a game runs, so no roster is built per message
+    """
+    game = client.game_dict.get(lobby_name)
+    if game is not None:
+        return game.all_players
+    if lobby_name in client.team_dict or lobby_name in client.hibernator.hibernated:
+        return ()
+    return None
 
-    # Validate it is input we can deal with
-    if topic_list[-1] in dispatch.keys(): 
-        dispatch[topic_list[-1]](client, topic_list, msg.payload)
+
+def payload_lobby(msg_payload):
+    """
+        :return: the lobby named in a JSON payload, None if it names none
+    """
+    try:
+        lobby_name = json.loads(msg_payload).get('lobby_name')
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return lobby_name if isinstance(lobby_name, str) else None
+
+
+def profiled_dispatch(client, route, topic_list, msg_payload):
+    """
+        Dispatches a message of a lobby that is being profiled, its ticks are counted by the publish pipeline
+    """
+    token = client.profiler.enable(topic_list[1])
+    try:
+        dispatch[route](client, topic_list, msg_payload)
+    finally:
+        client.profiler.disable(token)
 
 
 
@@ -74,6 +159,7 @@ def add_player(client, topic_list, msg_payload):
     except:
         print("ValidationError in create_game")
         return
+    wake_lobby(client, player.lobby_name)
     
     # If lobby doesn't exists...
     if player.lobby_name not in client.team_dict.keys():
@@ -96,6 +182,59 @@ def add_team(client, player):
     else:
         client.team_dict[player.lobby_name][player.team_name].append(player.player_name)
 
+# Dispatched function, queues a player for matchmaking
+def join_queue(client, topic_list, msg_payload):
+    try:
+        request = QueueJoin(**json.loads(msg_payload))
+    except (ValueError, TypeError):
+        print("ValidationError in join_queue")
+        return
+    client.matchmaker.enqueue(request.player_name, request.team_name)
+
+
+# Dispatched function, takes a player out of the matchmaking queue
+def leave_queue(client, topic_list, msg_payload):
+    player_name = msg_payload.decode(errors='replace') if isinstance(msg_payload, bytes) else ''
+    client.matchmaker.leave(player_name)
+
+
+def run_matchmaking(client):
+    """
+        Batches the matchmaking queue into lobbies and starts them once their players had time to subscribe, forever, run on its own thread
+    """
+    # Matched lobbies all start with the same configuration, validated by init_client
+    config = client.match_start
+    while True:
+        time.sleep(client.matchmaking_interval)
+        with client.state_lock:
+            # Names of hibernated lobbies are taken too, a lobby with one of them would be replaced when it wakes up
+            lobbies = client.matchmaker.match(taken=client.team_dict.keys() | client.hibernator.hibernated)
+        # The lock is taken per lobby, so a burst of matches doesn't hold up the moves of running games
+        for lobby in lobbies:
+            lobby_name = lobby['lobby_name']
+            with client.state_lock:
+                client.team_dict[lobby_name] = {'started': False, **lobby['teams']}
+            # Matched lobbies are all the same size, their layouts are ready by the time they start
+            num_players = sum(len(players) for players in lobby['teams'].values())
+            client.game_pool.warm(config.height, config.width, num_players)
+            for team_name, players in lobby['teams'].items():
+                for player_name in players:
+                    # Published once, the players subscribe before they join
+                    client.publish(f'matchmaking/assignments/{player_name}', json.dumps({'lobby_name': lobby_name,
+                                                                                          'team_name': team_name,
+                                                                                          'teams': lobby['teams']}), qos=1)
+            print(f'Matched lobby {lobby_name}: {lobby["teams"]}')
+
+        for lobby_name in client.matchmaker.due():
+            with client.state_lock:
+                # Stopped or hibernated in the meantime, the players can still start it themselves
+                if lobby_name in client.team_dict and not client.team_dict[lobby_name]['started']:
+                    try:
+                        start_game(client, ['games', lobby_name, 'start'], client.match_config.encode())
+                    except Exception as e:
+                        print(f"Failed to start matched lobby {lobby_name}: {e}")
+
+
 move_to_Moveset = {
     'UP' : Moveset.UP,
     'DOWN' : Moveset.DOWN,
@@ -103,69 +242,394 @@ move_to_Moveset = {
     'RIGHT' : Moveset.RIGHT
 }
 
+def running_game(client, lobby_name, player_name):
+    """
+        :return: the running game of the lobby if the player is in it, else None once the error is published
+    """
+    if lobby_name not in client.team_dict.keys():
+        publish_error_to_lobby(client, lobby_name, "Lobby name not found.")
+        return None
+    if lobby_name not in client.game_dict:
+        publish_error_to_lobby(client, lobby_name, "Game has not started yet.")
+        return None
+    game: Game = client.game_dict[lobby_name]
+
+    # Only players in the roster get a slot, which bounds the lobby's queue
+    if player_name not in game.all_players:
+        publish_error_to_lobby(client, lobby_name, f"{player_name} is not in this lobby.")
+        return None
+    return game
+
+
+def remember_correlation(client, lobby_name, player_name):
+    """
+        Keeps the correlation id of the player's move or plan for the game states it results in
+    """
+    correlations = client.correlation_dict.setdefault(lobby_name, {})
+    if client.correlation_id is None:
+        correlations.pop(player_name, None)
+    else:
+        correlations[player_name] = client.correlation_id
+
+
 # Dispatched Function: handles player movement commands
 def player_move(client, topic_list, msg_payload):
     lobby_name = topic_list[1]
     player_name = topic_list[2]
-    if lobby_name in client.team_dict.keys():
-        try:
-            new_move = msg_payload.decode()
-
-            client.move_dict[lobby_name][player_name] = (player_name, move_to_Moveset[new_move])
-            game: Game = client.game_dict[lobby_name]
-
-            # If all players made a move, resolve movement
-            if len(game.all_players) == len(client.move_dict[lobby_name]):
-                for player, move in client.move_dict[lobby_name].values():
-                    game.movePlayer(player, move)
-
-                # Publish player states after all movement is resolved
-                for player, _ in client.move_dict[lobby_name].values():
-                    client.publish(f'games/{lobby_name}/{player}/game_state', json.dumps(game.getGameData(player)))
-
-                # Clear move list
-                client.move_dict[lobby_name].clear()
-                print(game.map)
-                client.publish(f'games/{lobby_name}/scores', json.dumps(game.getScores()))
-                if game.gameOver():
-                    # Publish game over, remove game
-                    publish_to_lobby(client, lobby_name, "Game Over: All coins have been collected")
-                    client.team_dict.pop(lobby_name)
-                    client.move_dict.pop(lobby_name)
-                    client.game_dict.pop(lobby_name)
+    game = running_game(client, lobby_name, player_name)
+    if game is None:
+        return
+
+    # Store the raw payload; repeated moves within a tick overwrite each other and are only parsed once
+    client.move_dict[lobby_name][player_name] = msg_payload
+    # A single move replaces the player's plan
+    client.plan_dict[lobby_name].pop(player_name, None)
+    remember_correlation(client, lobby_name, player_name)
+    resolve_tick(client, lobby_name, game)
+
+
+# Dispatched Function: handles move plans, several moves played one per tick
+def player_plan(client, topic_list, msg_payload):
+    lobby_name = topic_list[1]
+    player_name = topic_list[2]
+    game = running_game(client, lobby_name, player_name)
+    if game is None:
+        return
+
+    try:
+        plan = MovePlan(**json.loads(msg_payload))
+    except (ValueError, TypeError):
+        publish_error_to_lobby(client, lobby_name, f"Invalid move plan from {player_name}.")
+        return
+
+    # The plan replaces the player's previous plan, and their move of this tick if they already sent one
+    client.move_dict[lobby_name].pop(player_name, None)
+    client.plan_dict[lobby_name][player_name] = deque(move_to_Moveset[move] for move in plan.moves)
+    remember_correlation(client, lobby_name, player_name)
+    resolve_tick(client, lobby_name, game)
+
+
+def resolve_tick(client, lobby_name, game):
+    """
+        Resolves the next tick if every player has a move, either sent for this tick or the next step of their plan.
+        At most one tick per call, the following steps of the plans are played by step_plans.
+        The moves are applied by the lobby's publish pipeline worker, the callback only queues them and never waits on the game
+    """
+    pending = client.move_dict[lobby_name]
+    plans = client.plan_dict[lobby_name]
+    if len(game.all_players) == len(pending) + len(plans):
+        # The lobby already has ticks queued, its moves stay coalesced until the pipeline catches up
+        if client.publisher.full(lobby_name):
+            return
+        moves = parse_moves(client, lobby_name)
+        if len(moves) + len(plans) != len(game.all_players):
+            return
+        stepped = {}
+        for player, plan in list(plans.items()):
+            moves.append((player, plan.popleft()))
+            stepped[player] = plan
+            if not plan:
+                del plans[player]
+
+        # Clear move list
+        pending.clear()
+        client.tick_dict[lobby_name] += 1
+
+        # The correlation id of a plan comes back with the game state of each of its steps
+        correlations = client.correlation_dict.get(lobby_name, {})
+        tick_correlations = {player: correlations[player] for player, _ in moves if player in correlations}
+        for player in tick_correlations:
+            if player not in plans:
+                del correlations[player]
+
+        # Game states are built and published by the pipeline once the moves are applied, followed by the scores
+        client.publisher.submit(lobby_name, game, [player for player, _ in moves], correlations=tick_correlations,
+                                tick=client.tick_dict[lobby_name], resolve=lambda moves=moves, stepped=stepped: apply_tick(client, lobby_name, game, moves, stepped))
+
+
+def step_plans(client):
+    """
+        Resolves the next tick of every lobby its players' plans and moves are ready for, e.g. the next step of everyone's plan,
+        or moves coalesced while the lobby's pipeline was full
+    """
+    with client.state_lock:
+        for lobby_name, game in list(client.game_dict.items()):
+            if client.plan_dict.get(lobby_name) or client.move_dict.get(lobby_name):
+                resolve_tick(client, lobby_name, game)
+
 
+def run_plan_ticks(client):
+    """
+        Plays the move plans one tick every plan_interval seconds, forever, run on its own thread
+    """
+    while True:
+        time.sleep(client.plan_interval)
+        try:
+            step_plans(client)
         except Exception as e:
-            raise e
-            publish_error_to_lobby(client, lobby_name, e.__str__)
-    else:
-        publish_error_to_lobby(client, lobby_name, "Lobby name not found.")
+            print(f"Failed to step the move plans: {e}")
+
+
+def apply_tick(client, lobby_name, game, moves, stepped):
+    """
+        Applies the moves of a tick, run by the lobby's publish pipeline worker
+        :param stepped: {'player_name' : plan} of the players whose move is the next step of their plan
+        :return: the messages published after the game states, None if the game was over before the tick
+    """
+    if game.gameOver():
+        return None
+    blocked = []
+    for player, move in moves:
+        loc = game.getPlayer(player).loc
+        with client.tracer.span('movePlayer', player=player, move=move.name):
+            game.movePlayer(player, move)
+        if player in stepped and game.getPlayer(player).loc == loc:
+            blocked.append(player)
+
+    messages = [(f'games/{lobby_name}/scores', json.dumps(game.getScores()))]
+    game_over = game.gameOver()
+    if game_over:
+        messages.append((f'games/{lobby_name}/lobby', "Game Over: All coins have been collected"))
+    if blocked or game_over:
+        with client.state_lock:
+            # The rest of a plan was made for a path that is blocked, the player has to send a new one
+            plans = client.plan_dict.get(lobby_name, {})
+            for player in blocked:
+                if plans.get(player) is stepped[player]:
+                    del plans[player]
+            if game_over and client.game_dict.get(lobby_name) is game:
+                # Keep the result, remove game
+                roster = {team: players for team, players in client.team_dict[lobby_name].items() if team != 'started'}
+                client.leaderboard.record(lobby_name, roster, game.getScores(), client.tick_dict[lobby_name], game.getCoins())
+                remove_lobby(client, lobby_name)
+    return messages
+
+
+def parse_moves(client, lobby_name):
+    """
+        Parses the coalesced raw moves of a lobby, dropping (and reporting) the invalid ones
+        :return: list of (player_name, Moveset) in the order the players first moved
+    """
+    moves = []
+    pending = client.move_dict[lobby_name]
+    for player_name, payload in list(pending.items()):
+        move = move_to_Moveset.get(payload.decode(errors='replace'))
+        if move is None:
+            pending.pop(player_name)
+            publish_error_to_lobby(client, lobby_name, f"Invalid move from {player_name}.")
+            continue
+        moves.append((player_name, move))
+    return moves
+
+
+# Per-lobby budgets, in cells touched per tick
+MAX_OBSERVATION_CELLS = 121 # largest vision window sent to a player (radius 5)
+MAX_TICK_COST = 40000 # observations of every player plus the printed map
+
+
+def estimate_tick_cost(config, num_players):
+    return num_players * (2 * config.vision_radius + 1) ** 2 + config.width * config.height
+
+
+def check_lobby_config(config, num_players):
+    """
+        :return: why the configuration is refused, or None if it fits in the budget
+    """
+    if (2 * config.vision_radius + 1) ** 2 > MAX_OBSERVATION_CELLS:
+        return f"Vision radius {config.vision_radius} exceeds the observation size limit of {MAX_OBSERVATION_CELLS} cells"
+    cost = estimate_tick_cost(config, num_players)
+    if cost > MAX_TICK_COST:
+        return f"Estimated cost of {cost} cells per tick exceeds the limit of {MAX_TICK_COST}"
+    if num_players > config.width * config.height // 2:
+        return f"A {config.height}x{config.width} board is too small for {num_players} players"
+    return None
+
+
+def parse_match_config(match_config, lobby_size):
+    """
+        :return: the Start configuration of matched lobbies, raises ValueError if they couldn't start with it
+    """
+    try:
+        config = Start(start=match_config) if match_config == 'START' else Start(**json.loads(match_config))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid MATCH_CONFIG {match_config!r}: {e}")
+    error = check_lobby_config(config, lobby_size)
+    if error is not None:
+        raise ValueError(f"MATCH_CONFIG can't start lobbies of {lobby_size} players: {error}")
+    return config
 
 
 # Dispatched function: Instantiates Game object
 def start_game(client, topic_list, msg_payload):
     lobby_name = topic_list[1]
-    if isinstance(msg_payload, bytes) and msg_payload.decode() == "START":
+    command = msg_payload.decode(errors='replace') if isinstance(msg_payload, bytes) else ''
+    if command == "START" or command.startswith('{'):
+        # Either a plain START with the default configuration or a JSON start message configuring the lobby
+        try:
+            config = Start(start=command) if command == "START" else Start(**json.loads(command))
+        except (ValueError, TypeError):
+            publish_error_to_lobby(client, lobby_name, "Invalid lobby configuration.")
+            return
 
         if lobby_name in client.team_dict.keys():
-                # create new game
-                dict_copy = copy.deepcopy(client.team_dict[lobby_name])
-                dict_copy.pop('started')
-
-                game = Game(dict_copy)
+                # create new game, placing the players into a pre-generated layout when one is ready
+                dict_copy = {team: list(players) for team, players in client.team_dict[lobby_name].items() if team != 'started'}
+                num_players = sum(len(players) for players in dict_copy.values())
+
+                error = check_lobby_config(config, num_players)
+                if error is not None:
+                    publish_error_to_lobby(client, lobby_name, error)
+                    return
+
+                error = client.memory.admit(lobby_name, config.height, config.width, num_players, len(dict_copy), config.vision_radius)
+                if error is not None:
+                    publish_error_to_lobby(client, lobby_name, error)
+                    return
+
+                if client.supervisor is not None:
+                    # The worker process builds and runs the game
+                    client.team_dict[lobby_name]["started"] = True
+                    client.supervisor.spawn(lobby_name, dict_copy, json.dumps(config.model_dump()))
+                    return
+
+                layout = None
+                if config.generator == client.game_pool.generator and config.seed is None:
+                    layout = client.game_pool.take(config.height, config.width, num_players)
+
+                try:
+                    game = Game(dict_copy, width=config.width, height=config.height, lineOfSight=config.line_of_sight,
+                                generator=config.generator, seed=config.seed, layout=layout, visionRadius=config.vision_radius,
+                                teamVision=config.team_vision)
+                except (ValueError, AssertionError) as e:
+                    # The lobby stays open, its players can try another configuration
+                    client.memory.forget_lobby(lobby_name)
+                    publish_error_to_lobby(client, lobby_name, f"Could not create the game: {e}")
+                    return
+                client.memory.audit(lobby_name, lambda: Game(dict_copy, width=config.width, height=config.height, lineOfSight=config.line_of_sight,
+                                                             generator=config.generator, seed=game.seed, visionRadius=config.vision_radius,
+                                                             teamVision=config.team_vision))
                 client.game_dict[lobby_name] = game
                 client.move_dict[lobby_name] = OrderedDict()
+                client.plan_dict[lobby_name] = {}
+                client.tick_dict[lobby_name] = 0
                 client.team_dict[lobby_name]["started"] = True
 
-                for player in game.all_players.keys():
-                    client.publish(f'games/{lobby_name}/{player}/game_state', json.dumps(game.getGameData(player)))
+                # Let the clients know what they are playing on before the first game state
+                client.publish(f'games/{lobby_name}/config', json.dumps({'width': config.width,
+                                                                         'height': config.height,
+                                                                         'visionRadius': config.vision_radius,
+                                                                         'lineOfSight': config.line_of_sight,
+                                                                         'teamVision': config.team_vision,
+                                                                         'generator': config.generator,
+                                                                         'seed': game.seed}))
+
+                client.publisher.submit(lobby_name, game, list(game.all_players.keys()))
+    elif command == "STOP":
+        publish_to_lobby(client, lobby_name, "Game Over: Game has been stopped")
+        remove_lobby(client, lobby_name)
 
 
-                print(game.map)
-    elif isinstance(msg_payload, bytes) and msg_payload.decode() == "STOP":
-        publish_to_lobby(client, lobby_name, "Game Over: Game has been stopped")
+def wake_lobby(client, lobby_name):
+    """
+        Records activity of the lobby, reviving it first if it is hibernated
+    """
+    if lobby_name in client.hibernator.hibernated:
+        record, game = client.hibernator.load(lobby_name)
+        client.team_dict[lobby_name] = record['team_dict']
+        if game is not None:
+            if client.memory.admit(lobby_name, game.map.height, game.map.width, len(game.all_players), len(game.teams), game.visionRadius) is not None:
+                print(f"Lobby {lobby_name} revived over the memory budget")
+            client.game_dict[lobby_name] = game
+            client.tick_dict[lobby_name] = record['ticks']
+            client.move_dict[lobby_name] = OrderedDict((player, payload.encode('latin-1')) for player, payload in record['moves'])
+            client.plan_dict[lobby_name] = {player: deque(Moveset[move] for move in plan) for player, plan in record.get('plans', {}).items()}
+        print(f"Revived lobby {lobby_name} in {client.hibernator.reviveLatencies[-1] * 1000:.1f} ms")
+    elif lobby_name in client.team_dict:
+        client.hibernator.touch(lobby_name)
+
+
+def hibernate_lobby(client, lobby_name):
+    """
+        Moves an idle lobby to disk, wake_lobby brings it back
+    """
+    with client.state_lock:
+        if lobby_name not in client.team_dict:
+            # Activity of a lobby that doesn't exist
+            client.hibernator.forget(lobby_name)
+            client.admission.forget_lobby(lobby_name)
+            return
+        if lobby_name in client.profiler.active:
+            return
+        if client.supervisor is not None and lobby_name in client.supervisor.workers:
+            return
+        if client.publisher.pending(lobby_name):
+            # Ticks still being played, the next sweep tries again
+            return
+        game = client.game_dict.get(lobby_name)
+        record = {'team_dict': client.team_dict[lobby_name],
+                  'ticks': client.tick_dict.get(lobby_name, 0),
+                  'moves': [(player, payload.decode('latin-1')) for player, payload in client.move_dict.get(lobby_name, {}).items()],
+                  'plans': {player: [move.name for move in plan] for player, plan in client.plan_dict.get(lobby_name, {}).items()}}
+        size = client.hibernator.store(lobby_name, record, game)
+
         client.team_dict.pop(lobby_name, None)
         client.move_dict.pop(lobby_name, None)
+        client.plan_dict.pop(lobby_name, None)
+        client.correlation_dict.pop(lobby_name, None)
         client.game_dict.pop(lobby_name, None)
+        client.tick_dict.pop(lobby_name, None)
+        client.admission.forget_lobby(lobby_name)
+        client.publisher.forget_lobby(lobby_name)
+        client.memory.forget_lobby(lobby_name)
+    print(f"Hibernated lobby {lobby_name} in {size} bytes")
+
+
+def hibernate_idle_lobbies(client):
+    """
+        Hibernates the lobbies idle for longer than the hibernator's idleSeconds, forever, run on its own thread
+    """
+    interval = min(client.hibernator.idleSeconds / 4, 5.0)
+    while True:
+        time.sleep(interval)
+        for lobby_name in client.hibernator.idle():
+            try:
+                hibernate_lobby(client, lobby_name)
+            except Exception as e:
+                print(f"Failed to hibernate lobby {lobby_name}: {e}")
+        with client.state_lock:
+            # Rate limits of lobbies that are gone
+            for lobby_name in client.admission.lobbies() - set(client.team_dict) - set(client.hibernator.hibernated):
+                client.admission.forget_lobby(lobby_name)
+
+
+def remove_lobby(client, lobby_name):
+    client.hibernator.forget(lobby_name)
+    client.team_dict.pop(lobby_name, None)
+    client.move_dict.pop(lobby_name, None)
+    client.plan_dict.pop(lobby_name, None)
+    client.correlation_dict.pop(lobby_name, None)
+    game = client.game_dict.pop(lobby_name, None)
+    client.tick_dict.pop(lobby_name, None)
+    client.admission.forget_lobby(lobby_name)
+    client.publisher.forget_lobby(lobby_name)
+    client.memory.forget_lobby(lobby_name)
+    if game is not None:
+        game.close()
+    # The game ended before the requested number of ticks
+    client.profiler.finish(lobby_name)
+    if client.supervisor is not None:
+        client.supervisor.stop(lobby_name)
+
+
+# Dispatched function: serves the cached leaderboard aggregates
+def query_leaderboard(client, topic_list, msg_payload):
+    try:
+        query = LeaderboardQuery(**json.loads(msg_payload)) if msg_payload else LeaderboardQuery()
+    except (ValueError, TypeError):
+        print("ValidationError in query_leaderboard")
+        return
+
+    client.publish('leaderboard/results', json.dumps(client.leaderboard.query(query.by, query.top)))
 
 
 def publish_error_to_lobby(client, lobby_name, error):
@@ -176,10 +640,94 @@ def publish_to_lobby(client, lobby_name, msg):
     client.publish(f"games/{lobby_name}/lobby", msg)
 
 
+# Admin function: profiles the next ticks of a lobby
+def profile_lobby(client, topic_list, msg_payload):
+    if len(topic_list) != 3:
+        return
+    try:
+        request = ProfileRequest(**json.loads(msg_payload)) if msg_payload else ProfileRequest()
+    except (ValueError, TypeError):
+        print("ValidationError in profile_lobby")
+        return
+
+    lobby_name = topic_list[2]
+    if client.supervisor is not None and client.supervisor.pool is None and lobby_name in client.supervisor.workers:
+        # The game runs in a worker process, which this profiler can't see into
+        client.publish(f'admin/profile/{lobby_name}/summary', json.dumps({'lobby': lobby_name, 'error': 'The lobby runs in a worker process'}))
+        return
+    client.profiler.start(lobby_name, request.ticks, request.mode,
+                          on_finished=lambda summary: client.publish(f'admin/profile/{lobby_name}/summary', json.dumps(summary)))
+    print(f'Profiling the next {request.ticks} ticks of {lobby_name} ({request.mode})')
+
+
+# Admin function: reports the approximate memory of every running lobby
+def report_metrics(client, topic_list, msg_payload):
+    if len(topic_list) != 2:
+        return
+    lobbies = {}
+    for lobby_name, game in list(client.game_dict.items()):
+        lobbies[lobby_name] = {'estimate': client.memory.measure(game, client.move_dict.get(lobby_name, {}), client.publisher.pending(lobby_name))}
+        if lobby_name in client.memory.audited:
+            lobbies[lobby_name]['audited'] = client.memory.audited[lobby_name]
+    client.publish('admin/metrics/report', json.dumps({'memory': {'lobbies': lobbies,
+                                                                  'total': sum(lobby['estimate'] for lobby in lobbies.values()),
+                                                                  'reserved': sum(client.memory.reserved.values()),
+                                                                  'lobbyBudget': client.memory.lobby_budget,
+                                                                  'totalBudget': client.memory.total_budget},
+                                                       'hibernation': client.hibernator.stats(),
+                                                       'matchmaking': client.matchmaker.stats()}))
+
+
+def init_client(client, leaderboard=None, game_pool=None, memory=None, publisher=None, tracer=None, profiler=None):
+    """
+        Attaches the state and components of the game server to a paho client
+        :param leaderboard: where finished games are recorded, a Leaderboard on LEADERBOARD_PATH by default
+        :param game_pool: source of pre-generated layouts, a GamePool of GAME_POOL_DEPTH layouts for GAME_POOL_KEYS sizes by default
+        :param memory: memory accountant, a MemoryAccountant with the LOBBY_MEMORY_BUDGET and MEMORY_BUDGET budgets by default
+        :param publisher: pipeline publishing the game states, a PublishPipeline of PUBLISH_WORKERS threads on the client by default
+        :param tracer: where the spans of every tick are recorded, a Tracer writing to TRACE_FILE by default, off if it isn't set
+    """
+    # custom dictionary to track players
+    client.team_dict = {} # Keeps tracks of players before a game starts {'lobby_name' : {'team_name' : [player_name, ...]}}
+    client.game_dict = {} # Keeps track of the games {{'lobby_name' : Game Object}
+    client.move_dict = {} # Keeps track of the raw pending moves {'lobby_name' : {'player_name' : payload}}
+    client.plan_dict = {} # Remaining steps of the players' move plans {'lobby_name' : {'player_name' : deque of Moveset}}
+    client.admission = AdmissionController() # Rate limits inbound messages per player and per lobby
+    client.tick_dict = {} # Number of resolved ticks of every running game {'lobby_name' : ticks}
+    client.leaderboard = leaderboard if leaderboard is not None else Leaderboard(os.environ.get('LEADERBOARD_PATH', 'leaderboard.db'), int(os.environ.get('LEADERBOARD_WINDOW', 100))) # Results of finished games
+    client.memory = memory if memory is not None else MemoryAccountant(int(os.environ.get('LOBBY_MEMORY_BUDGET', 8 * 2**20)),
+                                                                        int(os.environ['MEMORY_BUDGET']) if 'MEMORY_BUDGET' in os.environ else None,
+                                                                        audit=os.environ.get('MEMORY_AUDIT') == '1') # Approximate memory per lobby and its budgets
+    client.profiler = profiler if profiler is not None else LobbyProfiler(os.environ.get('PROFILE_DIR', 'profiles')) # Profiles single lobbies on request
+    client.tracer = tracer if tracer is not None else Tracer(os.environ.get('TRACE_FILE')) # Timeline of every tick, e.g. TRACE_FILE=traces/server-{pid}.json
+    client.correlation_id = None # Correlation id of the message being handled
+    client.correlation_dict = {} # Correlation ids of the moves and plans of the current tick {'lobby_name' : {'player_name' : id}}
+    client.publisher = publisher if publisher is not None else PublishPipeline(client, workers=int(os.environ.get('PUBLISH_WORKERS', 4)), profiler=client.profiler, tracer=client.tracer) # Serializes and publishes game states off the network thread
+    client.game_pool = game_pool if game_pool is not None else GamePool(depth=int(os.environ.get('GAME_POOL_DEPTH', 4)), maxKeys=int(os.environ.get('GAME_POOL_KEYS', 8))) # Pre-generated map layouts for instant starts
+    client.supervisor = None # LobbySupervisor when lobbies run in worker processes
+    client.hibernator = LobbyHibernator(os.environ.get('HIBERNATE_DIR', 'hibernated'), float(os.environ.get('HIBERNATE_AFTER', 300))) # Idle lobbies on disk
+    client.state_lock = threading.RLock() # Held while handling a message or hibernating a lobby
+    client.matchmaker = Matchmaker(int(os.environ.get('MATCH_LOBBY_SIZE', 4)), int(os.environ.get('MATCH_TEAMS', 2)),
+                                   float(os.environ.get('MATCH_MAX_WAIT', 10)), float(os.environ.get('MATCH_START_DELAY', 1))) # Queue of players waiting to be put in a lobby
+    client.matchmaking_interval = float(os.environ.get('MATCH_INTERVAL', 0.5)) # Seconds between two batches of the queue
+    client.match_config = os.environ.get('MATCH_CONFIG', 'START') # Start payload of matched lobbies, plain START or a JSON lobby configuration
+    client.match_start = parse_match_config(client.match_config, client.matchmaker.lobbySize) # Fails at startup rather than in the matchmaking thread
+    client.plan_interval = float(os.environ.get('PLAN_TICK_INTERVAL', 0.25)) # Seconds between two steps of the move plans
+
+
 dispatch = {
     'new_game' : add_player,
     'move' : player_move,
+    'plan' : player_plan,
     'start' : start_game,
+    'query' : query_leaderboard,
+    'join' : join_queue,
+    'leave' : leave_queue,
+}
+
+admin_dispatch = {
+    'profile' : profile_lobby,
+    'metrics' : report_metrics,
 }
 
 
@@ -205,13 +753,36 @@ if __name__ == '__main__':
     client.on_message = on_message
     # client.on_publish = on_publish # Can comment out to not print when publishing to topics
     
-    # custom dictionary to track players
-    client.team_dict = {} # Keeps tracks of players before a game starts {'lobby_name' : {'team_name' : [player_name, ...]}}
-    client.game_dict = {} # Keeps track of the games {{'lobby_name' : Game Object}
-    client.move_dict = {} # Keeps track of the games {{'lobby_name' : Game Object}
+    # attach the server's state to the client
+    init_client(client)
+    if os.environ.get('LOBBY_WORKERS') == '1':
+        # Run every started lobby in its own worker process
+        from GameInstanceManger import LobbySupervisor
+        client.supervisor = LobbySupervisor(client)
+    elif os.environ.get('LOBBY_WORKERS') == 'thread':
+        # Run every started lobby on its own thread, all sharing a few broker connections
+        from GameInstanceManger import LobbySupervisor
+        from connectionPool import BrokerConnectionPool
+        pool = BrokerConnectionPool(int(os.environ.get('CONNECTION_POOL_SIZE', 4)))
+        pool.start(broker_address, broker_port)
+        client.supervisor = LobbySupervisor(client, pool=pool)
+
+    if float(os.environ.get('HIBERNATE_AFTER', 300)) > 0:
+        threading.Thread(target=hibernate_idle_lobbies, args=(client,), name='Hibernation', daemon=True).start()
+    threading.Thread(target=run_matchmaking, args=(client,), name='Matchmaking', daemon=True).start()
+    threading.Thread(target=run_plan_ticks, args=(client,), name='PlanTicks', daemon=True).start()
 
     client.subscribe("new_game")
     client.subscribe('games/+/start')
     client.subscribe('games/+/+/move')
-
-    client.loop_forever()
+    client.subscribe('games/+/+/plan')
+    client.subscribe('leaderboard/query')
+    client.subscribe('matchmaking/join')
+    client.subscribe('matchmaking/leave')
+    client.subscribe('admin/profile/+')
+    client.subscribe('admin/metrics')
+
+    # The network loop runs on paho's own thread, the pipeline workers hand it their packets and it writes whatever
+    # has queued up since its last write, so the publishes of a tick go out together
+    client.loop_start()
+    threading.Event().wait()
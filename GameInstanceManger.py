@@ -1,64 +1,258 @@
 import os
+import sys
 import json
+import queue
+import threading
+import time
+import multiprocessing
 
 import paho.mqtt.client as paho
 from paho import mqtt
 from dotenv import load_dotenv
-from pydantic import ValidationError
 
-from InputTypes import NewPlayer, Move
-from game import Game
+import GameClient
+from gamePool import GamePool
+from memory import MemoryAccountant
+from publisher import PublishPipeline
 
 
-# Global Variables
-load_dotenv(dotenv_path='./credentials.env')
+class _ControlLeaderboard:
+    """
+    Stands in for the Leaderboard inside a worker, results are sent to the supervisor which records them
+    """
+    def __init__(self, control):
+        self.control = control
 
-broker_address = os.environ.get('BROKER_ADDRESS')
-broker_port = int(os.environ.get('BROKER_PORT'))
-username = os.environ.get('USERNAME')
-password = os.environ.get('PASSWORD')
+    def record(self, lobby_name, roster, scores, ticks, coins=None):
+        if self.control is not None:
+            self.control.put(('result', lobby_name, roster, scores, ticks, coins))
 
 
-def on_message(self, client, userdata, msg):
+class GameInstanceManager():
+    INBOX_SIZE = 256
+
+    def __init__(self, lobby_name: str, team_dict: dict[str,list[str]], start_payload: str = "START", control=None,
+                 pool=None, components: dict = None, done: threading.Event = None):
+        """
+        Creates a new client to handle each game
+        :param lobby_name: the lobby this instance runs
+        :param team_dict: {'team_name' : [player_name, ...]}
+        :param start_payload: the start message of the lobby, plain START or a JSON lobby configuration
+        :param control: queue the supervisor listens to, None when running on its own
+        :param pool: BrokerConnectionPool to share instead of opening a connection of its own
+        :param components: components shared with other instances, passed on to GameClient.init_client
+        :param done: event ending the instance when set, e.g. by the supervisor
         """
-        Prints a mqtt message to stdout ( used as callback for subscribe )
-        :param client: the client itself
+        load_dotenv(dotenv_path='./credentials.env')
+        self.lobby_name = lobby_name
+        self.start_payload = start_payload
+        self.control = control
+        self.pool = pool
+        self.subscribed = threading.Event()
+        self.done = done if done is not None else threading.Event()
+        # Messages waiting for the lobby's own thread, the network threads only put them here
+        self.inbox: queue.Queue = queue.Queue(maxsize=GameInstanceManager.INBOX_SIZE)
+        topics = [f"games/{lobby_name}/{player}/{route}" for players in team_dict.values() for player in players
+                  for route in ('move', 'plan')]
+
+        if pool is None:
+            # initialize new client
+            self.client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id=f'GameInstance-{lobby_name}', userdata=None, protocol=paho.MQTTv5)
+            # enable TLS for secure connection
+            self.client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
+            # set username and password
+            self.client.username_pw_set(os.environ.get('USER_NAME'), os.environ.get('PASSWORD'))
+        else:
+            # Publishes through the pool's connections
+            self.client = pool.endpoint(f'games/{lobby_name}/')
+
+        # The lobby is run by the same handlers as GameClient, the supervisor already checked its budgets
+        components = dict(components or {})
+        if 'game_pool' not in components:
+            components['game_pool'] = GamePool(depth=0)
+        if 'memory' not in components:
+            components['memory'] = MemoryAccountant(sys.maxsize)
+        GameClient.init_client(self.client, leaderboard=_ControlLeaderboard(control), **components)
+        self.client.team_dict[lobby_name] = {'started': False}
+        self.client.team_dict[lobby_name].update({team: list(players) for team, players in team_dict.items()})
+
+        if pool is None:
+            # handles subscription
+            self.client.on_message = self.on_message
+            self.client.on_subscribe = self.on_subscribe
+
+            # connect to HiveMQ Cloud on port 8883 (default for MQTT)
+            self.client.connect(os.environ.get('BROKER_ADDRESS'), int(os.environ.get('BROKER_PORT')))
+
+            # subscribes to player movement topics, all in one request
+            self.client.subscribe([(topic, 0) for topic in topics])
+        else:
+            # subscribed in the pool's next batch, together with the other lobbies
+            pool.register(self.client.prefix, self.on_message, topics, on_subscribed=self.subscribed.set)
+
+    def on_message(self, client, userdata, msg):
+        """
+        Hands the message to the lobby's thread, which runs it through GameClient's dispatch in wait
+        :param client: the client itself, or the pool's connection the message came from
         :param userdata: userdata is set when initiating the client, here it is userdata=None
         :param msg: the message with topic and payload
         """
-        pass
+        try:
+            self.inbox.put_nowait(msg)
+        except queue.Full:
+            # The lobby is behind, its players are sending faster than it plays
+            self.client.admission.dropped += 1
 
+    def on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        self.subscribed.set()
 
-class GameInstanceManager():
-    def __init__(self, lobby_name: str, team_dict: dict[str,list[str]]):
+    def start(self):
         """
-        Creates a new client to handle each game
+        Starts the game once the move topics are subscribed, so no early move is lost
         """
-        # initialize new client
-        self.client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id=lobby_name, userdata=None, protocol=paho.MQTTv5)
-        # enable TLS for secure connection
-        self.client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
-        # set username and password
-        self.client.username_pw_set(username, password)
-        # connect to HiveMQ Cloud on port 8883 (default for MQTT)
-        self.client.connect(broker_address, broker_port)
-        # handles subscription
-        self.client.on_message = self.on_message
-
-        # subscribes to player movement topics
-        for team in team_dict.keys():
-             for player in team_dict[team]:  
-                self.client.subscribe(f"games/{lobby_name}/{player}/move")
+        if self.pool is None:
+            self.client.loop_start()
+        self.subscribed.wait(timeout=10)
+        GameClient.start_game(self.client, ['games', self.lobby_name, 'start'], self.start_payload.encode())
+        if self.lobby_name not in self.client.game_dict:
+            # The configuration was refused, the error is already published
+            self.done.set()
+        elif self.control is not None:
+            self.control.put(('started', self.lobby_name, os.getpid()))
 
-    def start(self):
-        self.client.loop_start()
+    def wait(self):
+        """
+        Runs the lobby's messages and the steps of its plans until the game is over and everything has been published
+        """
+        deadline = time.monotonic() + self.client.plan_interval
+        while not self.done.is_set():
+            try:
+                GameClient.on_message(self.client, None, self.inbox.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.client.plan_interval
+                GameClient.step_plans(self.client)
+            # The last tick is resolved by the publish pipeline, the game may end without another message coming in
+            if self.lobby_name not in self.client.game_dict:
+                break
+        if self.pool is not None:
+            self.pool.unregister(self.client.prefix)
+        self.client.publisher.flush(self.lobby_name)
 
     def __del__(self):
-        self.client.loop_stop()
-        self.client.disconnect()
+        if self.pool is None:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+
+def run_lobby_worker(lobby_name: str, team_dict: dict[str,list[str]], start_payload: str, control,
+                     pool=None, components: dict = None, done: threading.Event = None):
+    """
+    Entry point of a worker process or thread, runs one game from start to game over
+    """
+    manager = GameInstanceManager(lobby_name, team_dict, start_payload, control, pool, components, done)
+    manager.start()
+    manager.wait()
+    control.put(('done', lobby_name))
+
+
+class LobbySupervisor:
+    MAX_RESTARTS = 3
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, client, pool=None):
+        """
+        Runs every started lobby of a GameClient in its own process and restarts the ones that crash.
+        Workers report back on a control queue, read by a watcher thread.
+        :param client: the GameClient paho client
+        :param pool: BrokerConnectionPool to run the lobbies on threads of this process instead, sharing its connections
+        """
+        self.client = client
+        self.pool = pool
+        if pool is None:
+            self.context = multiprocessing.get_context('spawn')
+            self.control = self.context.Queue()
+        else:
+            self.control = queue.Queue()
+            # Components every lobby thread shares, rather than starting threads of their own per lobby
+            # The profiler too, so admin/profile reaches the lobby threads and their publish workers
+            self.components = {'game_pool': GamePool(depth=0), 'memory': MemoryAccountant(sys.maxsize), 'tracer': client.tracer,
+                               'profiler': client.profiler,
+                               'publisher': PublishPipeline(pool, workers=int(os.environ.get('PUBLISH_WORKERS', 4)),
+                                                            profiler=client.profiler, tracer=client.tracer)}
+        self.workers: dict[str, dict] = {} # {'lobby_name' : {'process', 'team_dict', 'start_payload', 'restarts', 'done'}}
+        self.finished: list[str] = [] # lobbies whose worker is done, removed by GameClient on its own thread
+        self.__lock = threading.Lock()
+        threading.Thread(target=self.__watch, name='LobbySupervisor', daemon=True).start()
+
+    def spawn(self, lobby_name: str, team_dict: dict[str,list[str]], start_payload: str, restarts: int = 0):
+        done = None
+        if self.pool is None:
+            process = self.context.Process(target=run_lobby_worker, args=(lobby_name, team_dict, start_payload, self.control),
+                                           name=f'GameInstance-{lobby_name}', daemon=True)
+        else:
+            done = threading.Event()
+            process = threading.Thread(target=run_lobby_worker, args=(lobby_name, team_dict, start_payload, self.control,
+                                                                      self.pool, self.components, done),
+                                       name=f'GameInstance-{lobby_name}', daemon=True)
+        process.start()
+        with self.__lock:
+            self.workers[lobby_name] = {'process': process, 'team_dict': team_dict, 'start_payload': start_payload, 'restarts': restarts, 'done': done}
+
+    def stop(self, lobby_name: str):
+        with self.__lock:
+            worker = self.workers.pop(lobby_name, None)
+        if worker is not None and worker['process'].is_alive():
+            if worker['done'] is not None:
+                # Threads can't be terminated, the lobby's thread ends itself
+                worker['done'].set()
+            else:
+                worker['process'].terminate()
+
+    def pop_finished(self) -> list[str]:
+        with self.__lock:
+            finished, self.finished = self.finished, []
+        return finished
+
+    def __finish(self, lobby_name: str):
+        with self.__lock:
+            if self.workers.pop(lobby_name, None) is not None:
+                self.finished.append(lobby_name)
+
+    def __watch(self):
+        while True:
+            try:
+                message = self.control.get(timeout=LobbySupervisor.POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+
+            if message is not None:
+                kind, lobby_name = message[0], message[1]
+                if kind == 'result':
+                    self.client.leaderboard.record(*message[1:])
+                elif kind == 'done':
+                    self.__finish(lobby_name)
+                elif kind == 'started':
+                    print(f'Lobby {lobby_name} running in process {message[2]}' if self.pool is None else f'Lobby {lobby_name} running on the connection pool')
 
+            # Restart the workers that died without finishing their game
+            with self.__lock:
+                crashed = [(lobby_name, worker) for lobby_name, worker in self.workers.items() if not worker['process'].is_alive()]
+            for lobby_name, worker in crashed:
+                if not self.control.empty():
+                    # Its last reports may still be queued
+                    break
+                if worker['restarts'] < LobbySupervisor.MAX_RESTARTS:
+                    GameClient.publish_error_to_lobby(self.client, lobby_name, "Game worker crashed, the game has been restarted")
+                    self.spawn(lobby_name, worker['team_dict'], worker['start_payload'], worker['restarts'] + 1)
+                else:
+                    GameClient.publish_to_lobby(self.client, lobby_name, "Game Over: Game worker crashed")
+                    self.__finish(lobby_name)
 
-    
 
 if __name__ == "__main__":
-    game = GameInstanceManager()
+    # python GameInstanceManger.py <lobby_name> '{"team_name": ["player_name", ...]}' [start payload]
+    game = GameInstanceManager(sys.argv[1], json.loads(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else "START")
+    game.start()
+    game.wait()
@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic import BaseModel, Field
 
 class NewPlayer(BaseModel):
@@ -5,8 +7,31 @@ class NewPlayer(BaseModel):
     team_name: str = Field(..., min_length=1, max_length=20)
     player_name: str = Field(..., min_length=1, max_length=20)
 
+class QueueJoin(BaseModel):
+    player_name: str = Field(..., min_length=1, max_length=20)
+    team_name: Optional[str] = Field(None, min_length=1, max_length=20)
+
 class Move(BaseModel):
     move: str = Field(..., pattern=r'^(UP|DOWN|LEFT|RIGHT)$')
 
+class MovePlan(BaseModel):
+    moves: list[Literal['UP', 'DOWN', 'LEFT', 'RIGHT']] = Field(..., min_length=1, max_length=32)
+
 class Start(BaseModel):
-    start: str = Field(..., pattern=r'^(START)$')
\ No newline at end of file
+    start: str = Field(..., pattern=r'^(START)$')
+    width: int = Field(10, ge=3, le=100)
+    height: int = Field(10, ge=3, le=100)
+    vision_radius: int = Field(2, ge=0, le=10)
+    line_of_sight: bool = False
+    team_vision: bool = False
+    generator: str = Field('lattice', pattern=r'^(lattice|maze|rooms|openField)$')
+    seed: Optional[int] = Field(None, ge=0)
+
+class LeaderboardQuery(BaseModel):
+    by: str = Field('winRate', pattern=r'^(winRate|averageScore|scorePerTick|coinsPerTick|games)$')
+    top: int = Field(10, ge=1, le=100)
+
+
+class ProfileRequest(BaseModel):
+    ticks: int = Field(10, ge=1, le=1000)
+    mode: str = Field('deterministic', pattern=r'^(deterministic|sampling)$')
\ No newline at end of file
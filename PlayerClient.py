@@ -1,14 +1,27 @@
 import os
 import json
-from dotenv import load_dotenv
+import time
+import threading
 
-import paho.mqtt.client as paho
+from lazyImport import lazyImport # Heavy modules load on first use, so bots start fast
+load_dotenv = lazyImport('dotenv', 'load_dotenv')
+paho = lazyImport('paho.mqtt.client')
 from paho import mqtt
-import time
 
-from colorama import Fore # For colored output
+Fore = lazyImport('colorama', 'Fore') # For colored output
+
+WorldModel = lazyImport('worldModel', 'WorldModel') # NumPy loads with the first game state
 
 game_over = False
+world_models = {} # WorldModel of every player, keyed by their game_state topic
+lobby_config = {'height': 10, 'width': 10, 'visionRadius': 2, 'lineOfSight': False, 'teamVision': False} # Updated from the lobby's config topic when the game starts
+models_lock = threading.Lock() # The world models are updated by the network thread and predicted on by the input loop
+assignment = {} # Lobby and teams the matchmaker put the player in, set MATCHMAKING=1 to join the queue
+assigned = threading.Event()
+
+# Keys accepted for every direction, the words or the arrow keys
+KEY_DIRECTIONS = {'UP': 'UP', '\x1b[A': 'UP', 'DOWN': 'DOWN', '\x1b[B': 'DOWN',
+                  'RIGHT': 'RIGHT', '\x1b[C': 'RIGHT', 'LEFT': 'LEFT', '\x1b[D': 'LEFT'}
 
 # setting callbacks for different events to see if it works, print the message etc.
 def on_connect(client, userdata, flags, rc, properties=None):
@@ -68,64 +81,52 @@ def on_message(client, userdata, msg):
             print(f"Invalid JSON: {msg.payload}")
         return
 
+    if msg.topic.startswith('matchmaking/assignments/'):
+        # The matchmaker put the player into a lobby, the server starts it shortly
+        assignment.update(game_state)
+        assigned.set()
+        print(Fore.WHITE + f"Matched into lobby {game_state['lobby_name']}: {game_state['teams']}")
+        return
+
+    if msg.topic.endswith('/config'):
+        # A new game is starting, size the world models for its board
+        lobby_config.update(game_state)
+        with models_lock:
+            world_models.clear()
+        print(Fore.WHITE + 'Lobby configuration: ' + str(game_state))
+        return
+
+    if '/team/' in msg.topic:
+        # Team vision, one observation for the whole team arrives before the positions of its players.
+        # Every player merges it into a model of their own, so each can be located and predicted on separately
+        lobby_name = msg.topic.split('/')[1]
+        with models_lock:
+            for name in game_state['teammateNames']:
+                topic = f'games/{lobby_name}/{name}/game_state'
+                if topic not in world_models:
+                    world_models[topic] = WorldModel(lobby_config['height'], lobby_config['width'], lobby_config['visionRadius'], lobby_config['lineOfSight'])
+                world_models[topic].update_team(game_state)
+        return
+
     if 'currentPosition' in game_state:
-        current_position = game_state['currentPosition']
-        # print(Fore.GREEN + 'Current Position: ' + str(current_position))
-
-        walls = game_state.get('walls', [])
-        # print(Fore.BLUE + 'Walls: ' + str(walls))
-        coins = {
-            'Coin1': game_state.get('coin1', []),
-            'Coin2': game_state.get('coin2', []),
-            'Coin3': game_state.get('coin3', []),
-        }
-        # print(Fore.YELLOW + 'Coins: ' + str(coins))
-
-        teammate_positions = game_state.get('teammatePositions', [])
-        # print(Fore.CYAN + 'Teammate Positions: ' + str(teammate_positions))
-
-        enemy_positions = game_state.get('enemyPositions', [])
-        # print(Fore.RED + 'Enemy Positions: ' + str(enemy_positions))
-
-        player_view = [['None' for _ in range(5)] for _ in range(5)]  # creates 5x5 square of Nones
-
-        # Calculating the starting row and column for the view
-        start_row, start_col = [pos - 2 for pos in current_position]
-
-        # Update the player's view based on their current position
-        update_player_view(player_view, current_position, start_row, start_col)
-
-        # Update the player's view with walls, coins, teammates, and enemies
-        for wall in walls:
-            update_view(player_view, wall, start_row, start_col, 'Wall')
-        for coin_type, coin_positions in coins.items():
-            for coin in coin_positions:
-                update_view(player_view, coin, start_row, start_col, coin_type)
-        for teammate in teammate_positions:
-            update_view(player_view, teammate, start_row, start_col, 'Teammate')
-        for enemy in enemy_positions:
-            update_view(player_view, enemy, start_row, start_col, 'Enemy')
-
-        # Print the topic which contains player name in it
-        print()
-        print(Fore.WHITE + msg.topic)
-
-        #displays the 5x5 grid with colors
-        for row in player_view:
-            for item in row:
-                if item == 'Player':
-                    print(Fore.GREEN + '{:<10}'.format(item), end='')
-                elif item == 'Wall':
-                    print(Fore.BLUE + '{:<10}'.format(item), end='')
-                elif item.startswith('Coin'):
-                    print(Fore.YELLOW + '{:<10}'.format(item), end='')
-                elif item == 'Teammate':
-                    print(Fore.CYAN + '{:<10}'.format(item), end='')
-                elif item == 'Enemy':
-                    print(Fore.RED + '{:<10}'.format(item), end='')
-                else:
-                    print(Fore.WHITE + '{:<10}'.format(item), end='')
-            print()
+        with models_lock:
+            if lobby_config['teamVision']:
+                # Team vision, look at the team's view from the player's position
+                world_model = world_models[msg.topic]
+                mispredictions = world_model.mispredictions
+                world_model.locate(game_state['currentPosition'])
+            else:
+                # Merge the observation into the player's world model and look at the window around them
+                if msg.topic not in world_models:
+                    world_models[msg.topic] = WorldModel(lobby_config['height'], lobby_config['width'], lobby_config['visionRadius'], lobby_config['lineOfSight'])
+                world_model = world_models[msg.topic]
+                mispredictions = world_model.mispredictions
+                world_model.update(game_state)
+            player_view = world_model.view()
+
+        if world_model.mispredictions != mispredictions:
+            print(Fore.RED + f'Prediction corrected by the server ({world_model.mispredictions}/{world_model.predictions} mispredicted)')
+        print_view(msg.topic, player_view)
        
     else:
         print(Fore.WHITE + 'Scores: ' + str(game_state))
@@ -134,41 +135,45 @@ def on_message(client, userdata, msg):
     # print(Fore.WHITE + "message: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
 
 
-def update_player_view(view, position, start_row, start_col):
-    '''adds '.' for positions in view that do not exist. For when player is on the edge of the game board'''
-    x, y = position
-    if y > 7:
-        for val in range(5):
-            view[val][4] = '.'
-        if y > 8:
-            for val in range(5):
-                view[val][3] = '.'
-    if y < 2:
-        for val in range(5):
-            view[val][0] = '.'
-        if y < 1:
-            for val in range(5):
-                view[val][1] = '.'
-    if x > 7:
-        for val in range(5):
-            view[4][val] = '.'
-        if x > 8:
-            for val in range(5):
-                view[3][val] = '.'
-    if x < 2:
-        for val in range(5):
-            view[0][val] = '.'
-        if x < 1:
-            for val in range(5):
-                view[1][val] = '.'
-    view[position[0] - start_row][position[1] - start_col] = 'Player' #adds player to center of view
-
-
-def update_view(view, position, start_row, start_col, item):
-    try:
-        view[position[0] - start_row][position[1] - start_col] = item
-    except IndexError:
-        pass  # Ignore positions outside of the player's view
+def predict(lobby_name, player_name, direction):
+    """
+    Shows the player's move right away instead of after the server's game_state, which then reconciles it
+    """
+    topic = f'games/{lobby_name}/{player_name}/game_state'
+    with models_lock:
+        world_model = world_models.get(topic)
+        if world_model is None or world_model.position is None:
+            return
+        world_model.predict_move(direction)
+        player_view = world_model.view()
+    print_view(topic + ' (predicted)', player_view)
+    print(Fore.WHITE)
+
+
+def print_view(topic, player_view):
+    """
+    Prints the window around the player with colors
+    """
+    # Print the topic which contains player name in it
+    print()
+    print(Fore.WHITE + topic)
+
+    #displays the 5x5 grid with colors
+    for row in player_view:
+        for item in row:
+            if item == 'Player':
+                print(Fore.GREEN + '{:<10}'.format(item), end='')
+            elif item == 'Wall':
+                print(Fore.BLUE + '{:<10}'.format(item), end='')
+            elif item.startswith('Coin'):
+                print(Fore.YELLOW + '{:<10}'.format(item), end='')
+            elif item == 'Teammate':
+                print(Fore.CYAN + '{:<10}'.format(item), end='')
+            elif item == 'Enemy':
+                print(Fore.RED + '{:<10}'.format(item), end='')
+            else:
+                print(Fore.WHITE + '{:<10}'.format(item), end='')
+        print()
 
 
 if __name__ == '__main__':
@@ -197,60 +202,80 @@ if __name__ == '__main__':
     # players = ['Player1', 'Player2', 'Player3', 'Player4']
     players = ['Player1']
 
+    # Let the matchmaker find a lobby instead of creating one, set MATCHMAKING=1 to enable
+    matchmaking = os.environ.get('MATCHMAKING') == '1'
+    if matchmaking:
+        # Subscribed before joining, the assignment is only published once
+        client.subscribe(f'matchmaking/assignments/{players[0]}', qos=1)
+        client.loop_start()
+        time.sleep(1)
+        client.publish('matchmaking/join', json.dumps({'player_name': players[0]}), qos=1)
+        print(Fore.WHITE + 'Waiting for the matchmaker...')
+        assigned.wait()
+        lobby_name = assignment['lobby_name']
+
     client.subscribe(f"games/{lobby_name}/lobby")
     client.subscribe(f'games/{lobby_name}/+/game_state')
+    client.subscribe(f'games/{lobby_name}/team/+/game_state')
     client.subscribe(f'games/{lobby_name}/scores')
+    client.subscribe(f'games/{lobby_name}/config')
 
-    client.publish("new_game", json.dumps({'lobby_name':lobby_name,
-                                            'team_name':'ATeam',
-                                            'player_name' : players[0]}))
+    if not matchmaking:
+        client.publish("new_game", json.dumps({'lobby_name':lobby_name,
+                                                'team_name':'ATeam',
+                                                'player_name' : players[0]}))
     
-    # client.publish("new_game", json.dumps({'lobby_name':lobby_name,
-    #                                         'team_name':'ATeam',
-    #                                         'player_name' : players[1]}))
+        # client.publish("new_game", json.dumps({'lobby_name':lobby_name,
+        #                                         'team_name':'ATeam',
+        #                                         'player_name' : players[1]}))
     
-    # client.publish("new_game", json.dumps({'lobby_name':lobby_name,
-    #                                     'team_name':'BTeam',
-    #                                     'player_name' : players[2]}))
+        # client.publish("new_game", json.dumps({'lobby_name':lobby_name,
+        #                                     'team_name':'BTeam',
+        #                                     'player_name' : players[2]}))
     
-    # client.publish("new_game", json.dumps({'lobby_name':lobby_name,
-    #                                     'team_name':'BTeam',
-    #                                     'player_name' : players[3]}))
+        # client.publish("new_game", json.dumps({'lobby_name':lobby_name,
+        #                                     'team_name':'BTeam',
+        #                                     'player_name' : players[3]}))
+
+        time.sleep(2) # Wait 2 seconds to resolve game start
 
-    time.sleep(2) # Wait 2 seconds to resolve game start
+        command = ''
+        while command != 'START':
+            command = input("Type 'START' to start the game: ").upper()
+            if command == 'START':
+                client.publish(f"games/{lobby_name}/start", "START")
+        client.loop_start()
 
-    command = ''
-    while command != 'START':
-        command = input("Type 'START' to start the game: ").upper()
-        if command == 'START':
-            client.publish(f"games/{lobby_name}/start", "START")
+    # Show moves before the server confirms them, set PREDICT_MOVES=1 to enable
+    predict_moves = os.environ.get('PREDICT_MOVES') == '1'
 
-    client.loop_start()
     while not game_over:
         try:
             for player in players:
                 time.sleep(0.1)
                 command = input(str(player) + ", enter a direction to move in: ").upper()
                 #sends movements to game based on user input
-                if command == "UP" or command == "\x1b[A":
-                    client.publish(f"games/{lobby_name}/{player}/move", "UP")
-                elif command == "DOWN" or command == "\x1b[B":
-                    client.publish(f"games/{lobby_name}/{player}/move", "DOWN")
-                elif command == "RIGHT" or command == "\x1b[C":
-                    client.publish(f"games/{lobby_name}/{player}/move", "RIGHT")
-                elif command == "LEFT" or command == "\x1b[D":
-                    client.publish(f"games/{lobby_name}/{player}/move", "LEFT")
-                else:
+                direction = KEY_DIRECTIONS.get(command)
+                if direction is None:
                     print("Not a Valid Direction")
-            time.sleep(1.5)
+                    continue
+                client.publish(f"games/{lobby_name}/{player}/move", direction)
+                if predict_moves:
+                    predict(lobby_name, player, direction)
+            # Wait for the server's game state, unless the predicted one is already shown
+            time.sleep(0.1 if predict_moves else 1.5)
 
         except KeyboardInterrupt:
             print('\nBreak')
-            client.publish(f"games/{lobby_name}/start", "STOP")
-            client.loop_stop()
             break
 
-    client.publish(f"games/{lobby_name}/start", "STOP")
+    # A matched lobby goes on without the player, the others didn't ask to stop
+    if not matchmaking:
+        client.publish(f"games/{lobby_name}/start", "STOP")
     client.loop_stop()
+    if predict_moves:
+        predictions = sum(world_model.predictions for world_model in world_models.values())
+        mispredictions = sum(world_model.mispredictions for world_model in world_models.values())
+        print(Fore.WHITE + f'{mispredictions} of {predictions} predicted moves were corrected by the server')
     time.sleep(1)
     client.disconnect()
\ No newline at end of file
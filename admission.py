@@ -0,0 +1,154 @@
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        Classic token bucket, refilled lazily whenever a token is requested
+        :param rate: tokens added per second
+        :param capacity: maximum number of tokens the bucket can hold (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def take(self, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        """
+        Gives back the token of a take whose message was dropped anyway
+        """
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class BucketTable:
+    def __init__(self, rate: float, capacity: float, max_keys: int):
+        """
+        Token buckets created on first use, the least recently used one is dropped past max_keys,
+        so keys taken from the network can't grow the table
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.buckets: OrderedDict = OrderedDict()
+
+    def get(self, key) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+class AdmissionController:
+    """
+    Decides whether an inbound message is worth parsing at all.
+
+    Every lobby gets one bucket shared by all of its players, so a single busy lobby
+    can't starve the others, and every player gets their own bucket inside of it, so
+    a single spamming player can't starve their own lobby. Routes that don't carry a
+    lobby in their topic get one bucket per route and lobby named in their payload
+    (e.g. new_game), so flooding one lobby's joins doesn't block the others.
+
+    Player buckets are only kept for players on a lobby's roster, names that aren't on it
+    share one bucket of that lobby. Messages to lobbies nobody created get a bucket per
+    lobby name, those and the route buckets are kept in tables of bounded size, so made up
+    topics can't grow the tables.
+    """
+    PLAYER_RATE = 10.0
+    PLAYER_BURST = 5.0
+    LOBBY_RATE = 100.0
+    LOBBY_BURST = 50.0
+    ROUTE_RATE = 200.0
+    ROUTE_BURST = 100.0
+    # Routes cheap enough to take bursts of their own, {'route' : (rate, burst)}
+    ROUTE_LIMITS = {'join': (5000.0, 5000.0)}
+    # Buckets of routes per lobby named in the payload and of lobbies that don't exist
+    MAX_ROUTE_KEYS = 4096
+    MAX_UNKNOWN_LOBBIES = 4096
+    OVERLOAD_NOTICE_INTERVAL = 1.0
+
+    def __init__(self):
+        self.player_buckets: dict[tuple[str, str], TokenBucket] = {}
+        self.lobby_buckets: dict[str, TokenBucket] = {}
+        self.route_buckets: dict[str, BucketTable] = {} # {'route' : buckets per lobby named in the payload}
+        self.unknown_buckets = BucketTable(AdmissionController.PLAYER_RATE, AdmissionController.PLAYER_BURST,
+                                           AdmissionController.MAX_UNKNOWN_LOBBIES)
+        self.last_notice: dict[str, float] = {}
+        self.dropped = 0
+
+    def admit(self, topic_list: list[str], players=None, lobby_name: str = None) -> bool:
+        """
+        :param topic_list: the split topic of the inbound message
+        :param players: container of the players of the message's lobby, None if the lobby doesn't exist
+        :param lobby_name: lobby named in the payload of a route without one in its topic, e.g. new_game
+        :return: True if the message should be dispatched, False if it has to be dropped
+        """
+        now = time.monotonic()
+        if topic_list[0] != 'games' or len(topic_list) < 3:
+            route = topic_list[-1]
+            table = self.route_buckets.get(route)
+            if table is None:
+                rate, burst = AdmissionController.ROUTE_LIMITS.get(route, (AdmissionController.ROUTE_RATE, AdmissionController.ROUTE_BURST))
+                table = self.route_buckets[route] = BucketTable(rate, burst, AdmissionController.MAX_ROUTE_KEYS)
+            admitted = table.get(lobby_name).take(now)
+        elif players is None:
+            admitted = self.unknown_buckets.get(topic_list[1]).take(now)
+        else:
+            lobby_name = topic_list[1]
+            lobby_bucket = self.lobby_buckets.get(lobby_name)
+            if lobby_bucket is None:
+                lobby_bucket = self.lobby_buckets[lobby_name] = TokenBucket(AdmissionController.LOBBY_RATE, AdmissionController.LOBBY_BURST)
+
+            admitted = lobby_bucket.take(now)
+            if admitted and len(topic_list) == 4:
+                # Names that aren't on the roster share the bucket of the None player
+                key = (lobby_name, topic_list[2] if topic_list[2] in players else None)
+                player_bucket = self.player_buckets.get(key)
+                if player_bucket is None:
+                    player_bucket = self.player_buckets[key] = TokenBucket(AdmissionController.PLAYER_RATE, AdmissionController.PLAYER_BURST)
+                if not player_bucket.take(now):
+                    # A spamming player doesn't use up their lobby's share
+                    lobby_bucket.refund()
+                    admitted = False
+
+        if not admitted:
+            self.dropped += 1
+        return admitted
+
+    def should_notify(self, lobby_name: str) -> bool:
+        """
+        Overload notices are throttled per lobby so signalling backpressure doesn't itself become a flood
+        """
+        now = time.monotonic()
+        if now - self.last_notice.get(lobby_name, float('-inf')) < AdmissionController.OVERLOAD_NOTICE_INTERVAL:
+            return False
+        self.last_notice[lobby_name] = now
+        return True
+
+    def lobbies(self) -> set[str]:
+        """
+        :return: lobbies there are buckets or notices for
+        """
+        return set(self.lobby_buckets) | set(self.last_notice)
+
+    def forget_lobby(self, lobby_name: str):
+        self.lobby_buckets.pop(lobby_name, None)
+        self.last_notice.pop(lobby_name, None)
+        for key in [key for key in self.player_buckets if key[0] == lobby_name]:
+            self.player_buckets.pop(key)
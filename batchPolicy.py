@@ -0,0 +1,135 @@
+"""
+The greedy bot of AutomationClient.choose_direction, deciding the moves of many bots at once with NumPy.
+python batchPolicy.py [--bots N] [--ticks N]
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from worldModel import EMPTY, WALL, COIN1, COIN2, COIN3, TEAMMATE, ENEMY, PLAYER, OUTSIDE
+
+# Moves are indices into MOVES, the order of vecEnv.ACTIONS
+MOVES = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+
+# Codes of the cells choose_direction won't step on, players and unknown cells are fair game
+BLOCKED = (WALL, OUTSIDE, TEAMMATE, ENEMY)
+
+# Coins from the most to the least valuable
+COINS = (COIN3, COIN2, COIN1)
+
+# Cells next to the center of a 5x5 view in the order choose_direction checks them: left, right, up, down
+_NEIGHBOUR_ROWS = np.array([2, 2, 1, 3])
+_NEIGHBOUR_COLS = np.array([1, 3, 2, 2])
+_NEIGHBOUR_MOVES = np.array([MOVES.index('LEFT'), MOVES.index('RIGHT'), MOVES.index('UP'), MOVES.index('DOWN')])
+_LEFT, _RIGHT, _UP, _DOWN = range(4)
+_NONE = 4 # neighbour index of no move
+
+# Everything below is looked up by code or by the 4-bit mask of free neighbours, so a batch is only a few fancy indexes
+_FREE = np.ones(256, dtype=bool)
+_FREE[list(BLOCKED)] = False
+_IS_COIN = np.zeros(256, dtype=bool)
+_IS_COIN[list(COINS)] = True
+_COIN_RANK = np.full(256, len(COINS), dtype=np.int8) # 0 for the most valuable coin, len(COINS) for anything else
+_COIN_RANK[list(COINS)] = range(len(COINS))
+_BITS = 1 << np.arange(4)
+
+
+def _towardsCell(row: int, col: int, mask: int) -> int:
+    """
+    :return: neighbour choose_direction heads for a coin on the cell with, _NONE if it can't
+    """
+    dx, dy = col - 2, row - 2
+    horizontal = [_LEFT] if dx < 0 else [_RIGHT] if dx > 0 else []
+    vertical = [_UP] if dy < 0 else [_DOWN] if dy > 0 else []
+    candidates = horizontal + vertical if abs(dx) > abs(dy) else vertical + horizontal
+    return next((neighbour for neighbour in candidates if mask >> neighbour & 1), _NONE)
+
+
+# (16, 25) neighbour headed for with a coin on every cell of the view, in row-major order
+_TOWARDS = np.array([[_towardsCell(row, col, mask) for row in range(5) for col in range(5)] for mask in range(16)])
+_REACHABLE = _TOWARDS != _NONE
+# (16, 4) the free neighbours first, then the blocked ones, with how many of them are free
+_FREE_FIRST = np.array([sorted(range(4), key=lambda neighbour: not mask >> neighbour & 1) for mask in range(16)])
+_FREE_COUNT = np.array([bin(mask).count('1') or 4 for mask in range(16)])
+
+
+def chooseDirections(codes: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    choose_direction for a batch of bots, with the same coin priority and blocked cells.
+    1. A coin next to the bot, the most valuable first, then left, right, up and down
+    2. Otherwise the first coin in view in row-major order that can be headed for, along its longer axis first
+    3. Otherwise a random free neighbour, or any move if all of them are blocked
+    Only the random choices differ from choose_direction, they come from rng instead of the random module.
+    :param codes: (N, 5, 5) world model codes centered on every bot, see WorldModel.codes(2)
+    :param rng: source of the random moves, a fresh default_rng() by default
+    :return: (N,) indices into MOVES
+    """
+    codes = np.asarray(codes)
+    assert codes.ndim == 3 and codes.shape[1:] == (5, 5)
+    rng = rng if rng is not None else np.random.default_rng()
+    n = len(codes)
+    flat = codes.reshape(n, 25).astype(np.intp)
+
+    neighbours = flat[:, _NEIGHBOUR_ROWS * 5 + _NEIGHBOUR_COLS] # (N, 4)
+    mask = _FREE[neighbours] @ _BITS
+
+    # 1. Coins next to the bot ranked by value, then by neighbour order
+    adjacent = (_COIN_RANK[neighbours] * 4 + np.arange(4)).min(axis=1)
+    hasAdjacent = adjacent < len(COINS) * 4
+
+    # 2. The first coin cell in view there is a free neighbour to head for it with
+    reachable = _IS_COIN[flat] & _REACHABLE[mask]
+    hasReachable = reachable.any(axis=1)
+    towards = _TOWARDS[mask, reachable.argmax(axis=1)]
+
+    # 3. Uniform among the free neighbours, among all of them if none is free
+    randomNeighbour = _FREE_FIRST[mask, (rng.random(n) * _FREE_COUNT[mask]).astype(np.intp)]
+
+    neighbour = np.where(hasAdjacent, adjacent % 4, np.where(hasReachable, towards, randomNeighbour))
+    return _NEIGHBOUR_MOVES[neighbour]
+
+
+def codesFromObservations(observations: np.ndarray) -> np.ndarray:
+    """
+    :param observations: (..., len(vecEnv.CHANNELS), 5, 5) one-hot windows of VecGameEnv
+    :return: (..., 5, 5) world model codes, to drive the agents of a VecGameEnv with chooseDirections
+    """
+    from vecEnv import CHANNELS
+    observations = np.asarray(observations)
+    channel = observations.argmax(axis=-3)
+    return np.where(observations.any(axis=-3), np.array(CHANNELS, dtype=np.int8)[channel], np.int8(EMPTY))
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from AutomationClient import choose_direction
+    from worldModel import CELL_NAMES
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bots', type=int, default=10000)
+    parser.add_argument('--ticks', type=int, default=20)
+    args = parser.parse_args()
+
+    # Random views with the cell frequencies of a busy board
+    rng = np.random.default_rng(0)
+    cells = np.array([EMPTY, WALL, COIN1, COIN2, COIN3, TEAMMATE, ENEMY, OUTSIDE], dtype=np.int8)
+    codes = rng.choice(cells, size=(args.bots, 5, 5), p=[0.55, 0.2, 0.06, 0.03, 0.01, 0.05, 0.05, 0.05])
+    codes[:, 2, 2] = PLAYER
+
+    started = time.perf_counter()
+    for _ in range(args.ticks):
+        moves = chooseDirections(codes, rng)
+    batched = (time.perf_counter() - started) / args.ticks
+
+    boards = [[[CELL_NAMES[code] for code in row] for row in view] for view in codes.tolist()]
+    started = time.perf_counter()
+    scalarMoves = [choose_direction(board) for board in boards]
+    scalar = time.perf_counter() - started
+
+    # Random moves may differ, the rest has to match
+    agree = np.mean(np.array([MOVES.index(move) for move in scalarMoves]) == moves)
+    print(f'{args.bots} bots: {batched * 1000:.2f} ms per tick batched, {scalar * 1000:.2f} ms with choose_direction '
+          f'({scalar / batched:.0f}x), {agree:.1%} of the moves agree')
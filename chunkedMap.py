@@ -0,0 +1,248 @@
+"""
+Maps stored in fixed-size chunks of a memory-mapped file, for persistent worlds larger than memory.
+"""
+
+import json
+import os
+import random
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from gameItems import Wall, Coin1, Coin2, Coin3
+from map import Map, MapLayout, newSeed
+from mapGenerators import GENERATORS
+from player import Player
+
+# Cell codes of the chunk file. Items hold no state, so every cell of a kind is the same object
+_ITEMS = (None, Wall(), Coin1(), Coin2(), Coin3())
+_CODES = {Wall: 1, Coin1: 2, Coin2: 3, Coin3: 4}
+_COIN_CODES = np.array([2, 3, 4], dtype=np.int8)
+_COIN_WEIGHTS = np.array([6, 3, 1]) / 10
+
+
+class ChunkedMap:
+    CHUNK_SIZE = 64
+    CACHED_CHUNKS = 256
+
+    def __init__(self, path: str, height: int, width: int, playersList: list[Player], generator: str = 'lattice',
+                 seed: Optional[int] = None, chunkSize: int = CHUNK_SIZE, cachedChunks: int = CACHED_CHUNKS,
+                 layout: Optional[MapLayout] = None):
+        """
+        A drop-in for Map whose walls and coins live in a file of chunkSize x chunkSize chunks.
+        Chunks are read on first access into an LRU cache of cachedChunks chunks, evicted chunks are written back
+        if they changed. Players are kept apart in a dict of their positions.
+
+        A new world is generated one chunk at a time, each chunk from the generator and its own seed, so generating
+        never holds more than a chunk. An existing world at path is opened as its chunks were last written, by flush(),
+        close() or an eviction, unless a layout is given. Its coins are counted again from the chunks, the header only
+        holds the count of the last flush.
+        :param path: chunk file of the world, its header is kept next to it in path.json
+        :param generator: wall generator, applied to every chunk on its own
+        :param seed: seed of the world, the same seed gives the same walls, coins and spawns
+        :param layout: cells and spawns to write the world from instead of generating it, e.g. to replay a regular Map
+        """
+        assert isinstance(width, int) and isinstance(height, int)
+        assert isinstance(playersList, list)
+        self.path = path
+        self.__headerPath = path + '.json'
+        self.__cache: OrderedDict[tuple[int, int], list] = OrderedDict() # {(chunkRow, chunkCol) : [chunk, dirty]}
+        self.__capacity = cachedChunks
+        self.__players: dict[tuple[int, int], Player] = {}
+        self.wallChoices = [] if layout is None else layout.wallChoices # candidate walls are only known chunk by chunk
+
+        if os.path.exists(self.__headerPath) and layout is None:
+            with open(self.__headerPath) as file:
+                header = json.load(file)
+            assert header['height'] == height and header['width'] == width, f'{path} holds a {header["height"]}x{header["width"]} world'
+            self.__height, self.__width, self.__chunkSize = height, width, header['chunkSize']
+            self.seed = header['seed']
+            self.__numWalls = header['numWalls']
+            self.__file = np.memmap(path, dtype=np.int8, mode='r+', shape=self.__fileShape())
+            self.__numCoins = self.__countCoins()
+        else:
+            self.__height, self.__width, self.__chunkSize = height, width, chunkSize
+            if layout is None:
+                self.seed = newSeed() if seed is None else seed
+                self.__generate(generator)
+            else:
+                assert layout.height == height and layout.width == width and len(layout.spawns) == len(playersList)
+                self.seed = layout.seed
+                self.__write(layout)
+            self.__file = np.memmap(path, dtype=np.int8, mode='r+', shape=self.__fileShape())
+            self.flush()
+
+        if layout is not None:
+            for player, loc in zip(playersList, layout.spawns):
+                self.set(loc, player)
+                player.loc = loc
+            return
+
+        # Spawn on free cells, drawn from the world's seed
+        spawnRandom = random.Random(self.seed)
+        for player in playersList:
+            while True:
+                loc = spawnRandom.randrange(self.__height), spawnRandom.randrange(self.__width)
+                if self.get(loc) is None:
+                    self.set(loc, player)
+                    player.loc = loc
+                    break
+
+    @property
+    def numCoins(self):
+        return self.__numCoins
+
+    @property
+    def numWalls(self):
+        return self.__numWalls
+
+    def decreaseCoin(self):
+        self.__numCoins -= 1
+
+    @property
+    def map(self):
+        return [[self.get((x, y)) for y in range(self.__width)] for x in range(self.__height)]
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def chunkSize(self):
+        return self.__chunkSize
+
+    def __repr__(self):
+        result = []
+        for x in range(self.__height):
+            row_str = []
+            for y in range(self.__width):
+                cell = self.get((x, y))
+                if cell is None:
+                    row_str.append('None')
+                elif isinstance(cell, Player):
+                    row_str.append(cell.name)
+                else:
+                    row_str.append(cell.__class__.__name__)
+            result.append('\t'.join(row_str))
+        return '\n'.join(result)
+
+    def set(self, loc: tuple[int, int], item: object):
+        assert isinstance(loc, tuple) and len(loc) == 2 and isinstance(loc[0], int) and isinstance(loc[1], int)
+        x, y = loc
+        entry = self.__entry(x // self.__chunkSize, y // self.__chunkSize)
+        if isinstance(item, Player):
+            # A player takes the cell, and whatever item was on it
+            self.__players[loc] = item
+            code = 0
+        else:
+            self.__players.pop(loc, None)
+            code = 0 if item is None else _CODES[type(item)]
+        entry[0][x % self.__chunkSize, y % self.__chunkSize] = code
+        entry[1] = True
+
+    def get(self, loc: tuple[int, int]):
+        assert isinstance(loc, tuple) and len(loc) == 2 and isinstance(loc[0], int) and isinstance(loc[1], int)
+        player = self.__players.get(loc)
+        if player is not None:
+            return player
+        x, y = loc
+        chunk = self.__entry(x // self.__chunkSize, y // self.__chunkSize)[0]
+        return _ITEMS[chunk[x % self.__chunkSize, y % self.__chunkSize]]
+
+    def cachedChunks(self) -> int:
+        return len(self.__cache)
+
+    def flush(self):
+        """
+        Writes the changed chunks and the header to disk, the chunks stay cached
+        """
+        for (cx, cy), entry in self.__cache.items():
+            if entry[1]:
+                self.__file[cx, cy] = entry[0]
+                entry[1] = False
+        self.__file.flush()
+        header = {'height': self.__height, 'width': self.__width, 'chunkSize': self.__chunkSize, 'seed': self.seed,
+                    'numCoins': self.__numCoins, 'numWalls': self.__numWalls}
+        with open(self.__headerPath + '.tmp', 'w') as file:
+            json.dump(header, file)
+        os.replace(self.__headerPath + '.tmp', self.__headerPath)
+
+    def close(self):
+        self.flush()
+        self.__cache.clear()
+        del self.__file
+
+    def __fileShape(self) -> tuple[int, int, int, int]:
+        # Chunk-major, so every chunk is one contiguous read
+        size = self.__chunkSize
+        return -(-self.__height // size), -(-self.__width // size), size, size
+
+    def __countCoins(self) -> int:
+        # One chunk at a time, so counting never holds more than a chunk of the world
+        rowChunks, colChunks = self.__fileShape()[:2]
+        return sum(int((self.__file[cx, cy] >= _CODES[Coin1]).sum()) for cx in range(rowChunks) for cy in range(colChunks))
+
+    def __entry(self, cx: int, cy: int) -> list:
+        key = (cx, cy)
+        entry = self.__cache.get(key)
+        if entry is not None:
+            self.__cache.move_to_end(key)
+            return entry
+        entry = self.__cache[key] = [np.array(self.__file[cx, cy]), False]
+        if len(self.__cache) > self.__capacity:
+            (ex, ey), (chunk, dirty) = self.__cache.popitem(last=False)
+            if dirty:
+                self.__file[ex, ey] = chunk
+        return entry
+
+    def __generate(self, generator: str):
+        worldRandom = random.Random(self.seed)
+        wallRatio = worldRandom.uniform(Map.WALL_MIN_RATIO, Map.WALL_MAX_RATIO)
+        coinRatio = worldRandom.uniform(Map.COIN_MIN_RATIO, Map.COIN_MAX_RATIO)
+        size = self.__chunkSize
+        rowChunks, colChunks = self.__fileShape()[:2]
+        numWalls = numCoins = 0
+        # Chunks are appended in file order with plain writes, which leaves nothing of the world mapped in memory
+        with open(self.path, 'wb') as file:
+            for cx in range(rowChunks):
+                for cy in range(colChunks):
+                    rng = np.random.default_rng([self.seed, cx, cy])
+                    candidates = GENERATORS[generator](size, size, rng)
+                    # Cells of edge chunks past the end of the board stay empty
+                    candidates[self.__height - cx * size:, :] = False
+                    candidates[:, self.__width - cy * size:] = False
+                    inside = np.zeros((size, size), dtype=bool)
+                    inside[:self.__height - cx * size, :self.__width - cy * size] = True
+
+                    chunk = np.zeros((size, size), dtype=np.int8)
+                    wallChance = min(1.0, wallRatio * inside.sum() / max(candidates.sum(), 1))
+                    walls = candidates & (rng.random((size, size)) < wallChance)
+                    chunk[walls] = 1
+                    coins = inside & ~walls & (rng.random((size, size)) < coinRatio)
+                    chunk[coins] = rng.choice(_COIN_CODES, size=int(coins.sum()), p=_COIN_WEIGHTS)
+                    file.write(chunk.tobytes())
+                    numWalls += int(walls.sum())
+                    numCoins += int(coins.sum())
+        self.__numWalls = numWalls
+        self.__numCoins = numCoins
+
+    def __write(self, layout: MapLayout):
+        size = self.__chunkSize
+        rowChunks, colChunks = self.__fileShape()[:2]
+        with open(self.path, 'wb') as file:
+            for cx in range(rowChunks):
+                for cy in range(colChunks):
+                    chunk = np.zeros((size, size), dtype=np.int8)
+                    for x in range(cx * size, min((cx + 1) * size, self.__height)):
+                        for y in range(cy * size, min((cy + 1) * size, self.__width)):
+                            cell = layout.grid[x][y]
+                            if cell is not None:
+                                chunk[x - cx * size, y - cy * size] = _CODES[type(cell)]
+                    file.write(chunk.tobytes())
+        self.__numWalls = layout.numWalls
+        self.__numCoins = layout.numCoins
@@ -0,0 +1,149 @@
+import os
+import threading
+import zlib
+
+import paho.mqtt.client as paho
+from paho import mqtt
+
+
+class PooledEndpoint:
+    """
+    Stands in for a paho client for code that only publishes, e.g. GameClient's handlers run by a pooled lobby.
+    GameClient's init_client attaches the lobby's state to it like it does to a real client.
+    """
+    def __init__(self, pool, prefix: str):
+        self.pool = pool
+        self.prefix = prefix
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        return self.pool.publish(topic, payload, qos, retain, properties)
+
+
+class BrokerConnectionPool:
+    SUBSCRIBE_INTERVAL = 0.05
+
+    def __init__(self, size: int = 4, client_id: str = 'GamePool'):
+        """
+        A few broker connections shared by many lobby handlers.
+        Handlers register a topic prefix (e.g. games/{lobby}/) and get every message under it. A prefix always
+        lives on the same connection, so its messages keep their order. Subscriptions are sent in batches and
+        sent again whenever a connection comes back.
+        :param size: number of broker connections
+        :param client_id: prefix of the client ids of the connections
+        """
+        assert isinstance(size, int) and size > 0
+        self.connections: list[paho.Client] = []
+        self.__routes: dict[str, object] = {} # {'prefix' : handler(client, userdata, msg)}
+        self.__topics: list[dict[str, str]] = [{} for _ in range(size)] # topics subscribed on each connection {'topic' : 'prefix'}
+        self.__pending: list[list[str]] = [[] for _ in range(size)] # topics waiting for the next batch
+        self.__waiting: dict[tuple[int, int], list] = {} # callbacks waiting for a SUBACK {(connection, mid) : [callback, ...]}
+        self.__callbacks: list[list] = [[] for _ in range(size)] # callbacks of the pending topics
+        self.__lock = threading.RLock()
+        self.__flusher = None
+
+        for index in range(size):
+            client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id=f'{client_id}-{index}', userdata=index, protocol=paho.MQTTv5)
+            # enable TLS for secure connection
+            client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
+            # set username and password
+            client.username_pw_set(os.environ.get('USER_NAME'), os.environ.get('PASSWORD'))
+            client.on_connect = self.__on_connect
+            client.on_message = self.__on_message
+            client.on_subscribe = self.__on_subscribe
+            self.connections.append(client)
+
+    def start(self, broker_address: str, broker_port: int):
+        """
+        Connects every connection, paho reconnects them by itself from then on
+        """
+        for client in self.connections:
+            client.connect(broker_address, broker_port)
+            client.loop_start()
+        self.__flusher = threading.Thread(target=self.__flushLoop, name='BrokerConnectionPool', daemon=True)
+        self.__flusher.start()
+
+    def stop(self):
+        for client in self.connections:
+            client.loop_stop()
+            client.disconnect()
+
+    def endpoint(self, prefix: str) -> PooledEndpoint:
+        return PooledEndpoint(self, prefix)
+
+    def register(self, prefix: str, handler, topics: list[str], on_subscribed=None):
+        """
+        Routes the messages under the prefix to the handler and subscribes to the topics in the next batch
+        :param handler: called as handler(client, userdata, msg) like a paho on_message
+        :param on_subscribed: called without arguments once the broker acknowledged the topics
+        """
+        index = self.__connectionIndex(prefix)
+        with self.__lock:
+            self.__routes[prefix] = handler
+            for topic in topics:
+                self.__topics[index][topic] = prefix
+            self.__pending[index].extend(topics)
+            if on_subscribed is not None:
+                self.__callbacks[index].append(on_subscribed)
+
+    def unregister(self, prefix: str):
+        index = self.__connectionIndex(prefix)
+        with self.__lock:
+            self.__routes.pop(prefix, None)
+            topics = [topic for topic, owner in self.__topics[index].items() if owner == prefix]
+            for topic in topics:
+                self.__topics[index].pop(topic)
+        if topics:
+            self.connections[index].unsubscribe(topics)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        # Publish on the connection of the topic's lobby so its messages stay in order
+        levels = topic.split('/')
+        prefix = '/'.join(levels[:2]) + '/' if len(levels) > 2 else topic
+        return self.connections[self.__connectionIndex(prefix)].publish(topic, payload, qos, retain, properties)
+
+    def flush_subscriptions(self):
+        """
+        Sends the pending topics of every connection, one SUBSCRIBE per connection
+        """
+        for index, client in enumerate(self.connections):
+            with self.__lock:
+                topics, self.__pending[index] = self.__pending[index], []
+                callbacks, self.__callbacks[index] = self.__callbacks[index], []
+                if not topics:
+                    for callback in callbacks:
+                        callback()
+                    continue
+                result, mid = client.subscribe([(topic, 0) for topic in topics])
+                if result != paho.MQTT_ERR_SUCCESS:
+                    # Not connected, on_connect subscribes again to everything
+                    self.__callbacks[index].extend(callbacks)
+                    continue
+                self.__waiting[(index, mid)] = callbacks
+
+    def __connectionIndex(self, prefix: str) -> int:
+        return zlib.crc32(prefix.encode()) % len(self.connections)
+
+    def __flushLoop(self):
+        event = threading.Event()
+        while not event.wait(BrokerConnectionPool.SUBSCRIBE_INTERVAL):
+            self.flush_subscriptions()
+
+    def __on_connect(self, client, userdata, flags, rc, properties=None):
+        # A new connection or a reconnection, subscribe again to everything of this connection
+        with self.__lock:
+            self.__pending[userdata] = list(self.__topics[userdata].keys())
+
+    def __on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        with self.__lock:
+            callbacks = self.__waiting.pop((userdata, mid), [])
+        for callback in callbacks:
+            callback()
+
+    def __on_message(self, client, userdata, msg):
+        # Longest registered prefix of the topic wins
+        levels = msg.topic.split('/')
+        for i in range(len(levels) - 1, 0, -1):
+            handler = self.__routes.get('/'.join(levels[:i]) + '/')
+            if handler is not None:
+                handler(client, userdata, msg)
+                return
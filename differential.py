@@ -0,0 +1,175 @@
+"""
+Differential check of alternative engines against the reference Game, for gating engine optimizations.
+Every engine builds the same games on its own, from the same settings and map seed, replays them with the same random
+move streams, and has to agree with the reference on the board, positions, scores, gameOver() and every observation
+after every tick.
+python differential.py [--engines seeded hibernated chunked] [--games N] [--ticks N] [--seed N]
+Every game is played to the end, an engine that mismatches is only left out of the rest of that game.
+Exits with 1 if any engine mismatched.
+"""
+
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+from game import Game
+from hibernation import decodeGame, encodeGame
+from map import MapLayout
+from mapGenerators import GENERATORS, generateWallChoices
+from moveset import Moveset
+from player import Player
+
+MOVES = tuple(Moveset)
+
+
+def _seeded(settings: dict, directory: str) -> Game:
+    return Game(**settings)
+
+
+def _hibernated(settings: dict, directory: str) -> Game:
+    return decodeGame(encodeGame(Game(**settings)))
+
+
+def _chunked(settings: dict, directory: str) -> Game:
+    # A ChunkedMap generates its own worlds chunk by chunk, it is given the layout the seed gives a regular Map.
+    # Small chunks, so moves and windows cross chunk borders all the time
+    numPlayers = sum(len(players) for players in settings['playerNames'].values())
+    wallChoices = generateWallChoices(settings['generator'], settings['height'], settings['width'], settings['seed'], cache=False)
+    layout = MapLayout(settings['height'], settings['width'], numPlayers, wallChoices, settings['seed'])
+    return Game(**settings, layout=layout, worldPath=f'{directory}/world', chunkSize=4)
+
+
+# Engines under test, each builds a game from the settings of the reference game, keyword arguments of Game,
+# and may keep files in the directory, which is removed after the game
+ENGINES: dict[str, Callable[[dict, str], Game]] = {
+    'seeded': _seeded,
+    'hibernated': _hibernated,
+    'chunked': _chunked,
+}
+
+
+def registerEngine(name: str, engine: Callable[[dict, str], Game]):
+    assert isinstance(name, str) and callable(engine)
+    ENGINES[name] = engine
+
+
+def snapshot(game: Game, moves: list[tuple[str, Moveset]] = ()) -> tuple[dict, float]:
+    """
+    Applies the moves in order, then captures everything about the game the engines have to agree on
+    :return: the snapshot and the seconds spent in movePlayer, getGameData and getTeamGameData
+    """
+    started = time.perf_counter()
+    for name, move in moves:
+        game.movePlayer(name, move)
+    observations = {name: game.getGameData(name) for name in game.all_players}
+    teamObservations = {name: game.getTeamGameData(name) for name in game.teams}
+    spent = time.perf_counter() - started
+
+    cells = []
+    for x in range(game.map.height):
+        for y in range(game.map.width):
+            cell = game.map.get((x, y))
+            cells.append(cell.name if isinstance(cell, Player) else type(cell).__name__)
+    return {'grid': cells,
+            'positions': {name: player.loc for name, player in game.all_players.items()},
+            'scores': game.getScores(),
+            'coins': game.getCoins(),
+            'numCoins': game.map.numCoins,
+            'gameOver': game.gameOver(),
+            'observations': observations,
+            'teamObservations': teamObservations}, spent
+
+
+def _mismatch(expected: dict, actual: dict) -> Optional[tuple[str, object, object]]:
+    """
+    :return: (field, expected, actual) of the first field that differs, the grid as its first differing cell
+    """
+    for field, value in expected.items():
+        if actual[field] == value:
+            continue
+        if field == 'grid':
+            for i, (cell, other) in enumerate(zip(value, actual[field])):
+                if cell != other:
+                    return f'grid[{i}]', cell, other
+        return field, value, actual[field]
+    return None
+
+
+def compareEngines(engines: list[str], games: int = 20, ticks: int = 200, height: int = 12, width: int = 12,
+                   players: tuple[int, ...] = (2, 2), seed: int = 0) -> dict:
+    """
+    Plays the games on the reference and on every engine, every tick applies the same moves in the same order to all of them.
+    An engine that disagrees is left out of the rest of that game, one difference would only cascade into more
+    :param games: number of games, each with its own map seed, generator, vision and move stream
+    :param ticks: ticks of every game, games over keep going on their empty board
+    :param players: players of every team
+    :return: {'mismatches': [{'engine', 'game', 'tick', 'field', 'expected', 'actual'}], 'games', 'ticks',
+              'seconds': {engine: seconds in the engine}, 'speedup': {engine: reference seconds / engine seconds}}
+    """
+    assert all(engine in ENGINES for engine in engines)
+    harnessRandom = random.Random(seed)
+    roster = {f'Team{chr(65 + team)}': [f'{chr(65 + team)}{i}' for i in range(count)] for team, count in enumerate(players)}
+    seconds = dict.fromkeys(['reference'] + engines, 0.0)
+    mismatches = []
+
+    for number in range(games):
+        settings = {'playerNames': roster, 'width': width, 'height': height, 'generator': harnessRandom.choice(sorted(GENERATORS)),
+                    'lineOfSight': harnessRandom.random() < 0.5, 'visionRadius': harnessRandom.randint(1, 3),
+                    'seed': harnessRandom.getrandbits(63)}
+        reference = Game(**settings)
+        moveRandom = random.Random(harnessRandom.getrandbits(63))
+        directory = tempfile.mkdtemp(prefix='differential-')
+        try:
+            candidates = {engine: ENGINES[engine](settings, directory) for engine in engines}
+            for tick in range(ticks + 1):
+                # Moves arrive in any order on the server, so the order is part of the stream
+                moves = [(name, moveRandom.choice(MOVES)) for name in moveRandom.sample(list(reference.all_players), len(reference.all_players))] if tick else []
+                expected, spent = snapshot(reference, moves)
+                seconds['reference'] += spent
+                for engine, game in list(candidates.items()):
+                    actual, spent = snapshot(game, moves)
+                    seconds[engine] += spent
+                    difference = _mismatch(expected, actual)
+                    if difference is not None:
+                        mismatches.append(dict(zip(('field', 'expected', 'actual'), difference), engine=engine, game=number, tick=tick))
+                        del candidates[engine]
+            for game in candidates.values():
+                game.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    speedup = {engine: seconds['reference'] / seconds[engine] if seconds[engine] else None for engine in engines}
+    return {'mismatches': mismatches, 'games': games, 'ticks': games * ticks, 'seconds': seconds, 'speedup': speedup}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--height', type=int, default=12)
+    parser.add_argument('--width', type=int, default=12)
+    parser.add_argument('--players', type=int, nargs='+', default=[2, 2], help='players of every team')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = compareEngines(args.engines, args.games, args.ticks, args.height, args.width, tuple(args.players), args.seed)
+    if args.json:
+        print(json.dumps(report, default=str))
+    else:
+        print(f'{report["games"]} games, {report["ticks"]} ticks, reference {report["seconds"]["reference"]:.3f}s')
+        for engine in args.engines:
+            failed = [mismatch for mismatch in report['mismatches'] if mismatch['engine'] == engine]
+            speedup = report['speedup'][engine]
+            print(f'{engine:<12} {"FAIL" if failed else "ok":<5} {report["seconds"][engine]:.3f}s'
+                  + (f'  ({speedup:.2f}x reference)' if speedup else ''))
+            for mismatch in failed:
+                print(f'    game {mismatch["game"]} tick {mismatch["tick"]} {mismatch["field"]}: '
+                      f'expected {mismatch["expected"]!r}, got {mismatch["actual"]!r}')
+    sys.exit(1 if report['mismatches'] else 0)
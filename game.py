@@ -2,17 +2,27 @@
 Author: Charles Lee
 """
 
-from map import Map
+from map import Map, MapLayout
 from moveset import Moveset
 from player import Player
 from team import Team
 from gameItems import *
-import random
+from vision import getVisibilityTable
 
 class Game:
-    def __init__(self, playerNames: dict[str,list[str]], width: int = 10, height: int = 10):
+    def __init__(self, playerNames: dict[str,list[str]], width: int = 10, height: int = 10, lineOfSight: bool = False,
+                 generator: str = 'lattice', seed: int = None, layout: MapLayout = None, visionRadius: int = 2,
+                 teamVision: bool = False, worldPath: str = None, chunkSize: int = 64):
         """
         :param playerNames: Dictionary for each team name with a list of player names
+        :param visionRadius: Default vision radius of getGameData
+        :param lineOfSight: If True, walls block the vision of players
+        :param teamVision: If True, teams share one observation from getTeamGameData instead of one per player
+        :param worldPath: If given, the map is a ChunkedMap kept in this file, opened again if it exists or written from the layout
+        :param chunkSize: Side of the chunks of a ChunkedMap
+        :param generator: Name of the wall generator used for the map
+        :param seed: Seed of the game's map, the same seed gives the same walls, coins and spawns
+        :param layout: Pre-generated map layout with one spawn point per player, see GamePool
         """
         self.numTeams = len(playerNames)
 
@@ -20,7 +30,23 @@ class Game:
 
         self.__height = height
         self.__width = width
-        self.map = Map(height, width, list(self.all_players.values()))
+        self.lineOfSight = lineOfSight
+        self.visionRadius = visionRadius
+        self.teamVision = teamVision
+        if worldPath is None:
+            self.map = Map(height, width, list(self.all_players.values()), generator=generator, seed=seed, layout=layout)
+        else:
+            from chunkedMap import ChunkedMap
+            self.map = ChunkedMap(worldPath, height, width, list(self.all_players.values()), generator=generator, seed=seed,
+                                  chunkSize=chunkSize, layout=layout)
+        self.seed = self.map.seed
+
+    def close(self):
+        """
+        Writes a ChunkedMap world back to its file, a regular Map has nothing to write
+        """
+        if hasattr(self.map, 'close'):
+            self.map.close()
 
     def __initializePlayers(self, playerNames: dict[str,list[str]]):
         teams = {}
@@ -49,6 +75,7 @@ class Game:
 
         if isinstance(cell, Coin):
             player.team.increaseScore(cell.value)
+            player.team.increaseCoins()
             self.map.decreaseCoin()
 
         self.map.set(player.loc, None)
@@ -62,10 +89,11 @@ class Game:
         except KeyError:
             raise KeyError(f'{playerName} is not a valid player name')
 
-    def getGameData(self, playerName:str, visionRadius: int = 2) -> dict:
+    def getGameData(self, playerName:str, visionRadius: int = None, lineOfSight: bool = None) -> dict:
         """
         :param playerName:
-        :param vision:
+        :param visionRadius: Overrides the game's vision radius
+        :param lineOfSight: Overrides the game's vision mode, cells hidden behind walls are left out
         :return: {
             teammateNames: [],
             teammatePositions: [(x,y),...],
@@ -78,6 +106,7 @@ class Game:
         }
         """
         assert isinstance(playerName, str)
+        visionRadius = self.visionRadius if visionRadius is None else visionRadius
         assert isinstance(visionRadius, int)
         player = self.getPlayer(playerName)
         centerX, centerY = player.loc
@@ -94,6 +123,10 @@ class Game:
                     'coin3': [],
                     'walls': []}
 
+        if self.lineOfSight if lineOfSight is None else lineOfSight:
+            self.__addVisibleGameData(gameData, player, visionRadius)
+            return gameData
+
         for x in range(minX, maxX+1):
             for y in range(minY, maxY+1):
                 cell = self.map.get((x,y))
@@ -101,6 +134,96 @@ class Game:
 
         return gameData
 
+    def getTeamGameData(self, teamName: str, visionRadius: int = None, lineOfSight: bool = None) -> dict:
+        """
+        Everything the players of a team see together, every cell seen by several of them is only looked at once
+        :param teamName:
+        :param visionRadius: Overrides the game's vision radius
+        :param lineOfSight: Overrides the game's vision mode, cells hidden behind walls are left out
+        :return: {
+            teammateNames: [],
+            teammatePositions: [(x,y),...],
+            enemyPositions: [(x,y),...],
+            coin1: [(x,y),...],
+            coin2: [(x,y),...],
+            coin3: [(x,y),...],
+            walls: [(x,y),...]
+        }
+        """
+        assert isinstance(teamName, str)
+        visionRadius = self.visionRadius if visionRadius is None else visionRadius
+        assert isinstance(visionRadius, int)
+        try:
+            team = self.teams[teamName]
+        except KeyError:
+            raise KeyError(f'{teamName} is not a valid team name')
+        players = [player for player in self.all_players.values() if player.team is team]
+        gameData = {'teammateNames': [player.name for player in players],
+                    'teammatePositions': [player.loc for player in players],
+                    'enemyPositions': [],
+                    'coin1': [],
+                    'coin2': [],
+                    'coin3': [],
+                    'walls': []}
+
+        if self.lineOfSight if lineOfSight is None else lineOfSight:
+            seen = set()
+            for player in players:
+                for loc, cell in self.__visibleCells(player, visionRadius):
+                    if loc not in seen:
+                        seen.add(loc)
+                        self.__addTeamGameData(gameData, cell, loc, team)
+            return gameData
+
+        # Merge the windows row by row, so every cell of the union is visited once
+        windows = [(max(x - visionRadius, 0), min(x + visionRadius, self.__height-1),
+                    max(y - visionRadius, 0), min(y + visionRadius, self.__width-1)) for x, y in (player.loc for player in players)]
+        for x in range(min(window[0] for window in windows), max(window[1] for window in windows)+1):
+            spans = sorted((minY, maxY) for minX, maxX, minY, maxY in windows if minX <= x <= maxX)
+            nextY = 0
+            for minY, maxY in spans:
+                for y in range(max(minY, nextY), maxY+1):
+                    cell = self.map.get((x,y))
+                    if cell is not None:
+                        self.__addTeamGameData(gameData, cell, (x,y), team)
+                nextY = max(nextY, maxY+1)
+
+        return gameData
+
+    def __visibleCells(self, player: Player, visionRadius: int):
+        """
+        Yields (loc, cell) of the cells in the player's line of sight
+        """
+        centerX, centerY = player.loc
+        # clear[i] is True when the i-th offset is visible and doesn't block the cells behind it
+        clear = []
+        for dx, dy, parent in getVisibilityTable(visionRadius):
+            x, y = centerX + dx, centerY + dy
+            if not (0 <= x < self.__height and 0 <= y < self.__width) or (parent >= 0 and not clear[parent]):
+                clear.append(False)
+                continue
+            cell = self.map.get((x,y))
+            clear.append(not isinstance(cell, Wall))
+            yield (x,y), cell
+
+    def __addVisibleGameData(self, gameData: dict, player: Player, visionRadius: int):
+        for loc, cell in self.__visibleCells(player, visionRadius):
+            self.__addGameData(gameData, cell, loc, player)
+
+    def __addTeamGameData(self, gameData: dict, cell: object, loc: tuple[int, int], team: Team):
+        # Teammates are already listed
+        if isinstance(cell, Player):
+            if cell.team is not team:
+                gameData['enemyPositions'].append(loc)
+        elif isinstance(cell, Coin1):
+            gameData['coin1'].append(loc)
+        elif isinstance(cell, Coin2):
+            gameData['coin2'].append(loc)
+        elif isinstance(cell, Coin3):
+            gameData['coin3'].append(loc)
+        elif isinstance(cell, Wall):
+            gameData['walls'].append(loc)
+
     def __addGameData(self, gameData: dict, cell: object, loc: tuple[int, int], player: Player):
         if isinstance(cell, Player):
             if cell.team is player.team and cell is not player:
@@ -126,10 +249,15 @@ class Game:
             scores[teamName] = team.score
         return scores
 
+    def getCoins(self):
+        """
+        :return: number of coins every team collected, whatever their value
+        """
+        return {teamName: team.coins for teamName, team in self.teams.items()}
+
 
 if __name__ == '__main__':
-    random.seed(1)
-    g = Game({'TeamA': ['Charles', 'Girish'], 'TeamB': ['James']})
+    g = Game({'TeamA': ['Charles', 'Girish'], 'TeamB': ['James']}, seed=1)
     print(g.map)
     print(g.getScores())
     multiMove = lambda name, moves: [g.movePlayer(name, move) for move in moves]
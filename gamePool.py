@@ -0,0 +1,92 @@
+import queue
+import random
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from map import MapLayout
+from mapGenerators import generateWallChoices
+
+
+class GamePool:
+    def __init__(self, depth: int = 4, generator: str = 'lattice', seed: Optional[int] = None, maxKeys: int = 8):
+        """
+        Keeps a few map layouts ready for the (height, width, numPlayers) most recently asked for,
+        so starting a lobby only has to place its players. Layouts are generated on a daemon thread.
+        :param depth: number of ready layouts kept per key
+        :param generator: wall generator used for the pooled layouts
+        :param seed: seed of the stream the layouts' seeds are drawn from, fresh entropy when not given
+        :param maxKeys: number of keys kept, the layouts of the least recently used key are dropped past it
+        """
+        assert isinstance(depth, int) and depth >= 0
+        assert isinstance(maxKeys, int) and maxKeys > 0
+        self.depth = depth
+        self.maxKeys = maxKeys
+        self.generator = generator
+        self.hits = 0
+        self.misses = 0
+
+        self.__seeds = random.Random(seed) # only used by the refill thread
+        self.__pools: OrderedDict[tuple[int, int, int], queue.Queue] = OrderedDict() # least recently used first
+        self.__lock = threading.Lock()
+        self.__requests: queue.Queue = queue.Queue()
+        self.__worker = threading.Thread(target=self.__refill, name='GamePool', daemon=True)
+        self.__worker.start()
+
+    def take(self, height: int, width: int, numPlayers: int) -> Optional[MapLayout]:
+        """
+        :return: a ready layout, or None if the pool for this key is empty (a refill is queued either way)
+        """
+        key = (height, width, numPlayers)
+        pool = self.__getPool(key)
+        try:
+            layout = pool.get_nowait()
+            self.hits += 1
+        except queue.Empty:
+            layout = None
+            self.misses += 1
+        self.__requests.put(key)
+        return layout
+
+    def warm(self, height: int, width: int, numPlayers: int):
+        """
+        Asks for the pool of this key to be filled in the background
+        """
+        self.__getPool((height, width, numPlayers))
+        self.__requests.put((height, width, numPlayers))
+
+    def keys(self) -> list[tuple[int, int, int]]:
+        """
+        :return: the keys layouts are kept for, least recently used first
+        """
+        with self.__lock:
+            return list(self.__pools)
+
+    def __getPool(self, key: tuple[int, int, int]) -> queue.Queue:
+        with self.__lock:
+            if key not in self.__pools:
+                self.__pools[key] = queue.Queue(maxsize=self.depth)
+                if len(self.__pools) > self.maxKeys:
+                    self.__pools.popitem(last=False)
+            self.__pools.move_to_end(key)
+            return self.__pools[key]
+
+    def __refill(self):
+        while True:
+            key = self.__requests.get()
+            height, width, numPlayers = key
+            with self.__lock:
+                pool = self.__pools.get(key)
+            if pool is None:
+                # Evicted since it was asked for
+                continue
+            while self.depth > 0 and not pool.full():
+                try:
+                    seed = self.__seeds.getrandbits(63)
+                    wallChoices = generateWallChoices(self.generator, height, width, seed, cache=False)
+                    pool.put_nowait(MapLayout(height, width, numPlayers, wallChoices, seed))
+                except queue.Full:
+                    break
+                except Exception as e:
+                    print(f'GamePool failed to generate a {height}x{width} layout for {numPlayers} players: {e}')
+                    break
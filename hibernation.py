@@ -0,0 +1,162 @@
+import base64
+import json
+import os
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from typing import Optional
+
+from game import Game
+from gameItems import Wall, Coin1, Coin2, Coin3
+from map import MapLayout
+
+# Codes of the cells of a hibernated map, players are stored apart with their positions
+_ITEMS = (None, Wall, Coin1, Coin2, Coin3)
+_CODES = {item: code for code, item in enumerate(_ITEMS) if item is not None}
+
+
+def encodeGame(game: Game) -> bytes:
+    """
+    Packs a game into a header with the roster, positions and scores, one byte per cell and the wall choices
+    :return: zlib compressed bytes
+    """
+    height, width = game.map.height, game.map.width
+    header = json.dumps({'height': height, 'width': width, 'seed': game.seed,
+                         'visionRadius': game.visionRadius, 'lineOfSight': game.lineOfSight, 'teamVision': game.teamVision,
+                         'roster': {name: [player.name for player in game.all_players.values() if player.team is team]
+                                    for name, team in game.teams.items()},
+                         'positions': [player.loc for player in game.all_players.values()],
+                         'scores': game.getScores(), 'coins': game.getCoins(), 'numCoins': game.map.numCoins, 'numWalls': game.map.numWalls}).encode()
+    cells = bytearray(height * width)
+    for x in range(height):
+        for y in range(width):
+            cells[x * width + y] = _CODES.get(type(game.map.get((x, y))), 0)
+    wallChoices = array('I', [x * width + y for x, y in game.map.wallChoices])
+    return zlib.compress(len(header).to_bytes(4, 'big') + header + bytes(cells) + wallChoices.tobytes())
+
+
+def decodeGame(data: bytes) -> Game:
+    """
+    Rebuilds a game packed by encodeGame, players keep their positions and teams their scores and collected coins
+    """
+    data = zlib.decompress(data)
+    size = int.from_bytes(data[:4], 'big')
+    header = json.loads(data[4:4 + size])
+    height, width = header['height'], header['width']
+    cells = data[4 + size:4 + size + height * width]
+    wallChoices = array('I')
+    wallChoices.frombytes(data[4 + size + height * width:])
+
+    grid = [[_ITEMS[code]() if code else None for code in cells[x * width:(x + 1) * width]] for x in range(height)]
+    layout = MapLayout.restore(grid, [tuple(loc) for loc in header['positions']], header['numCoins'], header['numWalls'],
+                               [divmod(cell, width) for cell in wallChoices], header['seed'])
+    game = Game(header['roster'], width=width, height=height, lineOfSight=header['lineOfSight'], layout=layout,
+                visionRadius=header['visionRadius'], teamVision=header['teamVision'])
+    for name, score in header['scores'].items():
+        if score:
+            game.teams[name].increaseScore(score)
+    for name, coins in header.get('coins', {}).items():
+        if coins:
+            game.teams[name].increaseCoins(coins)
+    return game
+
+
+class LobbyHibernator:
+    LATENCY_WINDOW = 1000
+
+    def __init__(self, directory: str = 'hibernated', idleSeconds: float = 300.0):
+        """
+        Keeps lobbies nobody has sent anything to for a while on disk instead of in memory.
+        Lobbies left on disk by a previous run are picked up again and revive like the others.
+        :param directory: where the hibernated lobbies are written, one file per lobby
+        :param idleSeconds: inactivity after which a lobby may hibernate
+        """
+        self.directory = directory
+        self.idleSeconds = idleSeconds
+        self.hibernations = 0
+        self.revivals = 0
+        self.reviveLatencies: deque = deque(maxlen=LobbyHibernator.LATENCY_WINDOW) # seconds taken by the latest revivals
+        self.__lastActive: dict[str, float] = {}
+        self.__lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.hibernated: set[str] = {self.__lobbyName(file) for file in os.listdir(directory) if file.endswith('.lobby')}
+
+    def touch(self, lobby_name: str):
+        """
+        Records activity of the lobby
+        """
+        self.__lastActive[lobby_name] = time.monotonic()
+
+    def idle(self) -> list[str]:
+        """
+        :return: lobbies whose last activity is older than idleSeconds
+        """
+        deadline = time.monotonic() - self.idleSeconds
+        return [lobby_name for lobby_name, active in list(self.__lastActive.items()) if active < deadline]
+
+    def store(self, lobby_name: str, record: dict, game: Optional[Game]) -> int:
+        """
+        Writes the lobby to disk
+        :param record: JSON-serializable state of the lobby beside its game
+        :return: size of the file in bytes
+        """
+        header = json.dumps(record).encode()
+        data = len(header).to_bytes(4, 'big') + header + (encodeGame(game) if game is not None else b'')
+        path = self.__path(lobby_name)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.tmp', path)
+        with self.__lock:
+            self.hibernated.add(lobby_name)
+            self.__lastActive.pop(lobby_name, None)
+            self.hibernations += 1
+        return len(data)
+
+    def load(self, lobby_name: str) -> tuple[dict, Optional[Game]]:
+        """
+        Reads the lobby back and deletes its file
+        :return: the record and the game given to store()
+        """
+        started = time.perf_counter()
+        path = self.__path(lobby_name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        size = int.from_bytes(data[:4], 'big')
+        record = json.loads(data[4:4 + size])
+        game = decodeGame(data[4 + size:]) if len(data) > 4 + size else None
+        os.remove(path)
+        with self.__lock:
+            self.hibernated.discard(lobby_name)
+            self.revivals += 1
+            self.reviveLatencies.append(time.perf_counter() - started)
+        self.touch(lobby_name)
+        return record, game
+
+    def forget(self, lobby_name: str):
+        self.__lastActive.pop(lobby_name, None)
+        with self.__lock:
+            if lobby_name not in self.hibernated:
+                return
+            self.hibernated.discard(lobby_name)
+        try:
+            os.remove(self.__path(lobby_name))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        latencies = list(self.reviveLatencies)
+        return {'hibernated': len(self.hibernated), 'active': len(self.__lastActive),
+                'hibernations': self.hibernations, 'revivals': self.revivals,
+                'reviveLatency': {'mean': sum(latencies) / len(latencies) if latencies else None,
+                                  'max': max(latencies) if latencies else None}}
+
+    def __path(self, lobby_name: str) -> str:
+        # Lobby names come from clients, encode them so any name is a safe file name
+        return os.path.join(self.directory, base64.urlsafe_b64encode(lobby_name.encode()).decode() + '.lobby')
+
+    @staticmethod
+    def __lobbyName(file: str) -> str:
+        return base64.urlsafe_b64decode(file[:-len('.lobby')]).decode()
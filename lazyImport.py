@@ -0,0 +1,39 @@
+import importlib
+from typing import Optional
+
+
+class _LazyImport:
+    def __init__(self, module: str, attribute: Optional[str]):
+        self._module = module
+        self._attribute = attribute
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            # import_module holds the import lock, threads racing here all get the same module
+            target = importlib.import_module(self._module)
+            self._target = getattr(target, self._attribute) if self._attribute is not None else target
+        return self._target
+
+    def __getattr__(self, name: str):
+        # Only called for names not found on the proxy, keep them so the next lookups are plain attribute reads
+        value = getattr(self._load(), name)
+        setattr(self, name, value)
+        return value
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._module if self._attribute is None else f'{self._module}.{self._attribute}'
+        return f'<lazy {name}, {"loaded" if self._target is not None else "not loaded"}>'
+
+
+def lazyImport(module: str, attribute: Optional[str] = None):
+    """
+    Defers an import until the module, or the attribute of it, is first used.
+    `np = lazyImport('numpy')` stands for `import numpy as np` and
+    `Fore = lazyImport('colorama', 'Fore')` for `from colorama import Fore`.
+    Only attribute reads and calls go through to the target, e.g. isinstance() needs the real object.
+    """
+    return _LazyImport(module, attribute)
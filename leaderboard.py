@@ -0,0 +1,145 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class Leaderboard:
+    BATCH_SIZE = 100
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path: str = 'leaderboard.db', window: int = 100):
+        """
+        Keeps the results of finished games in SQLite.
+        Results are queued and written by a background thread in batches, so recording a game never touches the disk.
+        Aggregates are kept in memory and updated as results come in, so queries never touch the disk either.
+        Every team and player is ranked on their last `window` games only, the database keeps them all.
+        Teams without players are stored with a NULL player, games recorded without their coins with NULL coins,
+        which coinsPerTick leaves out.
+        :param path: path of the SQLite database file
+        :param window: number of most recent games the aggregates of a team or player cover
+        """
+        assert isinstance(window, int) and window > 0
+        self.path = path
+        self.window = window
+        self.__queue: queue.Queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__aggregates = {'teams': {}, 'players': {}}
+        self.__rankings: dict[str, dict[str, list[dict]]] = {} # sorted summaries of every aggregate queried since the last result
+
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                               'lobby TEXT, team TEXT, player TEXT, score INTEGER, won INTEGER, ticks INTEGER, finished REAL, coins INTEGER)')
+            if 'coins' not in [column[1] for column in connection.execute('PRAGMA table_info(results)')]:
+                # Databases from before coins were recorded
+                connection.execute('ALTER TABLE results ADD COLUMN coins INTEGER')
+            for team, score, won, ticks, coins in connection.execute('SELECT team, score, won, ticks, coins FROM results '
+                                                                     'GROUP BY lobby, finished, team ORDER BY finished'):
+                self.__aggregate('teams', team, score, won, ticks, coins)
+            for player, score, won, ticks, coins in connection.execute('SELECT player, score, won, ticks, coins FROM results '
+                                                                       'WHERE player IS NOT NULL ORDER BY finished'):
+                self.__aggregate('players', player, score, won, ticks, coins)
+        connection.close()
+
+        self.__writer = threading.Thread(target=self.__write, name='Leaderboard', daemon=True)
+        self.__writer.start()
+
+    def record(self, lobby_name: str, roster: dict[str, list[str]], scores: dict[str, int], ticks: int,
+               coins: dict[str, int] = None):
+        """
+        :param roster: {'team_name' : [player_name, ...]}
+        :param scores: final scores from Game.getScores()
+        :param ticks: number of ticks the game lasted
+        :param coins: coins every team collected from Game.getCoins(), None if they weren't counted
+        """
+        best = max(scores.values(), default=0)
+        finished = time.time()
+        rows = []
+        with self.__lock:
+            for team, players in roster.items():
+                score = scores.get(team, 0)
+                won = int(score == best)
+                collected = None if coins is None else coins.get(team, 0)
+                self.__aggregate('teams', team, score, won, ticks, collected)
+                if not players:
+                    rows.append((lobby_name, team, None, score, won, ticks, finished, collected))
+                for player in players:
+                    rows.append((lobby_name, team, player, score, won, ticks, finished, collected))
+                    self.__aggregate('players', player, score, won, ticks, collected)
+            self.__rankings.clear()
+        self.__queue.put(rows)
+
+    def query(self, by: str = 'winRate', top: int = 10) -> dict:
+        """
+        :return: {'teams': [...], 'players': [...]} each sorted by the given aggregate and cut to the top entries
+        """
+        with self.__lock:
+            ranking = self.__rankings.get(by)
+            if ranking is None:
+                # Sorted once per aggregate until the next result comes in
+                ranking = self.__rankings[by] = {kind: sorted((self.__summary(name, stats) for name, stats in entries.items()),
+                                                              key=lambda entry: entry[by], reverse=True)
+                                                 for kind, entries in self.__aggregates.items()}
+            return {kind: entries[:top] for kind, entries in ranking.items()}
+
+    def flush(self):
+        """
+        Blocks until every recorded result has been written
+        """
+        self.__queue.join()
+
+    def __aggregate(self, kind: str, name: str, score: int, won: int, ticks: int, coins: int = None):
+        stats = self.__aggregates[kind].get(name)
+        if stats is None:
+            stats = self.__aggregates[kind][name] = {'games': 0, 'wins': 0, 'score': 0, 'ticks': 0, 'coins': 0, 'coinTicks': 0,
+                                                     'recent': deque()}
+        # Ticks of the games whose coins were counted, coinsPerTick is over those only
+        coinTicks = 0 if coins is None else ticks
+        coins = coins or 0
+        if len(stats['recent']) == self.window:
+            # The oldest game leaves the window
+            oldScore, oldWon, oldTicks, oldCoins, oldCoinTicks = stats['recent'].popleft()
+            stats['games'] -= 1
+            stats['wins'] -= oldWon
+            stats['score'] -= oldScore
+            stats['ticks'] -= oldTicks
+            stats['coins'] -= oldCoins
+            stats['coinTicks'] -= oldCoinTicks
+        stats['recent'].append((score, won, ticks, coins, coinTicks))
+        stats['games'] += 1
+        stats['wins'] += won
+        stats['score'] += score
+        stats['ticks'] += ticks
+        stats['coins'] += coins
+        stats['coinTicks'] += coinTicks
+
+    @staticmethod
+    def __summary(name: str, stats: dict) -> dict:
+        return {'name': name,
+                'games': stats['games'],
+                'winRate': stats['wins'] / stats['games'],
+                'averageScore': stats['score'] / stats['games'],
+                'scorePerTick': stats['score'] / stats['ticks'] if stats['ticks'] else 0.0,
+                'coinsPerTick': stats['coins'] / stats['coinTicks'] if stats['coinTicks'] else 0.0}
+
+    def __write(self):
+        connection = sqlite3.connect(self.path)
+        while True:
+            batches = [self.__queue.get()]
+            deadline = time.monotonic() + Leaderboard.FLUSH_INTERVAL
+            while len(batches) < Leaderboard.BATCH_SIZE:
+                try:
+                    batches.append(self.__queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                with connection:
+                    connection.executemany('INSERT INTO results (lobby, team, player, score, won, ticks, finished, coins) '
+                                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                           [row for rows in batches for row in rows])
+            except sqlite3.Error as e:
+                print(f'Leaderboard failed to write {len(batches)} results: {e}')
+            for _ in batches:
+                self.__queue.task_done()
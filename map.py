@@ -7,17 +7,108 @@ from player import Player
 import random
 from gameItems import *
 from typing import Optional
+from mapGenerators import generateWallChoices
+
+def getDefaultWallChoices(height: int = 10, width: int = 10):
+    return generateWallChoices('lattice', height, width)
+
+
+def newSeed() -> int:
+    """
+    :return: a seed drawn from the global generator, for maps created without one
+    """
+    return random.getrandbits(63)
+
+
+class MapLayout:
+    """
+    Walls, coins and spawn points of a map, generated before the players it will hold are known.
+    A layout is consumed by the Map it is given to.
+    """
+    PLACEMENT_TRIES = 100 # random cells tried before picking among the free ones
+    def __init__(self, height: int, width: int, numPlayers: int, wallChoices: list[tuple[int]], seed: Optional[int] = None):
+        """
+        :param seed: Seed of the layout's own generator, the same seed and wall choices always give the same layout
+        """
+        assert isinstance(width, int) and isinstance(height, int) and isinstance(numPlayers, int)
+        self.height = height
+        self.width = width
+        self.wallChoices = wallChoices
+        self.seed = newSeed() if seed is None else seed
+        self.__random = random.Random(self.seed)
+        self.grid: list[list[object]] = [[None for _ in range(width)] for _ in range(height)]
+        self.spawns: list[tuple[int, int]] = []
+        self.numCoins = 0
+        self.numWalls = 0
+
+        self.__fill(numPlayers)
+
+    @classmethod
+    def restore(cls, grid: list[list[object]], spawns: list[tuple[int, int]], numCoins: int, numWalls: int,
+                wallChoices: list[tuple[int]], seed: int) -> 'MapLayout':
+        """
+        Rebuilds the layout of a map that was already played on, e.g. from a hibernated lobby
+        :param spawns: current positions of the players, in the order of the map's players
+        """
+        layout = cls.__new__(cls)
+        layout.height = len(grid)
+        layout.width = len(grid[0])
+        layout.wallChoices = wallChoices
+        layout.grid = grid
+        layout.spawns = spawns
+        layout.numCoins = numCoins
+        layout.numWalls = numWalls
+        layout.seed = seed
+        return layout
+
+    def __fill(self, numPlayers: int):
+        empty = self.width*self.height
 
-def getDefaultWallChoices():
-    wall = []
-    for row in range(1,9):
-        for col in range(1,8,2):
-            wall.append((row,col))
-    for col in range(2,9,2):
-        wall.append((4,col))
-    for row in range(0,9,2):
-        wall.append((row,8))
-    return wall
+        maxWalls = int(Map.WALL_MAX_RATIO * empty)
+        maxWalls = maxWalls if self.wallChoices is None else len(self.wallChoices)
+
+        # Leave a cell for every player and at least one coin
+        if numPlayers >= empty:
+            raise ValueError(f'A {self.height}x{self.width} map has no room for {numPlayers} players and a coin')
+        maxWalls = min(maxWalls, empty - numPlayers - 1)
+
+        minWalls = int(Map.WALL_MIN_RATIO * empty)
+        minWalls = 0 if maxWalls < minWalls else minWalls
+
+        numWalls = self.numWalls = self.__random.randint(minWalls, maxWalls)
+        for x, y in self.__random.sample(self.wallChoices, numWalls):
+            self.grid[x][y] = Wall()
+
+        # Reserve the spawn points so coins can't land on them
+        for _ in range(numPlayers):
+            self.spawns.append(self.__placeRandom(_SPAWN))
+
+        empty = empty - numWalls - numPlayers
+
+        self.numCoins = self.__random.randint(max(int(Map.COIN_MIN_RATIO * empty), 1), max(int(Map.COIN_MAX_RATIO * empty), 1))
+        for _ in range(self.numCoins):
+            coin = self.__random.choices((Coin1, Coin2, Coin3), (6,3,1))[0]()
+            self.__placeRandom(coin)
+
+        for x, y in self.spawns:
+            self.grid[x][y] = None
+
+    def __placeRandom(self, obj):
+        for _ in range(MapLayout.PLACEMENT_TRIES):
+            x, y = self.__random.randint(0, self.height - 1), self.__random.randint(0, self.width - 1)
+            if self.grid[x][y] is None:
+                self.grid[x][y] = obj
+                return x, y
+        # Crowded map, pick among the cells that are left
+        free = [(x, y) for x in range(self.height) for y in range(self.width) if self.grid[x][y] is None]
+        if not free:
+            raise ValueError(f'No free cell left on the {self.height}x{self.width} map')
+        x, y = self.__random.choice(free)
+        self.grid[x][y] = obj
+        return x, y
+
+
+_SPAWN = object()
 
 
 class Map:
@@ -26,23 +117,45 @@ class Map:
     WALL_MIN_RATIO = 0.1
     WALL_MAX_RATIO = 0.3
 
-    def __init__(self, height: int, width: int, playersList: list[Player], wallChoices: list[tuple[int]] = None):
+    def __init__(self, height: int, width: int, playersList: list[Player], wallChoices: list[tuple[int]] = None,
+                 generator: str = 'lattice', seed: Optional[int] = None, layout: Optional[MapLayout] = None):
+        """
+        :param wallChoices: Cells that may hold a wall, generated by the generator when not given
+        :param generator: Name of the wall generator in mapGenerators.GENERATORS
+        :param seed: Seed of the map, it alone decides walls, coins and spawns. Drawn from the global generator when not given
+        :param layout: Pre-generated layout to place the players into, generated on the spot when not given
+        """
         assert isinstance(width, int) and isinstance(height, int)
         assert isinstance(playersList, list)
         self.__height = height
         self.__width = width
-        self.__map: list[list[object]] = [[None for _ in range(width)] for _ in range(height)]
 
-        self.__numCoins = 0
+        if layout is None:
+            # Only wall choices of a requested seed are worth keeping in the generators' cache
+            cache = seed is not None
+            seed = newSeed() if seed is None else seed
+            wallChoices = generateWallChoices(generator, height, width, seed, cache) if wallChoices is None else wallChoices
+            layout = MapLayout(height, width, len(playersList), wallChoices, seed)
+        assert layout.height == height and layout.width == width and len(layout.spawns) == len(playersList)
 
-        self.wallChoices = getDefaultWallChoices() if wallChoices is None else wallChoices
+        self.seed = layout.seed
+        self.wallChoices = layout.wallChoices
+        self.__map: list[list[object]] = layout.grid
+        self.__numCoins = layout.numCoins
+        self.__numWalls = layout.numWalls
 
-        self.__fillMap(playersList)
+        for player, loc in zip(playersList, layout.spawns):
+            self.set(loc, player)
+            player.loc = loc
 
 
     @property
     def numCoins(self):
         return self.__numCoins
+
+    @property
+    def numWalls(self):
+        return self.__numWalls
     
     def decreaseCoin(self):
         self.__numCoins -= 1
@@ -85,46 +198,6 @@ class Map:
         assert isinstance(loc, tuple) and len(loc) == 2 and isinstance(loc[0], int) and isinstance(loc[1], int)
         return self.__map[loc[0]][loc[1]]
 
-    def __fillMap(self, players: list[Player]):
-        assert isinstance(players, list)
-
-        empty = self.__width*self.__height
-
-        maxWalls = int(Map.WALL_MAX_RATIO * empty)
-        maxWalls = maxWalls if self.wallChoices is None else len(self.wallChoices)
-
-        minWalls = int(Map.WALL_MIN_RATIO * empty)
-        minWalls = 0 if maxWalls < minWalls else minWalls
-
-        numWalls = random.randint(minWalls, maxWalls)
-        wallChoices = deepcopy(self.wallChoices)
-        for _ in range(numWalls):
-            self.__placeRandom(Wall(), wallChoices)
-
-        # Fill players
-        for player in players:
-            player.loc = self.__placeRandom(player)
-
-        numPlayers = len(players)
-        empty = empty - numWalls - numPlayers
-
-        self.__numCoins = random.randint(int(Map.COIN_MIN_RATIO * empty), int(Map.COIN_MAX_RATIO * empty))
-        for _ in range(self.__numCoins):
-            coin = random.choices((Coin1, Coin2, Coin3), (6,3,1))[0]()
-            self.__placeRandom(coin)
-
-    def __placeRandom(self, obj, choice: Optional[list] = None):
-        while True:
-            if choice is None:
-                x, y = random.randint(0, self.__height - 1), random.randint(0, self.__width - 1)
-            else:
-                x, y = random.choice(choice)
-                choice.remove((x,y))
-            if self.__map[x][y] is None:
-                self.__map[x][y] = obj
-                return x, y
-
-
 if __name__ == '__main__':
     m = Map(10, 10, [Player('Charles', None), Player('James', None)])
     print(m)
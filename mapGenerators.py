@@ -0,0 +1,136 @@
+"""
+Wall layouts for maps of any size.
+
+Every generator takes (height, width, rng) and returns a boolean NumPy mask of the cells
+that may hold a wall. The map then picks how many of those candidates actually become walls.
+"""
+
+from __future__ import annotations
+from functools import lru_cache
+from typing import Callable, Optional
+
+from lazyImport import lazyImport
+np = lazyImport('numpy') # loaded by the first generated map
+
+
+def lattice(height: int, width: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Columns of walls on every odd column, a crossbar through the middle and a dotted column near the right edge.
+    On a 10x10 board this is the original hand-written wall pattern.
+    """
+    rows = np.arange(height)[:, None]
+    cols = np.arange(width)[None, :]
+    columns = (rows >= 1) & (rows <= height - 2) & (cols % 2 == 1) & (cols <= width - 3)
+    crossbar = (rows == height // 2 - 1) & (cols % 2 == 0) & (cols >= 2) & (cols <= width - 2)
+    edge = (cols == width - 2) & (rows % 2 == 0) & (rows <= height - 2)
+    return columns | crossbar | edge
+
+
+def maze(height: int, width: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Binary tree maze: every cell on an even row and column is open and carves a passage either
+    down or right, everything else is a wall.
+    """
+    mask = np.ones((height, width), dtype=bool)
+    mask[::2, ::2] = False
+
+    roomRows, roomCols = mask[::2, ::2].shape
+    carveDown = rng.random((roomRows, roomCols)) < 0.5
+    # Rooms on the last row can only carve right, rooms on the last column can only carve down
+    carveDown[-1, :] = False
+    carveDown[:, -1] = True
+    carveDown[-1, -1] = False
+
+    r, c = np.nonzero(carveDown)
+    down = (2 * r + 1, 2 * c)
+    r, c = np.nonzero(~carveDown)
+    right = (2 * r, 2 * c + 1)
+
+    inside = down[0] < height
+    mask[down[0][inside], down[1][inside]] = False
+    inside = right[1] < width
+    mask[right[0][inside], right[1][inside]] = False
+    return mask
+
+
+def rooms(height: int, width: int, rng: np.random.Generator, roomSize: int = 5) -> np.ndarray:
+    """
+    Square rooms separated by single walls, with one random door in every wall segment
+    """
+    mask = np.zeros((height, width), dtype=bool)
+    wallRows = np.arange(roomSize - 1, height, roomSize)
+    wallCols = np.arange(roomSize - 1, width, roomSize)
+    mask[wallRows, :] = True
+    mask[:, wallCols] = True
+
+    # Doors in the horizontal walls, one per room-wide segment
+    segments = np.arange(0, width, roomSize)
+    doors = segments[None, :] + rng.integers(0, roomSize - 1, size=(len(wallRows), len(segments)))
+    doorRows = np.broadcast_to(wallRows[:, None], doors.shape)
+    inside = doors < width
+    mask[doorRows[inside], doors[inside]] = False
+
+    # Doors in the vertical walls
+    segments = np.arange(0, height, roomSize)
+    doors = segments[:, None] + rng.integers(0, roomSize - 1, size=(len(segments), len(wallCols)))
+    doorCols = np.broadcast_to(wallCols[None, :], doors.shape)
+    inside = doors < height
+    mask[doors[inside], doorCols[inside]] = False
+    return mask
+
+
+def openField(height: int, width: int, rng: np.random.Generator, density: float = 0.15) -> np.ndarray:
+    """
+    Scattered single walls with no structure
+    """
+    return rng.random((height, width)) < density
+
+
+GENERATORS: dict[str, Callable[[int, int, np.random.Generator], np.ndarray]] = {
+    'lattice': lattice,
+    'maze': maze,
+    'rooms': rooms,
+    'openField': openField,
+}
+
+
+def registerGenerator(name: str, generator: Callable[[int, int, np.random.Generator], np.ndarray]):
+    assert isinstance(name, str) and callable(generator)
+    GENERATORS[name] = generator
+    _cachedWallChoices.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def _cachedWallChoices(generator: str, height: int, width: int, seed: int) -> tuple[tuple[int, int], ...]:
+    return _wallChoices(generator, height, width, seed)
+
+
+def _wallChoices(generator: str, height: int, width: int, seed: Optional[int]) -> tuple[tuple[int, int], ...]:
+    mask = GENERATORS[generator](height, width, np.random.default_rng(seed))
+    rows, cols = np.nonzero(mask)
+    return tuple(zip(rows.tolist(), cols.tolist()))
+
+
+def generateWallChoices(generator: str, height: int, width: int, seed: Optional[int] = None, cache: bool = True) -> list[tuple[int, int]]:
+    """
+    :param generator: name of a registered generator
+    :param seed: layouts with a seed are memoized, without one a fresh layout is generated every time
+    :param cache: memoize a seeded layout, turn off for one-off seeds so they don't evict the useful ones
+    :return: list of (row, col) cells that may hold a wall
+    """
+    assert isinstance(height, int) and isinstance(width, int)
+    if generator not in GENERATORS:
+        raise KeyError(f'{generator} is not a valid map generator')
+    if seed is None or not cache:
+        return list(_wallChoices(generator, height, width, seed))
+    return list(_cachedWallChoices(generator, height, width, seed))
+
+
+def spawnSeeds(seed: Optional[int], count: int) -> list[int]:
+    """
+    Derives independent seeds, e.g. one per game of a batch or per worker, from a single one
+    :param seed: root seed, None for fresh entropy
+    :return: count 64 bit seeds
+    """
+    children = np.random.SeedSequence(seed).spawn(count)
+    return [int(child.generate_state(1, np.uint64)[0]) for child in children]
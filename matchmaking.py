@@ -0,0 +1,158 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Container, Optional
+
+
+class _Entry:
+    __slots__ = ('player', 'team', 'joined')
+
+    def __init__(self, player: str, team: Optional[str], joined: float):
+        self.player = player
+        self.team = team
+        self.joined = joined
+
+
+class Matchmaker:
+    WAIT_WINDOW = 1000
+
+    def __init__(self, lobbySize: int = 4, teams: int = 2, maxWait: float = 10.0, startDelay: float = 1.0):
+        """
+        Queue of players waiting for a game, batched into lobbies by match().
+
+        Lobbies have `teams` teams of lobbySize / teams players. Players who asked for a team play in it together,
+        as many of them as fit, everyone else fills the teams oldest first. A lobby is only formed once it is full,
+        so half-filled lobbies never pile up, unless its oldest player has waited maxWait seconds. It is then formed
+        with whoever is there, as long as every team has a player and no team has two more than another.
+        :param startDelay: seconds between forming a lobby and starting it, for the players to subscribe to it
+        """
+        assert lobbySize % teams == 0 and teams >= 2
+        self.lobbySize = lobbySize
+        self.teams = teams
+        self.maxWait = maxWait
+        self.startDelay = startDelay
+        self.lobbies = 0
+        self.matched = 0
+        self.waits: deque = deque(maxlen=Matchmaker.WAIT_WINDOW) # seconds the latest matched players waited
+        self.__queue: dict[str, _Entry] = {} # in the order the players joined
+        self.__starts: deque = deque() # (time, lobby_name) of the formed lobbies waiting to start
+        self.__ids = itertools.count(1)
+        self.__lock = threading.Lock()
+
+    def enqueue(self, player_name: str, team_name: Optional[str] = None, now: float = None):
+        """
+        Adds the player to the queue, a player already queued keeps their place and only changes their team
+        :param team_name: team the player wants to play in, None for any
+        """
+        now = time.monotonic() if now is None else now
+        with self.__lock:
+            entry = self.__queue.get(player_name)
+            if entry is None:
+                self.__queue[player_name] = _Entry(player_name, team_name, now)
+            else:
+                entry.team = team_name
+
+    def leave(self, player_name: str) -> bool:
+        """
+        :return: False if the player wasn't queued
+        """
+        with self.__lock:
+            return self.__queue.pop(player_name, None) is not None
+
+    def match(self, taken: Container[str] = (), now: float = None) -> list[dict]:
+        """
+        Forms as many lobbies as the queue allows and takes their players out of it
+        :param taken: lobby names already in use
+        :return: [{'lobby_name', 'teams': {'team_name' : [player_name, ...]}}], every lobby is scheduled to start after startDelay
+        """
+        now = time.monotonic() if now is None else now
+        perTeam = self.lobbySize // self.teams
+        lobbies = []
+        with self.__lock:
+            # Built once per batch, forming a lobby then only consumes from the front of these
+            solos: deque = deque()
+            groups: dict[str, deque] = {}
+            for entry in self.__queue.values():
+                if entry.team is None:
+                    solos.append(entry)
+                else:
+                    groups.setdefault(entry.team, deque()).append(entry)
+            # Heap of the teams asked for by the wait of their oldest player, in join order it already is one
+            order = [(members[0].joined, i, team_name) for i, (team_name, members) in enumerate(groups.items())]
+
+            while True:
+                teams = self.__form(solos, groups, order, perTeam, now)
+                if teams is None:
+                    break
+                lobby_name = next(name for name in (f'match-{i}' for i in self.__ids) if name not in taken)
+                roster = {}
+                for team_name, entries in teams.items():
+                    roster[team_name] = [entry.player for entry in entries]
+                    for entry in entries:
+                        del self.__queue[entry.player]
+                        self.waits.append(now - entry.joined)
+                        self.matched += 1
+                self.lobbies += 1
+                self.__starts.append((now + self.startDelay, lobby_name))
+                lobbies.append({'lobby_name': lobby_name, 'teams': roster})
+        return lobbies
+
+    def due(self, now: float = None) -> list[str]:
+        """
+        :return: the formed lobbies whose start delay is over, each is only returned once
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        with self.__lock:
+            while self.__starts and self.__starts[0][0] <= now:
+                due.append(self.__starts.popleft()[1])
+        return due
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        now = time.monotonic()
+        oldest = min((entry.joined for entry in list(self.__queue.values())), default=None)
+        return {'queued': len(self.__queue), 'oldestWait': None if oldest is None else now - oldest,
+                'lobbies': self.lobbies, 'matched': self.matched,
+                'timeToMatch': {'mean': sum(waits) / len(waits) if waits else None,
+                                'p95': waits[int(len(waits) * 0.95)] if waits else None,
+                                'max': waits[-1] if waits else None}}
+
+    def __form(self, solos: deque, groups: dict[str, deque], order: list, perTeam: int, now: float) -> Optional[dict[str, list[_Entry]]]:
+        """
+        Picks the players of the next lobby and takes them off the front of solos, groups and order
+        :return: {'team_name' : [entry, ...]}, None if no lobby can be formed yet
+        """
+        # Teams asked for go first, the ones with the oldest players first
+        picked = [heapq.heappop(order) for _ in range(min(self.teams, len(order)))]
+        teams: dict[str, list[_Entry]] = {team_name: list(itertools.islice(groups[team_name], perTeam)) for _, _, team_name in picked}
+        grouped = {team_name: len(members) for team_name, members in teams.items()}
+        generated = (f'Team{i}' for i in itertools.count(1))
+        while len(teams) < self.teams:
+            team_name = next(name for name in generated if name not in teams and name not in groups)
+            teams[team_name] = []
+
+        # Everyone else fills the smallest team
+        fill = list(itertools.islice(solos, sum(perTeam - len(members) for members in teams.values())))
+        for entry in fill:
+            min(teams.values(), key=len).append(entry)
+
+        size = sum(len(members) for members in teams.values())
+        sizes = [len(members) for members in teams.values()]
+        if size < self.lobbySize and (size == 0 or min(sizes) == 0 or max(sizes) - min(sizes) > 1
+                                      or now - min(entry.joined for members in teams.values() for entry in members) < self.maxWait):
+            for item in picked:
+                heapq.heappush(order, item)
+            return None
+
+        for _ in fill:
+            solos.popleft()
+        for _, i, team_name in picked:
+            members = groups[team_name]
+            for _ in range(grouped[team_name]):
+                members.popleft()
+            if members:
+                heapq.heappush(order, (members[0].joined, i, team_name))
+        return teams
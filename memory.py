@@ -0,0 +1,105 @@
+import gc
+import json
+import sys
+import tracemalloc
+from typing import Callable, Optional
+
+from gameItems import Wall, Coin1
+from map import Map
+from player import Player
+from publisher import PublishPipeline
+from team import Team
+
+# Sizes of the objects a lobby is made of, taken once from sample objects
+_SAMPLE_PLAYER = Player('player_name', Team('team_name'))
+ROW_BYTES = sys.getsizeof([]) # a grid row without its cells
+CELL_BYTES = sys.getsizeof([None]) - ROW_BYTES # one pointer in a grid row
+ITEM_BYTES = max(sys.getsizeof(Wall()), sys.getsizeof(Coin1()))
+PLAYER_BYTES = sys.getsizeof(_SAMPLE_PLAYER) + sys.getsizeof(vars(_SAMPLE_PLAYER)) + sys.getsizeof(_SAMPLE_PLAYER.name)
+TEAM_BYTES = sys.getsizeof(_SAMPLE_PLAYER.team) + sys.getsizeof(vars(_SAMPLE_PLAYER.team))
+WALL_CHOICE_BYTES = sys.getsizeof((0, 0)) + CELL_BYTES # a candidate wall cell kept by the map
+MOVE_BYTES = 200 # a pending move: raw payload, key and dict slot
+OBSERVATION_BYTES = sys.getsizeof('') + 200 # a serialized game_state without its positions: keys, names and topic
+OBSERVATION_CELL_BYTES = 12 # one position of a serialized game_state, e.g. "[12, 34], "
+
+
+def estimate_bytes(height: int, width: int, num_players: int, num_teams: int, num_walls: int, num_coins: int,
+                   num_wall_choices: int, num_moves: int = 0, num_observations: int = 0, vision_radius: int = 2) -> int:
+    """
+    :param num_moves: moves held for the lobby, pending and in queued ticks
+    :param num_observations: serialized game_states held at once, every cell of their window listed
+    """
+    return (ROW_BYTES * (height + 1) + CELL_BYTES * height * width
+            + ITEM_BYTES * (num_walls + num_coins)
+            + WALL_CHOICE_BYTES * num_wall_choices
+            + PLAYER_BYTES * num_players + TEAM_BYTES * num_teams
+            + MOVE_BYTES * num_moves
+            + (OBSERVATION_BYTES + OBSERVATION_CELL_BYTES * (2 * vision_radius + 1) ** 2) * num_observations)
+
+
+class MemoryAccountant:
+    def __init__(self, lobby_budget: int, total_budget: Optional[int] = None, audit: bool = False):
+        """
+        Approximates the memory of every lobby from its counts of cells and objects.
+        :param lobby_budget: largest estimate, in bytes, a single lobby is allowed to start with
+        :param total_budget: largest estimate, in bytes, of all lobbies together, None for no limit
+        :param audit: also measure every new lobby with tracemalloc, to check the estimates against
+        """
+        self.lobby_budget = lobby_budget
+        self.total_budget = total_budget
+        self.audit_mode = audit
+        self.reserved: dict[str, int] = {} # estimate of every lobby when it started
+        self.audited: dict[str, int] = {} # bytes tracemalloc saw allocated by the lobby's game built from scratch and a tick of game states
+        if audit and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def admit(self, lobby_name: str, height: int, width: int, num_players: int, num_teams: int, vision_radius: int = 2) -> Optional[str]:
+        """
+        Reserves the worst case estimate of a new game
+        :return: why the lobby is refused, or None if it fits the budgets
+        """
+        cells = height * width
+        # Every cell may be a wall choice and the map draws up to all of them as walls, a cell holds one item at most
+        coins = int(Map.COIN_MAX_RATIO * cells)
+        # A pending move per player and full queued ticks, the game states of the tick being published
+        worst = estimate_bytes(height, width, num_players, num_teams, cells - coins, coins, cells,
+                               num_players * (1 + PublishPipeline.MAX_QUEUED_TICKS), num_players, vision_radius)
+        if worst > self.lobby_budget:
+            return f"Estimated memory of {worst} bytes exceeds the lobby budget of {self.lobby_budget} bytes"
+        total = sum(self.reserved.values()) - self.reserved.get(lobby_name, 0) + worst
+        if self.total_budget is not None and total > self.total_budget:
+            return "Not enough memory left for a new lobby, try again later"
+        self.reserved[lobby_name] = worst
+        return None
+
+    def audit(self, lobby_name: str, build: Callable):
+        """
+        Measures what a game of the lobby allocates when in audit mode, does nothing otherwise.
+        The game is built from scratch, pooled layouts would hide the cost of the map, and is kept alive with the
+        serialized game states of one tick while measured
+        :param build: builds the game without a pooled layout
+        """
+        if not self.audit_mode:
+            return
+        # Garbage collected while measuring would count against the lobby
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        game = build()
+        observations = [json.dumps(game.getGameData(player)) for player in game.all_players]
+        after = tracemalloc.take_snapshot()
+        self.audited[lobby_name] = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        del game, observations
+
+    def measure(self, game, pending_moves: dict, queued_ticks: int = 0) -> int:
+        """
+        :param queued_ticks: ticks of the game waiting in the publish pipeline
+        :return: estimate of a running game from its current counts
+        """
+        num_players = len(game.all_players)
+        return estimate_bytes(game.map.height, game.map.width, num_players, len(game.teams),
+                              game.map.numWalls, game.map.numCoins, len(game.map.wallChoices),
+                              len(pending_moves) + num_players * queued_ticks, num_players if queued_ticks else 0, game.visionRadius)
+
+    def forget_lobby(self, lobby_name: str):
+        self.reserved.pop(lobby_name, None)
+        self.audited.pop(lobby_name, None)
@@ -0,0 +1,202 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# cProfile can only run one profile at a time in a process since Python 3.12, whatever the thread
+_DETERMINISTIC = threading.Lock()
+
+
+class _Session:
+    def __init__(self, lobby_name: str, ticks: int, mode: str, on_finished=None):
+        self.lobby_name = lobby_name
+        self.remaining = ticks
+        self.mode = mode
+        self.on_finished = on_finished
+        self.ended = False # no more ticks are counted, the profile is written once busy drops to 0
+        self.written = False
+        self.started = time.time()
+        self.profile: cProfile.Profile = None # used by one thread at a time, see _DETERMINISTIC
+        self.threads: set[int] = set() # threads currently working on the lobby that are sampled
+        self.busy = 0 # threads between enable and disable
+        self.samples: Counter = Counter()
+        self.lock = threading.Lock()
+
+
+class LobbyProfiler:
+    SAMPLE_INTERVAL = 0.001
+    SUMMARY_SIZE = 15
+
+    def __init__(self, directory: str = 'profiles'):
+        """
+        Profiles the handling of single lobbies for a given number of ticks.
+        Nothing is hooked while no lobby is being profiled, callers only check whether `active` is empty.
+        Deterministic sessions run cProfile on one thread at a time, threads working on the lobby meanwhile,
+        e.g. the workers of the publish pipeline, are sampled instead.
+        :param directory: where the profiles are written
+        """
+        self.directory = directory
+        self.active: dict[str, _Session] = {}
+        self.__lock = threading.Lock()
+        self.__sampler = None
+
+    def start(self, lobby_name: str, ticks: int, mode: str = 'deterministic', on_finished=None):
+        """
+        :param mode: 'deterministic' records every call with cProfile, 'sampling' periodically records the stacks
+        :param on_finished: called with the summary of the session once its profile is written, on a thread of its own
+        """
+        assert mode in ('deterministic', 'sampling')
+        with self.__lock:
+            self.active[lobby_name] = _Session(lobby_name, ticks, mode, on_finished)
+            if self.__sampler is None:
+                self.__sampler = threading.Thread(target=self.__sample, name='LobbyProfiler', daemon=True)
+                self.__sampler.start()
+
+    def enable(self, lobby_name: str, sampled: bool = False):
+        """
+        Starts recording the current thread's work on the lobby
+        :param sampled: sample the thread even in a deterministic session, for threads working on several lobbies
+        :return: token for disable(), None if the lobby isn't being profiled
+        """
+        session = self.active.get(lobby_name)
+        if session is None:
+            return None
+        with session.lock:
+            session.busy += 1
+            profile = None
+            if session.mode == 'deterministic' and not sampled and _DETERMINISTIC.acquire(blocking=False):
+                if session.profile is None:
+                    session.profile = cProfile.Profile()
+                profile = session.profile
+        if profile is not None:
+            try:
+                profile.enable()
+                return session, profile
+            except ValueError:
+                # Another profiler of the process, e.g. a debugger or coverage, holds the hooks
+                _DETERMINISTIC.release()
+        with session.lock:
+            session.threads.add(threading.get_ident())
+        return session, None
+
+    def disable(self, token):
+        if token is None:
+            return
+        session, profile = token
+        if profile is not None:
+            profile.disable()
+            _DETERMINISTIC.release()
+        with session.lock:
+            session.threads.discard(threading.get_ident())
+            session.busy -= 1
+        self.__writeWhenIdle(session)
+
+    def tick(self, lobby_name: str):
+        """
+        Counts a profiled tick of the lobby, the session finishes after its last one
+        """
+        session = self.active.get(lobby_name)
+        if session is None:
+            return
+        with session.lock:
+            session.remaining -= 1
+            if session.remaining > 0:
+                return
+        self.finish(lobby_name)
+
+    def finish(self, lobby_name: str):
+        """
+        Ends the lobby's session, e.g. when its game is over before the requested number of ticks.
+        Its profile is written on a thread of its own once every thread working on the lobby is done, see on_finished
+        """
+        with self.__lock:
+            session = self.active.pop(lobby_name, None)
+        if session is None:
+            return
+        with session.lock:
+            session.ended = True
+        self.__writeWhenIdle(session)
+
+    def __writeWhenIdle(self, session: _Session):
+        with session.lock:
+            if not session.ended or session.busy > 0 or session.written:
+                return
+            session.written = True
+        threading.Thread(target=self.__write, args=(session,), name='LobbyProfiler-write', daemon=True).start()
+
+    def __write(self, session: _Session):
+        summary = self.__summarize(session)
+        if session.on_finished is not None:
+            session.on_finished(summary)
+
+    def __summarize(self, session: _Session) -> dict:
+        """
+        Writes the profile of the session, a deterministic one also writes the stacks of its sampled threads if it has any
+        :return: {'lobby', 'mode', 'duration', 'path', 'top': [...]}, and 'sampledPath', 'sampledTop' for those stacks
+        """
+        lobby_name = session.lobby_name
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f'{lobby_name}-{time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started))}')
+        summary = {'lobby': lobby_name, 'mode': session.mode, 'duration': time.time() - session.started}
+        with session.lock:
+            samples = Counter(session.samples)
+        if session.mode == 'sampling':
+            summary['path'], summary['top'] = self.__writeSamples(base, samples)
+            return summary
+
+        summary['path'] = base + '.prof'
+        summary['top'] = []
+        if session.profile is not None:
+            stats = pstats.Stats(session.profile, stream=io.StringIO())
+            stats.dump_stats(summary['path'])
+            entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            for (filename, line, function), (_, calls, total, cumulative, _) in entries[:LobbyProfiler.SUMMARY_SIZE]:
+                summary['top'].append({'function': f'{os.path.basename(filename)}:{line}({function})',
+                                       'calls': calls, 'totalTime': total, 'cumulativeTime': cumulative})
+        if samples:
+            summary['sampledPath'], summary['sampledTop'] = self.__writeSamples(base, samples)
+        return summary
+
+    @staticmethod
+    def __writeSamples(base: str, samples: Counter) -> tuple[str, list]:
+        """
+        Writes folded stacks, one "outer;...;inner count" line per stack, as read by flame graph tools
+        :return: the path and the functions most often on top of the stacks
+        """
+        path = base + '.folded'
+        with open(path, 'w') as file:
+            for stack, count in samples.items():
+                file.write(f'{";".join(stack)} {count}\n')
+        leaves = Counter()
+        for stack, count in samples.items():
+            leaves[stack[-1]] += count
+        return path, [{'function': function, 'samples': count} for function, count in leaves.most_common(LobbyProfiler.SUMMARY_SIZE)]
+
+    def __sample(self):
+        while True:
+            time.sleep(LobbyProfiler.SAMPLE_INTERVAL)
+            with self.__lock:
+                sessions = list(self.active.values())
+                if not sessions:
+                    # Nothing left to sample, the next sampling session starts a new thread
+                    self.__sampler = None
+                    return
+            sessions = [session for session in sessions if session.threads]
+            if not sessions:
+                continue
+            frames = sys._current_frames()
+            for session in sessions:
+                with session.lock:
+                    for thread in session.threads:
+                        frame = frames.get(thread)
+                        stack = []
+                        while frame is not None:
+                            code = frame.f_code
+                            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                            frame = frame.f_back
+                        if stack:
+                            session.samples[tuple(reversed(stack))] += 1
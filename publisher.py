@@ -0,0 +1,168 @@
+import json
+import queue
+import threading
+from collections import deque
+
+from tracing import Tracer, correlationProperties
+
+
+class PublishPipeline:
+    MAX_QUEUED_TICKS = 4
+
+    def __init__(self, client, workers: int = 4, profiler=None, tracer: Tracer = None):
+        """
+        Resolves, builds, serializes and publishes the ticks of every lobby on worker threads,
+        so the network loop thread only has to collect moves and never waits on a game.
+
+        Every lobby has its own queue of ticks. A worker takes the lobby, runs its next tick and puts it back at the
+        end of the line if it has more, so a lobby's ticks run one at a time and in order, and a busy lobby can't hold
+        a worker while the others wait. The workers publish through the client, whose network thread writes the packets.
+        :param client: the paho client to publish with
+        :param workers: number of worker threads
+        :param profiler: LobbyProfiler whose sessions also cover the work done here
+        :param tracer: Tracer recording the resolving, building, serializing and publishing of every tick
+        """
+        assert isinstance(workers, int) and workers > 0
+        self.client = client
+        self.profiler = profiler
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.__jobs: dict[str, deque] = {} # queued ticks of every lobby
+        self.__scheduled: set[str] = set() # lobbies waiting for a worker or being run by one
+        self.__running: set[str] = set() # lobbies being run by a worker
+        self.__ready: queue.Queue = queue.Queue() # lobbies waiting for a worker, in the order they got ticks
+        self.__lock = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self.__run, name=f'PublishPipeline-{i}', daemon=True).start()
+
+    def submit(self, lobby_name: str, game, players: list[str], messages: list[tuple[str, str]] = (), show_map: bool = True,
+               correlations: dict[str, str] = None, tick: int = None, resolve=None):
+        """
+        Queues a tick of the lobby, returns right away
+        :param players: players to send their game_state to, in team vision games their teams get one in their place
+        :param messages: (topic, payload) published after the game states, in order
+        :param show_map: print the map once the game states are built
+        :param correlations: {'player_name' : correlation id} of the moves of the tick, sent back with the players' game_state
+        :param tick: number of the tick, shown on its spans
+        :param resolve: called on the worker before the game states are built, e.g. to apply the tick's moves.
+                        Returns more (topic, payload) to publish after the messages, or None to drop the tick
+        """
+        job = (game, players, list(messages), show_map, correlations or {}, tick, resolve)
+        with self.__lock:
+            self.__jobs.setdefault(lobby_name, deque()).append(job)
+            if lobby_name not in self.__scheduled:
+                self.__scheduled.add(lobby_name)
+                self.__ready.put(lobby_name)
+
+    def pending(self, lobby_name: str) -> int:
+        """
+        :return: number of ticks of the lobby queued or running
+        """
+        with self.__lock:
+            return len(self.__jobs.get(lobby_name, ())) + (lobby_name in self.__running)
+
+    def full(self, lobby_name: str) -> bool:
+        """
+        :return: True if the lobby has MAX_QUEUED_TICKS ticks waiting, its next tick should wait for them
+        """
+        return self.pending(lobby_name) >= PublishPipeline.MAX_QUEUED_TICKS
+
+    def forget_lobby(self, lobby_name: str):
+        """
+        Drops the queued ticks of the lobby, the one running is still published
+        """
+        with self.__lock:
+            self.__jobs.pop(lobby_name, None)
+            self.__lock.notify_all()
+
+    def flush(self, lobby_name: str = None):
+        """
+        Blocks until every queued tick of the lobby, or of every lobby, has been published
+        """
+        with self.__lock:
+            if lobby_name is None:
+                self.__lock.wait_for(lambda: not self.__scheduled)
+            else:
+                self.__lock.wait_for(lambda: lobby_name not in self.__jobs and lobby_name not in self.__running)
+
+    def __run(self):
+        while True:
+            lobby_name = self.__ready.get()
+            with self.__lock:
+                jobs = self.__jobs.get(lobby_name)
+                job = jobs.popleft() if jobs else None
+                if job is not None:
+                    self.__running.add(lobby_name)
+
+            if job is not None:
+                try:
+                    self.__process(lobby_name, *job)
+                except Exception as e:
+                    print(f'PublishPipeline failed to publish a tick of {lobby_name}: {e}')
+
+            with self.__lock:
+                self.__running.discard(lobby_name)
+                jobs = self.__jobs.get(lobby_name)
+                if jobs:
+                    # Back of the line, the other lobbies get a worker first
+                    self.__ready.put(lobby_name)
+                else:
+                    self.__jobs.pop(lobby_name, None)
+                    self.__scheduled.discard(lobby_name)
+                self.__lock.notify_all()
+
+    def __process(self, lobby_name: str, game, players: list[str], messages: list[tuple[str, str]], show_map: bool,
+                  correlations: dict[str, str], tick: int, resolve):
+        tracer = self.tracer
+        token = None
+        try:
+            # Workers serve several lobbies at once, they are sampled so no two of them run cProfile together
+            token = self.profiler.enable(lobby_name, sampled=True) if self.profiler is not None and self.profiler.active else None
+            if resolve is not None:
+                with tracer.span('tick', lobby=lobby_name, tick=tick):
+                    resolved = resolve()
+                if resolved is None:
+                    return
+                messages = messages + resolved
+            with tracer.span('serialize', lobby=lobby_name, tick=tick):
+                batch = self.__build(lobby_name, game, players, correlations)
+            if show_map:
+                print(game.map)
+        except Exception as e:
+            print(f'PublishPipeline failed to build the game states of {lobby_name}: {e}')
+            batch = []
+        finally:
+            if token is not None:
+                self.profiler.disable(token)
+                # Counted once the work is done, the session's last tick is all in its profile
+                self.profiler.tick(lobby_name)
+
+        for topic, payload, properties in batch + [(topic, payload, None) for topic, payload in messages]:
+            with tracer.span('publish', topic=topic):
+                self.client.publish(topic, payload, properties=properties)
+
+    def __build(self, lobby_name: str, game, players: list[str], correlations: dict[str, str]) -> list[tuple]:
+        """
+        :return: (topic, payload, properties) of the game states of the tick
+        """
+        tracer = self.tracer
+        batch = []
+        if game.teamVision:
+            # One observation per team, then just the position of every player
+            for team in dict.fromkeys(game.getPlayer(player).team.name for player in players):
+                with tracer.span('getTeamGameData', team=team):
+                    game_state = game.getTeamGameData(team)
+                with tracer.span('json.dumps', team=team):
+                    batch.append((f'games/{lobby_name}/team/{team}/game_state', json.dumps(game_state), None))
+            for player in players:
+                batch.append((f'games/{lobby_name}/{player}/game_state', json.dumps({'currentPosition': game.getPlayer(player).loc}),
+                              correlationProperties(correlations[player]) if player in correlations else None))
+            return batch
+
+        for player in players:
+            with tracer.span('getGameData', player=player):
+                game_state = game.getGameData(player)
+            with tracer.span('json.dumps', player=player):
+                payload = json.dumps(game_state)
+            batch.append((f'games/{lobby_name}/{player}/game_state', payload,
+                          correlationProperties(correlations[player]) if player in correlations else None))
+        return batch
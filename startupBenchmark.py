@@ -0,0 +1,66 @@
+"""
+Cold start time of the entry points, each imported in a fresh interpreter like a newly spawned bot or server.
+python startupBenchmark.py [--runs N] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ('GameClient', 'PlayerClient', 'AutomationClient')
+HEAVY_MODULES = ('numpy', 'pydantic', 'paho.mqtt.client', 'dotenv', 'colorama', 'sqlite3')
+
+# Run in the child: imports the entry point and reports which heavy modules came with it
+_PROBE = """
+import sys, json
+import {module}
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    """
+    :return: {'module', 'median', 'best', 'loaded'}, times in milliseconds
+    """
+    times = []
+    loaded = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        times.append((time.perf_counter() - start) * 1000)
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return {'module': module, 'median': statistics.median(times), 'best': min(times), 'loaded': loaded}
+
+
+def measure_interpreter(runs: int) -> float:
+    """
+    :return: median milliseconds of a bare interpreter start, the floor every entry point pays
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    baseline = measure_interpreter(args.runs)
+    results = [measure(module, args.runs) for module in ENTRY_POINTS]
+    if args.json:
+        print(json.dumps({'interpreter': baseline, 'entryPoints': results}))
+    else:
+        print(f'{"interpreter":<18}{baseline:>9.1f} ms')
+        for result in results:
+            print(f'{result["module"]:<18}{result["median"]:>9.1f} ms  (+{result["median"] - baseline:.1f} ms, best {result["best"]:.1f} ms)'
+                  f'  loaded: {", ".join(result["loaded"]) or "-"}')
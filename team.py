@@ -14,6 +14,7 @@ class Team:
         self.__name = teamName
         self.players: list[Player] = []
         self.__score = 0
+        self.__coins = 0
 
     @property
     def name(self):
@@ -23,6 +24,10 @@ class Team:
     def score(self):
         return self.__score
 
+    @property
+    def coins(self):
+        return self.__coins
+
     def addPlayer(self, player: Player):
         assert isinstance(player, Player)
         self.players.append(player)
@@ -30,3 +35,7 @@ class Team:
     def increaseScore(self, value: int):
         assert isinstance(value, int)
         self.__score += value
+
+    def increaseCoins(self, count: int = 1):
+        assert isinstance(count, int)
+        self.__coins += count
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import GameClient
+from leaderboard import Leaderboard
+
+
+class Message:
+    def __init__(self, topic: str, payload):
+        self.topic = topic
+        self.payload = payload if isinstance(payload, bytes) else payload.encode()
+        self.qos = 0
+        self.properties = None
+
+
+class FakeClient:
+    """
+    Stands in for the paho client of the server, records what is published instead of sending it
+    """
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload))
+
+    def send(self, topic: str, payload):
+        GameClient.on_message(self, None, Message(topic, payload if isinstance(payload, (str, bytes)) else json.dumps(payload)))
+
+    def payloads(self, topic: str) -> list:
+        return [payload for published, payload in self.published if published == topic]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """
+    A server with the state of GameClient.init_client, writing everything under tmp_path
+    """
+    monkeypatch.setenv('HIBERNATE_DIR', str(tmp_path / 'hibernated'))
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setenv('GAME_POOL_DEPTH', '0')
+    client = FakeClient()
+    GameClient.init_client(client, leaderboard=Leaderboard(str(tmp_path / 'leaderboard.db')))
+    yield client
+    client.publisher.flush()
+
+
+def join(server, lobby_name: str, teams: dict):
+    """
+    Adds the players of {'team_name' : [player_name, ...]} to the lobby
+    """
+    for team, players in teams.items():
+        for player in players:
+            server.send('new_game', {'lobby_name': lobby_name, 'team_name': team, 'player_name': player})
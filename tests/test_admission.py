@@ -0,0 +1,56 @@
+from admission import AdmissionController, BucketTable, TokenBucket
+from conftest import join
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.take(bucket.stamp) and bucket.take(bucket.stamp)
+    assert not bucket.take(bucket.stamp)
+    assert bucket.take(bucket.stamp + 1)
+
+
+def test_spamming_player_keeps_the_lobby_share():
+    admission = AdmissionController()
+    players = {'a': None, 'b': None}
+    spam = [admission.admit(['games', 'L', 'a', 'move'], players) for _ in range(50)]
+    assert spam.count(True) == AdmissionController.PLAYER_BURST
+    assert admission.admit(['games', 'L', 'b', 'move'], players)
+    assert admission.dropped == 50 - AdmissionController.PLAYER_BURST
+
+
+def test_unknown_names_share_one_bucket_of_the_lobby():
+    admission = AdmissionController()
+    for i in range(50):
+        admission.admit(['games', 'L', f'fake{i}', 'move'], {'a': None})
+    assert set(admission.player_buckets) == {('L', None)}
+    assert admission.admit(['games', 'L', 'a', 'move'], {'a': None})
+
+
+def test_new_game_buckets_are_per_lobby():
+    admission = AdmissionController()
+    burst = int(AdmissionController.ROUTE_BURST)
+    assert all(admission.admit(['new_game'], lobby_name='flooded') for _ in range(burst))
+    assert not admission.admit(['new_game'], lobby_name='flooded')
+    assert admission.admit(['new_game'], lobby_name='other')
+
+
+def test_unknown_lobbies_have_their_own_buckets():
+    admission = AdmissionController()
+    while admission.admit(['games', 'ghost', 'start'], None):
+        pass
+    assert admission.admit(['games', 'other', 'start'], None)
+
+
+def test_bucket_table_is_bounded():
+    table = BucketTable(1, 1, max_keys=3)
+    for i in range(10):
+        table.get(i)
+    assert len(table) == 3 and list(table.buckets) == [7, 8, 9]
+
+
+def test_overloaded_lobby_is_notified_once(server):
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    for _ in range(50):
+        server.send('games/L/a/move', 'UP')
+    assert server.payloads('games/L/lobby').count('Error: Overloaded: messages are being dropped, slow down') == 1
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import AutomationClient
+from batchPolicy import MOVES, chooseDirections
+from worldModel import CELL_NAMES, EMPTY, WALL, COIN1, COIN2, COIN3, TEAMMATE, ENEMY, PLAYER, OUTSIDE, UNKNOWN
+
+CELLS = np.array([EMPTY, WALL, COIN1, COIN2, COIN3, TEAMMATE, ENEMY, OUTSIDE, UNKNOWN, PLAYER], dtype=np.int8)
+
+
+@pytest.mark.parametrize('frequencies', [
+    [0.5, 0.2, 0.05, 0.03, 0.02, 0.05, 0.05, 0.05, 0.03, 0.02], # a busy board
+    [0.1, 0.3, 0.01, 0.01, 0.01, 0.15, 0.15, 0.2, 0.05, 0.02], # mostly blocked, random moves
+])
+def test_matches_choose_direction(monkeypatch, frequencies):
+    rng = np.random.default_rng(0)
+    codes = rng.choice(CELLS, size=(20000, 5, 5), p=frequencies)
+    codes[:, 2, 2] = PLAYER
+    moves = chooseDirections(codes, rng)
+
+    # The random choices of choose_direction come back as the directions it picks from
+    monkeypatch.setattr(AutomationClient.random, 'choice', lambda directions: tuple(directions))
+    for view, move in zip(codes.tolist(), moves):
+        expected = AutomationClient.choose_direction([[CELL_NAMES[code] for code in row] for row in view])
+        if isinstance(expected, tuple):
+            assert MOVES[move] in expected
+        else:
+            assert MOVES[move] == expected
+
+
+def test_random_moves_are_free_neighbours():
+    codes = np.full((1000, 5, 5), WALL, dtype=np.int8)
+    codes[:, 2, 2] = PLAYER
+    codes[:, 1, 2] = EMPTY # only UP is free
+    assert set(chooseDirections(codes).tolist()) == {MOVES.index('UP')}
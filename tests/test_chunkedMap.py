@@ -0,0 +1,39 @@
+from chunkedMap import ChunkedMap
+from game import Game
+from gameItems import Coin
+from map import MapLayout
+from mapGenerators import generateWallChoices
+
+
+def coinCells(world):
+    return sum(isinstance(world.get((x, y)), Coin) for x in range(world.height) for y in range(world.width))
+
+
+def takeCoins(world, count):
+    taken = 0
+    for x in range(world.height):
+        for y in range(world.width):
+            if taken < count and isinstance(world.get((x, y)), Coin):
+                world.set((x, y), None)
+                world.decreaseCoin()
+                taken += 1
+
+
+def test_reopen_counts_coins_of_evicted_chunks(tmp_path):
+    path = str(tmp_path / 'world')
+    world = ChunkedMap(path, 16, 16, [], seed=3, chunkSize=4, cachedChunks=2)
+    takeCoins(world, 10)
+    # Never flushed, only the evicted chunks reached the file
+    reopened = ChunkedMap(path, 16, 16, [], chunkSize=4)
+    assert reopened.numCoins == coinCells(reopened)
+
+
+def test_game_close_writes_the_world(tmp_path):
+    path = str(tmp_path / 'world')
+    layout = MapLayout(12, 12, 2, generateWallChoices('lattice', 12, 12, 5, cache=False), 5)
+    game = Game({'TeamA': ['A0'], 'TeamB': ['B0']}, width=12, height=12, layout=layout, worldPath=path, chunkSize=4)
+    takeCoins(game.map, 5)
+    numCoins = game.map.numCoins
+    game.close()
+    reopened = ChunkedMap(path, 12, 12, [], chunkSize=4)
+    assert reopened.numCoins == numCoins == coinCells(reopened)
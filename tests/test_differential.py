@@ -0,0 +1,15 @@
+import pytest
+
+from differential import ENGINES, compareEngines
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_engines_agree_with_reference(seed):
+    report = compareEngines(list(ENGINES), games=3, ticks=60, seed=seed)
+    assert report['mismatches'] == []
+    assert report['ticks'] == 180
+
+
+def test_teams_of_different_sizes():
+    report = compareEngines(list(ENGINES), games=2, ticks=60, players=(1, 3), seed=7)
+    assert report['mismatches'] == []
@@ -0,0 +1,47 @@
+import json
+
+from conftest import join
+from game import Game
+from hibernation import decodeGame, encodeGame
+from moveset import Moveset
+
+import GameClient
+
+
+def test_encoded_game_keeps_its_state():
+    game = Game({'A': ['a0', 'a1'], 'B': ['b0']}, width=12, height=9, generator='rooms', seed=7, lineOfSight=True, visionRadius=3)
+    for move in [Moveset.UP, Moveset.LEFT, Moveset.LEFT, Moveset.DOWN] * 5:
+        for player in game.all_players:
+            game.movePlayer(player, move)
+    revived = decodeGame(encodeGame(game))
+    assert str(revived.map) == str(game.map)
+    assert revived.getScores() == game.getScores() and revived.getCoins() == game.getCoins()
+    assert revived.map.numCoins == game.map.numCoins
+    assert all(revived.getGameData(player) == game.getGameData(player) for player in game.all_players)
+
+
+def test_lobby_revives_on_its_next_message(server):
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    server.send('games/L/a/move', 'UP')
+
+    GameClient.hibernate_lobby(server, 'L')
+    assert 'L' not in server.game_dict and 'L' in server.hibernator.hibernated
+
+    server.send('games/L/b/move', 'DOWN')
+    server.publisher.flush('L')
+    assert 'L' not in server.hibernator.hibernated
+    assert server.tick_dict['L'] == 1
+    # The move sent before hibernating was kept and played with the one that woke the lobby
+    assert len(server.payloads('games/L/scores')) == 1
+
+
+def test_hibernated_lobbies_survive_a_restart(server):
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    GameClient.hibernate_lobby(server, 'L')
+    restarted = type(server)()
+    GameClient.init_client(restarted, leaderboard=server.leaderboard)
+    assert 'L' in restarted.hibernator.hibernated
+    restarted.send('games/L/start', 'START')
+    assert 'L' in restarted.game_dict
+    assert json.loads(restarted.payloads('games/L/config')[0])['width'] == 10
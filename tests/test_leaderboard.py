@@ -0,0 +1,45 @@
+import sqlite3
+
+from game import Game
+from leaderboard import Leaderboard
+from moveset import Moveset
+
+
+def test_coins_per_tick_is_served_and_reloaded(tmp_path):
+    path = str(tmp_path / 'leaderboard.db')
+    leaderboard = Leaderboard(path)
+    leaderboard.record('L', {'A': ['a'], 'B': ['b']}, {'A': 6, 'B': 1}, 10, {'A': 2, 'B': 1})
+    leaderboard.flush()
+    for board in (leaderboard, Leaderboard(path)):
+        teams = {entry['name']: entry for entry in board.query('coinsPerTick')['teams']}
+        assert teams['A']['coinsPerTick'] == 0.2 and teams['A']['scorePerTick'] == 0.6
+        assert board.query('coinsPerTick')['players'][0]['name'] == 'a'
+
+
+def test_games_without_coins_are_left_out(tmp_path):
+    leaderboard = Leaderboard(str(tmp_path / 'leaderboard.db'))
+    leaderboard.record('L1', {'A': ['a']}, {'A': 3}, 10)
+    leaderboard.record('L2', {'A': ['a']}, {'A': 3}, 10, {'A': 3})
+    assert leaderboard.query('coinsPerTick')['teams'][0]['coinsPerTick'] == 0.3
+
+
+def test_database_without_coins_is_migrated(tmp_path):
+    path = str(tmp_path / 'leaderboard.db')
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute('CREATE TABLE results (lobby TEXT, team TEXT, player TEXT, score INTEGER, won INTEGER, ticks INTEGER, finished REAL)')
+        connection.execute("INSERT INTO results VALUES ('old', 'A', 'a', 4, 1, 8, 0)")
+    connection.close()
+    leaderboard = Leaderboard(path)
+    leaderboard.record('new', {'A': ['a']}, {'A': 2}, 4, {'A': 1})
+    leaderboard.flush()
+    team = Leaderboard(path).query('coinsPerTick')['teams'][0]
+    assert team['games'] == 2 and team['coinsPerTick'] == 0.25
+
+
+def test_game_counts_collected_coins():
+    game = Game({'A': ['a'], 'B': ['b']}, seed=3)
+    for move in [Moveset.UP, Moveset.LEFT, Moveset.DOWN, Moveset.RIGHT] * 10:
+        game.movePlayer('a', move)
+    assert game.getCoins()['B'] == 0
+    assert game.getCoins()['A'] <= game.getScores()['A'] <= 3 * game.getCoins()['A']
@@ -0,0 +1,56 @@
+import pytest
+
+import GameClient
+from matchmaking import Matchmaker
+
+
+def test_full_lobby_is_formed_at_once():
+    matcher = Matchmaker(lobbySize=4, teams=2, maxWait=10)
+    for i in range(4):
+        matcher.enqueue(f'P{i}', now=0)
+    lobbies = matcher.match(now=0)
+    assert len(lobbies) == 1
+    assert sorted(len(players) for players in lobbies[0]['teams'].values()) == [2, 2]
+    assert matcher.match(now=0) == []
+
+
+def test_partial_lobby_waits_for_max_wait():
+    matcher = Matchmaker(lobbySize=4, teams=2, maxWait=10)
+    for i in range(3):
+        matcher.enqueue(f'P{i}', now=0)
+    assert matcher.match(now=5) == []
+    lobbies = matcher.match(now=10)
+    assert sorted(len(players) for players in lobbies[0]['teams'].values()) == [1, 2]
+
+
+def test_requested_team_plays_together():
+    matcher = Matchmaker(lobbySize=4, teams=2)
+    matcher.enqueue('A', 'Red', now=0)
+    matcher.enqueue('X', now=0)
+    matcher.enqueue('B', 'Red', now=0)
+    matcher.enqueue('Y', now=0)
+    teams = matcher.match(now=0)[0]['teams']
+    assert sorted(teams['Red']) == ['A', 'B']
+
+
+def test_taken_names_are_skipped():
+    matcher = Matchmaker(lobbySize=2, teams=2)
+    for i in range(2):
+        matcher.enqueue(f'P{i}', now=0)
+    assert matcher.match(taken={'match-1', 'match-2'}, now=0)[0]['lobby_name'] == 'match-3'
+
+
+def test_lobbies_start_after_the_delay():
+    matcher = Matchmaker(lobbySize=2, teams=2, startDelay=1)
+    for i in range(2):
+        matcher.enqueue(f'P{i}', now=0)
+    lobby_name = matcher.match(now=0)[0]['lobby_name']
+    assert matcher.due(now=0.5) == []
+    assert matcher.due(now=1) == [lobby_name]
+    assert matcher.due(now=2) == []
+
+
+@pytest.mark.parametrize('match_config', ['{"start": "START", "width": 1}', 'not json', '{"start": "START", "vision_radius": 10}'])
+def test_invalid_match_config_fails_at_startup(match_config):
+    with pytest.raises(ValueError):
+        GameClient.parse_match_config(match_config, 4)
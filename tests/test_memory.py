@@ -0,0 +1,50 @@
+import tracemalloc
+
+from conftest import join
+from game import Game
+from memory import MemoryAccountant
+
+
+def test_reservation_covers_the_running_game():
+    memory = MemoryAccountant(2**30)
+    assert memory.admit('L', 20, 20, 4, 2) is None
+    game = Game({'A': ['a0', 'a1'], 'B': ['b0', 'b1']}, width=20, height=20, generator='maze', seed=2)
+    pending = {player: b'UP' for player in game.all_players}
+    assert memory.measure(game, pending, queued_ticks=4) <= memory.reserved['L']
+
+
+def test_estimate_grows_with_vision_and_queued_ticks():
+    memory = MemoryAccountant(2**30)
+    game = Game({'A': ['a'], 'B': ['b']}, width=12, height=12, seed=2)
+    assert memory.measure(game, {}, queued_ticks=2) > memory.measure(game, {}, queued_ticks=0)
+    memory.admit('near', 12, 12, 2, 2, vision_radius=1)
+    memory.admit('far', 12, 12, 2, 2, vision_radius=5)
+    assert memory.reserved['far'] > memory.reserved['near']
+
+
+def test_budgets_refuse_and_forget_releases():
+    memory = MemoryAccountant(2**30)
+    memory.admit('L1', 10, 10, 2, 2)
+    memory.total_budget = memory.reserved['L1'] + 1
+    assert memory.admit('L2', 10, 10, 2, 2) == "Not enough memory left for a new lobby, try again later"
+    memory.forget_lobby('L1')
+    assert memory.admit('L2', 10, 10, 2, 2) is None
+    assert MemoryAccountant(1000).admit('L', 10, 10, 2, 2).startswith('Estimated memory of')
+
+
+def test_audit_stays_within_the_reservation():
+    memory = MemoryAccountant(2**30, audit=True)
+    memory.admit('L', 30, 30, 4, 2)
+    try:
+        memory.audit('L', lambda: Game({'A': ['a0', 'a1'], 'B': ['b0', 'b1']}, width=30, height=30, seed=4))
+    finally:
+        tracemalloc.stop()
+    assert 0 < memory.audited['L'] <= memory.reserved['L']
+
+
+def test_lobby_over_budget_is_refused_at_start(server):
+    server.memory.lobby_budget = 1000
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    assert 'L' not in server.game_dict
+    assert server.payloads('games/L/lobby')[0].startswith('Error: Estimated memory of')
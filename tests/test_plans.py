@@ -0,0 +1,87 @@
+import json
+
+from conftest import join
+from gameItems import Wall
+from moveset import Moveset
+from player import Player
+
+import GameClient
+
+OPPOSITE = {'UP': 'DOWN', 'DOWN': 'UP', 'LEFT': 'RIGHT', 'RIGHT': 'LEFT'}
+
+
+def start(server):
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', {'start': 'START', 'width': 12, 'height': 12, 'generator': 'openField', 'seed': 5})
+    return server.game_dict['L']
+
+
+def back_and_forth(game, player_name, steps):
+    """
+    :return: a plan of steps moves between the player's cell and a free neighbour, none of them blocked
+    """
+    x, y = game.getPlayer(player_name).loc
+    for move in OPPOSITE:
+        dx, dy = Moveset[move].value
+        loc = x + dx, y + dy
+        if 0 <= loc[0] < game.map.height and 0 <= loc[1] < game.map.width and not isinstance(game.map.get(loc), (Wall, Player)):
+            return {'moves': [move if i % 2 == 0 else OPPOSITE[move] for i in range(steps)]}
+    raise AssertionError(f'{player_name} is walled in')
+
+
+def test_plan_plays_one_step_per_tick(server):
+    game = start(server)
+    server.send('games/L/a/plan', back_and_forth(game, 'a', 3))
+    server.send('games/L/b/plan', back_and_forth(game, 'b', 3))
+    # The message resolves one tick, the rest are stepped by the plan timer
+    assert server.tick_dict['L'] == 1
+    for _ in range(4):
+        server.publisher.flush('L')
+        GameClient.step_plans(server)
+    server.publisher.flush('L')
+    assert server.tick_dict['L'] == 3
+    assert server.plan_dict['L'] == {}
+
+
+def test_move_replaces_the_plan(server):
+    start(server)
+    server.send('games/L/a/plan', {'moves': ['UP', 'UP', 'UP']})
+    server.send('games/L/a/move', 'DOWN')
+    assert 'a' not in server.plan_dict['L']
+    server.send('games/L/b/move', 'DOWN')
+    server.publisher.flush('L')
+    assert server.tick_dict['L'] == 1
+
+
+def test_invalid_plan_is_refused(server):
+    start(server)
+    server.send('games/L/a/plan', {'moves': ['UP', 'JUMP']})
+    server.send('games/L/a/plan', {'moves': []})
+    assert server.payloads('games/L/lobby') == ['Error: Invalid move plan from a.'] * 2
+    assert 'a' not in server.plan_dict['L']
+
+
+def test_plan_steps_wait_for_every_player(server):
+    game = start(server)
+    server.send('games/L/a/plan', back_and_forth(game, 'a', 2))
+    GameClient.step_plans(server)
+    assert server.tick_dict['L'] == 0
+    server.send('games/L/b/move', 'LEFT')
+    server.publisher.flush('L')
+    assert server.tick_dict['L'] == 1
+    assert len(server.plan_dict['L']['a']) == 1
+    assert len(json.loads(server.payloads('games/L/scores')[0])) == 2
+
+
+def test_blocked_plan_is_dropped(server):
+    game = start(server)
+    # Walking into the edge of the board blocks on the last step at the latest
+    x, _ = game.getPlayer('a').loc
+    server.send('games/L/a/plan', {'moves': ['UP'] * (x + 2)})
+    server.send('games/L/b/plan', back_and_forth(game, 'b', x + 2))
+    for _ in range(x + 3):
+        server.publisher.flush('L')
+        GameClient.step_plans(server)
+    server.publisher.flush('L')
+    assert 'a' not in server.plan_dict['L']
+    assert game.getPlayer('a').loc[0] <= x
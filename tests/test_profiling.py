@@ -0,0 +1,55 @@
+import json
+import threading
+import time
+
+from conftest import join
+from profiling import LobbyProfiler
+
+
+def finished(profiler, lobby_name, ticks, mode='deterministic'):
+    done = threading.Event()
+    summaries = []
+    profiler.start(lobby_name, ticks, mode, on_finished=lambda summary: (summaries.append(summary), done.set()))
+    return done, summaries
+
+
+def test_only_one_thread_runs_cprofile(tmp_path):
+    profiler = LobbyProfiler(str(tmp_path))
+    done, summaries = finished(profiler, 'L', 1)
+    first = profiler.enable('L')
+    # Another thread working on the lobby meanwhile is sampled rather than profiled
+    other = []
+    thread = threading.Thread(target=lambda: other.append(profiler.enable('L')))
+    thread.start()
+    thread.join()
+    assert first[1] is not None and other[0][1] is None
+    profiler.disable(other[0])
+    profiler.disable(first)
+    profiler.tick('L')
+    assert done.wait(5)
+    assert summaries[0]['path'].endswith('.prof')
+
+
+def test_pipeline_workers_are_sampled(tmp_path):
+    profiler = LobbyProfiler(str(tmp_path))
+    finished(profiler, 'L', 1)
+    token = profiler.enable('L', sampled=True)
+    assert token[1] is None
+    profiler.disable(token)
+    profiler.finish('L')
+
+
+def test_profile_session_finishes_over_ticks(server):
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    server.send('admin/profile/L', {'ticks': 2})
+    for move in ('UP', 'DOWN', 'UP'):
+        server.send('games/L/a/move', move)
+        server.send('games/L/b/move', move)
+        server.publisher.flush('L')
+    deadline = time.monotonic() + 5
+    while not server.payloads('admin/profile/L/summary') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    summary = json.loads(server.payloads('admin/profile/L/summary')[0])
+    assert summary['lobby'] == 'L' and summary['mode'] == 'deterministic'
+
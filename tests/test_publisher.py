@@ -0,0 +1,53 @@
+import threading
+import time
+
+from conftest import FakeClient
+from game import Game
+from publisher import PublishPipeline
+
+
+def test_ticks_of_a_lobby_run_in_order():
+    client = FakeClient()
+    pipeline = PublishPipeline(client, workers=4)
+    games = {lobby: Game({'A': ['a'], 'B': ['b']}, seed=1) for lobby in ('L1', 'L2', 'L3')}
+    for tick in range(20):
+        for lobby, game in games.items():
+            # Slower early ticks would overtake each other if a lobby ran on several workers at once
+            pipeline.submit(lobby, game, [], show_map=False, tick=tick,
+                            resolve=lambda tick=tick, lobby=lobby: time.sleep(0.002 * (tick % 3)) or [(f'{lobby}/tick', str(tick))])
+    pipeline.flush()
+    for lobby in games:
+        assert client.payloads(f'{lobby}/tick') == [str(tick) for tick in range(20)]
+
+
+def test_game_states_come_before_the_messages():
+    client = FakeClient()
+    pipeline = PublishPipeline(client, workers=2)
+    game = Game({'A': ['a'], 'B': ['b']}, seed=1)
+    pipeline.submit('L', game, ['a', 'b'], [('games/L/scores', '{}')], show_map=False)
+    pipeline.flush('L')
+    assert [topic for topic, _ in client.published] == ['games/L/a/game_state', 'games/L/b/game_state', 'games/L/scores']
+
+
+def test_dropped_tick_publishes_nothing():
+    client = FakeClient()
+    pipeline = PublishPipeline(client, workers=1)
+    pipeline.submit('L', Game({'A': ['a']}, seed=1), ['a'], [('games/L/scores', '{}')], show_map=False, resolve=lambda: None)
+    pipeline.flush()
+    assert client.published == []
+
+
+def test_busy_lobby_is_full_and_leaves_workers_to_others():
+    client = FakeClient()
+    pipeline = PublishPipeline(client, workers=2)
+    game = Game({'A': ['a']}, seed=1)
+    release = threading.Event()
+    for _ in range(PublishPipeline.MAX_QUEUED_TICKS):
+        pipeline.submit('busy', game, [], show_map=False, resolve=lambda: release.wait(5) and [])
+    assert pipeline.full('busy')
+    pipeline.submit('other', game, [], [('other/done', '1')], show_map=False)
+    pipeline.flush('other')
+    assert client.payloads('other/done') == ['1']
+    release.set()
+    pipeline.flush()
+    assert pipeline.pending('busy') == 0
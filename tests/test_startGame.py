@@ -0,0 +1,30 @@
+from conftest import join
+
+
+def test_negative_seed_is_refused(server):
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', {'start': 'START', 'seed': -1})
+    assert 'L' not in server.game_dict
+    assert server.payloads('games/L/lobby') == ['Error: Invalid lobby configuration.']
+    assert 'L' not in server.memory.reserved
+
+
+def test_failed_construction_releases_the_reservation(server, monkeypatch):
+    import GameClient
+
+    def broken(*args, **kwargs):
+        raise ValueError('broken generator')
+    monkeypatch.setattr(GameClient, 'Game', broken)
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    assert 'L' not in server.game_dict
+    assert 'L' not in server.memory.reserved
+    assert server.payloads('games/L/lobby') == ['Error: Could not create the game: broken generator']
+
+
+def test_crowded_maze_leaves_a_coin(server):
+    join(server, 'L', {'A': ['a0', 'a1', 'a2', 'a3'], 'B': ['b0', 'b1', 'b2', 'b3']})
+    server.send('games/L/start', {'start': 'START', 'width': 4, 'height': 4, 'generator': 'maze', 'seed': 1})
+    game = server.game_dict['L']
+    assert game.map.numCoins >= 1
+    assert not game.gameOver()
@@ -0,0 +1,76 @@
+import time
+
+from conftest import Message, join
+from connectionPool import PooledEndpoint
+from GameInstanceManger import LobbySupervisor
+
+
+class FakePool:
+    """
+    Stands in for BrokerConnectionPool, records what is published and hands messages to the registered handlers
+    """
+    def __init__(self):
+        self.published = []
+        self.handlers = {}
+
+    def endpoint(self, prefix):
+        return PooledEndpoint(self, prefix)
+
+    def register(self, prefix, handler, topics, on_subscribed=None):
+        self.handlers[prefix] = handler
+        if on_subscribed is not None:
+            on_subscribed()
+
+    def unregister(self, prefix):
+        self.handlers.pop(prefix, None)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload))
+
+    def send(self, topic, payload):
+        self.handlers['/'.join(topic.split('/')[:2]) + '/'](None, None, Message(topic, payload))
+
+    def count(self, topic):
+        return sum(published == topic for published, _ in self.published)
+
+
+def until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_pooled_lobby_plays_and_finishes(server):
+    pool = FakePool()
+    server.supervisor = LobbySupervisor(server, pool=pool)
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    assert until(lambda: pool.count('games/L/a/game_state') == 1)
+    assert 'L' in server.supervisor.workers and 'L' not in server.game_dict
+
+    # Moves of the lobby go to its worker, not through the server's handlers
+    server.send('games/L/a/move', 'UP')
+    assert server.move_dict.get('L') is None
+    pool.send('games/L/a/move', 'UP')
+    pool.send('games/L/b/move', 'DOWN')
+    assert until(lambda: pool.count('games/L/a/game_state') == 2)
+
+    # A stopped lobby's thread ends itself and leaves the pool
+    thread = server.supervisor.workers['L']['process']
+    server.supervisor.stop('L')
+    assert until(lambda: not thread.is_alive())
+    assert 'games/L/' not in pool.handlers and 'L' not in server.supervisor.workers
+
+
+def test_finished_lobby_is_removed_from_the_server(server):
+    pool = FakePool()
+    server.supervisor = LobbySupervisor(server, pool=pool)
+    join(server, 'L', {'A': ['a'], 'B': ['b']})
+    server.send('games/L/start', 'START')
+    assert until(lambda: 'games/L/' in pool.handlers)
+    # The lobby's thread ends when it is done, as it does at game over
+    server.supervisor.workers['L']['done'].set()
+    assert until(lambda: server.supervisor.finished == ['L'])
+    server.send('games/L/start', 'START')
+    assert 'L' not in server.team_dict
@@ -0,0 +1,32 @@
+from leaderboard import Leaderboard
+from tournament import Tournament, playMatch
+
+MATCH = {'id': 0, 'teams': {'A': 'greedy', 'B': 'random'}, 'playersPerTeam': 2, 'height': 8, 'width': 8,
+         'generator': 'lattice', 'maxTicks': 100, 'seed': 3}
+
+
+def test_match_replays_from_its_seed():
+    first, second = playMatch(MATCH), playMatch(MATCH)
+    assert (first['scores'], first['coins'], first['ticks']) == (second['scores'], second['coins'], second['ticks'])
+    assert first['ticks'] <= MATCH['maxTicks']
+    assert first['roster'] == {'A': ['A0', 'A1'], 'B': ['B0', 'B1']}
+
+
+def test_round_robin_plays_every_pairing(tmp_path):
+    leaderboard = Leaderboard(str(tmp_path / 'leaderboard.db'))
+    tournament = Tournament({'A': 'greedy', 'B': 'random', 'C': 'random'}, gamesPerPairing=2, height=6, width=6,
+                            maxTicks=50, workers=2, leaderboard=leaderboard)
+    report = tournament.run()
+    assert report['games'] == 6
+    assert all(standing['games'] == 4 for standing in report['standings'].values())
+    assert report['champion'] == tournament.ranking()[0]
+    assert sum(team['games'] for team in leaderboard.query('games')['teams']) == 12
+
+
+def test_bracket_gives_byes_to_the_best_seeds():
+    tournament = Tournament({'A': 'greedy', 'B': 'random', 'C': 'random'}, format='bracket', height=6, width=6, maxTicks=30, workers=2)
+    report = tournament.run()
+    # One game between the two lower seeds, one final
+    assert report['games'] == 2
+    assert tournament.rounds[0][0]['teams'].keys() == {'B', 'C'}
+    assert report['champion'] in ('A', 'B', 'C')
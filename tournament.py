@@ -0,0 +1,210 @@
+"""
+Tournaments between bot teams, played as in-process games on a pool of worker processes.
+python tournament.py TeamA TeamB:random TeamC ... [--format roundRobin|bracket] [--workers N]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+import numpy as np
+
+from batchPolicy import MOVES, chooseDirections
+from game import Game
+from moveset import Moveset
+from worldModel import WorldModel
+
+
+def _random(codes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    return rng.integers(len(MOVES), size=len(codes))
+
+
+# Bots a team can be played by, each picks the moves of all of its players at once from the (N, 5, 5) codes of their world models
+POLICIES = {
+    'greedy': chooseDirections,
+    'random': _random,
+}
+
+
+def playMatch(match: dict) -> dict:
+    """
+    Plays one game to game over or to its tick cap, runs in a worker process
+    :param match: {'id', 'teams': {'team_name' : 'policy'}, 'playersPerTeam', 'height', 'width', 'generator', 'maxTicks', 'seed'}
+    :return: the match with its 'scores', 'coins' collected by every team, 'ticks', 'winner' (None on a tie) and 'duration'
+    """
+    started = time.perf_counter()
+    # The map has its own generator, the bots' random choices come from one seeded by the match
+    rng = np.random.default_rng(match['seed'])
+    roster = {team: [f'{team}{i}' for i in range(match['playersPerTeam'])] for team in match['teams']}
+    game = Game(roster, width=match['width'], height=match['height'], generator=match['generator'], seed=match['seed'])
+    models = {player: WorldModel(match['height'], match['width']) for players in roster.values() for player in players}
+    # Players grouped by the policy they are played by, so every policy decides for all of its players in one call
+    policies: dict[str, list[str]] = {}
+    for team, policy in match['teams'].items():
+        policies.setdefault(policy, []).extend(roster[team])
+
+    ticks = 0
+    while not game.gameOver() and ticks < match['maxTicks']:
+        # Every player decides on the same state before any move is applied, like a server tick
+        for player, model in models.items():
+            model.update(game.getGameData(player))
+        moves = {}
+        for policy, players in policies.items():
+            codes = np.stack([models[player].codes(2) for player in players])
+            moves.update(zip(players, POLICIES[policy](codes, rng).tolist()))
+        for player in models:
+            game.movePlayer(player, Moveset[MOVES[moves[player]]])
+        ticks += 1
+
+    scores = game.getScores()
+    best = max(scores.values())
+    leaders = [team for team, score in scores.items() if score == best]
+    return dict(match, scores=scores, coins=game.getCoins(), ticks=ticks, winner=leaders[0] if len(leaders) == 1 else None,
+                duration=time.perf_counter() - started, roster=roster)
+
+
+class Tournament:
+    def __init__(self, entrants: dict[str, str], format: str = 'roundRobin', gamesPerPairing: int = 1, playersPerTeam: int = 2,
+                 height: int = 10, width: int = 10, generator: str = 'lattice', maxTicks: int = 500,
+                 workers: Optional[int] = None, seed: int = 0, leaderboard=None):
+        """
+        :param entrants: {'team_name' : 'policy'}, see POLICIES
+        :param format: 'roundRobin' plays every pairing, 'bracket' plays single elimination seeded by entry order
+        :param gamesPerPairing: games of every pairing, with different maps
+        :param maxTicks: games still running after this many ticks end with their current scores
+        :param workers: worker processes, the number of cores by default
+        :param seed: seed the seeds of all games are derived from, the same seed replays the same tournament
+        :param leaderboard: Leaderboard every finished game is recorded to, None to not record them
+        """
+        assert format in ('roundRobin', 'bracket')
+        assert len(entrants) >= 2
+        assert all(policy in POLICIES for policy in entrants.values())
+        self.entrants = entrants
+        self.format = format
+        self.gamesPerPairing = gamesPerPairing
+        self.settings = {'playersPerTeam': playersPerTeam, 'height': height, 'width': width, 'generator': generator, 'maxTicks': maxTicks}
+        self.workers = workers or os.cpu_count() or 1
+        self.leaderboard = leaderboard
+        self.results: list[dict] = []
+        self.rounds: list[list[dict]] = []
+        self.standings = {team: {'wins': 0, 'ties': 0, 'losses': 0, 'points': 0, 'games': 0} for team in entrants}
+        self.__random = random.Random(seed)
+        self.__nextId = 0
+
+    def run(self) -> dict:
+        """
+        Plays the whole tournament
+        :return: {'format', 'standings', 'champion', 'games', 'ticks', 'duration', 'gamesPerHour', 'ticksPerSecond'}
+        """
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            if self.format == 'roundRobin':
+                self.__playRound(executor, list(itertools.combinations(self.entrants, 2)))
+                champion = self.ranking()[0]
+            else:
+                alive = list(self.entrants)
+                while len(alive) > 1:
+                    # The best seeds get the byes when the field isn't a power of two
+                    byes = (1 << (len(alive) - 1).bit_length()) - len(alive)
+                    pairings = [(alive[i], alive[len(alive) - 1 - i + byes]) for i in range(byes, byes + (len(alive) - byes) // 2)]
+                    winners = self.__playRound(executor, pairings)
+                    alive = alive[:byes] + [winners[pairing] for pairing in pairings]
+                champion = alive[0]
+
+        duration = time.perf_counter() - started
+        ticks = sum(result['ticks'] for result in self.results)
+        return {'format': self.format, 'standings': {team: self.standings[team] for team in self.ranking()}, 'champion': champion,
+                'games': len(self.results), 'ticks': ticks, 'duration': duration,
+                'gamesPerHour': len(self.results) / duration * 3600, 'ticksPerSecond': ticks / duration}
+
+    def ranking(self) -> list[str]:
+        """
+        :return: teams by wins, then ties, then points, then entry order
+        """
+        order = {team: i for i, team in enumerate(self.entrants)}
+        return sorted(self.entrants, key=lambda team: (-self.standings[team]['wins'], -self.standings[team]['ties'],
+                                                       -self.standings[team]['points'], order[team]))
+
+    def __playRound(self, executor: ProcessPoolExecutor, pairings: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """
+        Plays every game of the round on the workers and updates the standings as games finish
+        :return: winner of every pairing, ties are broken by points and then by seed
+        """
+        matches = []
+        for pairing in pairings:
+            for _ in range(self.gamesPerPairing):
+                matches.append(dict(self.settings, id=self.__nextId, teams={team: self.entrants[team] for team in pairing},
+                                    seed=self.__random.getrandbits(32)))
+                self.__nextId += 1
+        # Longest games first, so the short ones fill the gaps at the end of the round instead of waiting on a straggler
+        matches.sort(key=lambda match: match['height'] * match['width'] * len(match['teams']) * match['playersPerTeam'], reverse=True)
+
+        played = []
+        futures = [executor.submit(playMatch, match) for match in matches]
+        for future in as_completed(futures):
+            result = future.result()
+            self.__record(result)
+            played.append(result)
+        played.sort(key=lambda result: result['id'])
+        self.rounds.append(played)
+
+        winners = {}
+        for pairing in pairings:
+            games = [result for result in played if tuple(result['teams']) == pairing]
+            wins = {team: sum(result['winner'] == team for result in games) for team in pairing}
+            points = {team: sum(result['scores'][team] for result in games) for team in pairing}
+            winners[pairing] = max(pairing, key=lambda team: (wins[team], points[team], -pairing.index(team)))
+        return winners
+
+    def __record(self, result: dict):
+        self.results.append(result)
+        for team, score in result['scores'].items():
+            standing = self.standings[team]
+            standing['games'] += 1
+            standing['points'] += score
+            if result['winner'] is None:
+                standing['ties'] += 1
+            elif result['winner'] == team:
+                standing['wins'] += 1
+            else:
+                standing['losses'] += 1
+        if self.leaderboard is not None:
+            self.leaderboard.record(f'tournament-{result["id"]}', result['roster'], result['scores'], result['ticks'], result['coins'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('entrants', nargs='+', help='team names, optionally with a policy as name:policy (greedy by default)')
+    parser.add_argument('--format', choices=('roundRobin', 'bracket'), default='roundRobin')
+    parser.add_argument('--games', type=int, default=1, help='games per pairing')
+    parser.add_argument('--players', type=int, default=2, help='players per team')
+    parser.add_argument('--height', type=int, default=10)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--generator', default='lattice')
+    parser.add_argument('--max-ticks', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--leaderboard', default=None, help='SQLite file to record the games to')
+    args = parser.parse_args()
+
+    entrants = dict((entrant.split(':', 1) + ['greedy'])[:2] for entrant in args.entrants)
+    leaderboard = None
+    if args.leaderboard:
+        from leaderboard import Leaderboard
+        leaderboard = Leaderboard(args.leaderboard)
+
+    tournament = Tournament(entrants, args.format, args.games, args.players, args.height, args.width, args.generator,
+                            args.max_ticks, args.workers, args.seed, leaderboard)
+    summary = tournament.run()
+    if leaderboard is not None:
+        leaderboard.flush()
+
+    for rank, (team, standing) in enumerate(summary['standings'].items(), 1):
+        print(f'{rank:>3}. {team:<16} {standing["wins"]}W {standing["ties"]}T {standing["losses"]}L  {standing["points"]} points')
+    print(f'Champion: {summary["champion"]}')
+    print(f'{summary["games"]} games, {summary["ticks"]} ticks in {summary["duration"]:.2f}s on {tournament.workers} workers: '
+          f'{summary["gamesPerHour"]:.0f} games/hour, {summary["ticksPerSecond"]:.0f} ticks/s')
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from lazyImport import lazyImport
+Properties = lazyImport('paho.mqtt.properties', 'Properties')
+PacketTypes = lazyImport('paho.mqtt.packettypes', 'PacketTypes')
+
+# MQTT v5 user property carrying the id of a move through to the game states it results in
+CORRELATION_PROPERTY = 'correlation-id'
+
+
+def correlationId(msg) -> Optional[str]:
+    """
+    :return: the correlation id of an inbound message, None if it has none
+    """
+    properties = getattr(msg, 'properties', None)
+    for key, value in getattr(properties, 'UserProperty', None) or ():
+        if key == CORRELATION_PROPERTY:
+            return value
+    return None
+
+
+def correlationProperties(correlation_id: str):
+    """
+    :return: publish properties carrying the correlation id
+    """
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.UserProperty = (CORRELATION_PROPERTY, correlation_id)
+    return properties
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'started', 'wall')
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args # more can be added while the span is open
+
+    def __enter__(self):
+        self.wall = time.time_ns()
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.wall, time.perf_counter_ns() - self.started, self.args)
+        return False
+
+
+class _NoSpan:
+    """
+    What span() returns while tracing is off, entering and leaving it does nothing
+    """
+    __slots__ = ('args',)
+
+    def __init__(self):
+        self.args = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Records spans of work in the Chrome trace event format, read by chrome://tracing, Perfetto or speedscope.
+        Spans are buffered and appended to the file by a background thread. The file is a JSON array that is never
+        closed, which the viewers accept, so it can be opened while the server is still running.
+        :param path: trace file, {pid} in it is replaced by the process id so every worker process writes its own.
+                     None turns tracing off, span() then costs a method call
+        """
+        self.enabled = path is not None
+        self.path = None if path is None else path.format(pid=os.getpid())
+        self.pid = os.getpid()
+        self.spans = 0
+        self.__events: list[dict] = []
+        self.__threads: set[int] = set()
+        self.__lock = threading.Lock()
+        if self.enabled:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w') as file:
+                file.write('[\n')
+            threading.Thread(target=self.__write, name='Tracer', daemon=True).start()
+
+    def span(self, name: str, **args):
+        """
+        with tracer.span('movePlayer', player=name): ...
+        :param args: shown with the span in the viewer, e.g. lobby, tick or correlationId
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name: str, wall: int, duration: int, args: dict):
+        """
+        Adds a finished span
+        :param wall: start in nanoseconds since the epoch, so the files of several processes line up
+        :param duration: nanoseconds
+        """
+        thread = threading.get_ident()
+        event = {'name': name, 'ph': 'X', 'ts': wall / 1000, 'dur': duration / 1000, 'pid': self.pid, 'tid': thread, 'args': args}
+        with self.__lock:
+            if thread not in self.__threads:
+                # Name the thread's row in the viewer
+                self.__threads.add(thread)
+                self.__events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread,
+                                      'args': {'name': threading.current_thread().name}})
+            self.__events.append(event)
+            self.spans += 1
+
+    def flush(self):
+        """
+        Appends the buffered spans to the file
+        """
+        with self.__lock:
+            events, self.__events = self.__events, []
+        if events:
+            with open(self.path, 'a') as file:
+                file.write(''.join(json.dumps(event, default=str) + ',\n' for event in events))
+
+    def __write(self):
+        while True:
+            time.sleep(Tracer.FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f'Tracer failed to write {self.path}: {e}')
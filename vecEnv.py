@@ -0,0 +1,189 @@
+"""
+Gym-style vectorized environment stepping many independent games at once, for training bot policies locally.
+"""
+
+import random
+from typing import Optional
+
+import numpy as np
+
+from game import Game
+from gameItems import Wall, Coin1, Coin2, Coin3
+from mapGenerators import spawnSeeds
+from moveset import Moveset
+from worldModel import EMPTY, WALL, COIN1, COIN2, COIN3, TEAMMATE, ENEMY, PLAYER, OUTSIDE
+
+# Actions are indices into ACTIONS
+ACTIONS = (Moveset.UP, Moveset.DOWN, Moveset.LEFT, Moveset.RIGHT)
+
+# One observation channel per code, in this order
+CHANNELS = (WALL, COIN1, COIN2, COIN3, TEAMMATE, ENEMY, PLAYER, OUTSIDE)
+CHANNEL_NAMES = ('wall', 'coin1', 'coin2', 'coin3', 'teammate', 'enemy', 'player', 'outside')
+
+_ITEM_CODES = {Wall: WALL, Coin1: COIN1, Coin2: COIN2, Coin3: COIN3}
+_ITEM_CHANNELS = np.array(CHANNELS[:4], dtype=np.int8)[:, None, None]
+
+
+class VecGameEnv:
+    def __init__(self, numEnvs: int, playerNames: dict[str, list[str]], height: int = 10, width: int = 10,
+                 visionRadius: int = 2, generator: str = 'lattice', maxTicks: int = 500, autoReset: bool = True):
+        """
+        Every game has the same teams and players. Each player is an agent, agents are ordered as in playerNames.
+        Observations are (numEnvs, numAgents, len(CHANNELS), 2r+1, 2r+1) uint8 one-hot windows around every agent,
+        rewards are the score their team gained during the step.
+
+        The games are the regular Game objects, moves go through Game.movePlayer. Beside every game the environment keeps
+        a code grid and an occupant grid, padded by the vision radius, which are only updated where a player moved.
+        Observations of all agents are then cut from those grids with a single fancy index.
+        :param playerNames: {'team_name' : [player_name, ...]} of every game
+        :param maxTicks: games are truncated after this many steps
+        :param autoReset: start a new game in place of one that is done, its last observation and scores go into the infos
+        """
+        assert isinstance(numEnvs, int) and numEnvs > 0
+        self.numEnvs = numEnvs
+        self.playerNames = playerNames
+        self.height = height
+        self.width = width
+        self.visionRadius = visionRadius
+        self.generator = generator
+        self.maxTicks = maxTicks
+        self.autoReset = autoReset
+
+        self.agents = [player for players in playerNames.values() for player in players]
+        self.teams = list(playerNames)
+        self.agentTeams = np.array([self.teams.index(team) for team, players in playerNames.items() for _ in players])
+        size = 2 * visionRadius + 1
+        self.observationShape = (len(CHANNELS), size, size)
+
+        padded = (numEnvs, height + 2 * visionRadius, width + 2 * visionRadius)
+        self.games: list[Optional[Game]] = [None] * numEnvs
+        self.ticks = np.zeros(numEnvs, dtype=np.int64)
+        self.positions = np.zeros((numEnvs, len(self.agents), 2), dtype=np.int64) # (x, y) of every agent on the unpadded board
+        self.__items = np.full(padded, OUTSIDE, dtype=np.int8) # walls and coins, OUTSIDE on the padding
+        self.__occupants = np.zeros(padded, dtype=np.int16) # agent index + 1 standing on each cell, 0 for none
+        self.__scores = np.zeros((numEnvs, len(self.teams)), dtype=np.int64)
+        self.__seeds = [random.Random(seed) for seed in spawnSeeds(None, numEnvs)] # stream of game seeds of every environment
+
+        # Team of an occupant value, -1 for an empty cell
+        self.__occupantTeams = np.concatenate(([-1], self.agentTeams))
+        self.__offsets = np.arange(size)
+        self.__envIndex = np.arange(numEnvs)[:, None, None, None]
+        self.__agentIds = (np.arange(len(self.agents)) + 1)[None, :, None, None]
+
+    def reset(self, seed: Optional[int] = None) -> np.ndarray:
+        """
+        Starts a new game in every environment
+        :param seed: seeds the games of this reset and the ones that follow, for a reproducible batch
+        :return: observations of every agent
+        """
+        if seed is not None:
+            self.__seeds = [random.Random(envSeed) for envSeed in spawnSeeds(seed, self.numEnvs)]
+        for env in range(self.numEnvs):
+            self.__resetEnv(env)
+        return self.observe()
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        """
+        Moves every agent of every game once, in agent order like the server resolves a tick
+        :param actions: (numEnvs, numAgents) indices into ACTIONS
+        :return: observations, rewards (numEnvs, numAgents), dones (numEnvs,), infos with the 'scores' and 'ticks' of finished games
+        """
+        actions = np.asarray(actions)
+        assert actions.shape == (self.numEnvs, len(self.agents))
+        r = self.visionRadius
+        rewards = np.zeros((self.numEnvs, len(self.agents)), dtype=np.float32)
+        dones = np.zeros(self.numEnvs, dtype=bool)
+        infos = [{} for _ in range(self.numEnvs)]
+        finished = []
+
+        for env, (game, envActions) in enumerate(zip(self.games, actions.tolist())):
+            items = self.__items[env]
+            occupants = self.__occupants[env]
+            positions = self.positions[env]
+            for agent, (name, action) in enumerate(zip(self.agents, envActions)):
+                player = game.all_players[name]
+                before = player.loc
+                game.movePlayer(name, ACTIONS[action])
+                if player.loc != before:
+                    x, y = player.loc
+                    occupants[before[0] + r, before[1] + r] = 0
+                    occupants[x + r, y + r] = agent + 1
+                    # A coin, if any, has just been picked up
+                    items[x + r, y + r] = EMPTY
+                    positions[agent] = x, y
+
+            self.ticks[env] += 1
+            scores = [team.score for team in game.teams.values()]
+            rewards[env] = (np.array(scores) - self.__scores[env])[self.agentTeams]
+            self.__scores[env] = scores
+
+            over = game.gameOver()
+            if over or self.ticks[env] >= self.maxTicks:
+                dones[env] = True
+                infos[env] = {'scores': game.getScores(), 'ticks': int(self.ticks[env]), 'truncated': not over}
+                finished.append(env)
+
+        # The batch is observed once, the finished games are observed again after their reset
+        observations = self.observe()
+        if self.autoReset and finished:
+            for env in finished:
+                infos[env]['finalObservation'] = observations[env].copy()
+                self.__resetEnv(env)
+            observations[finished] = self.observe(finished)
+        return observations, rewards, dones, infos
+
+    def observe(self, envs: Optional[list[int]] = None) -> np.ndarray:
+        """
+        :param envs: environments to observe, all of them by default
+        :return: (numEnvs, numAgents, len(CHANNELS), 2r+1, 2r+1) one-hot windows centered on every agent
+        """
+        positions = self.positions if envs is None else self.positions[envs]
+        envIndex = self.__envIndex if envs is None else np.asarray(envs)[:, None, None, None]
+        # The padding shifts the board by r, so the window of a player at x starts at x on the padded grid
+        rows = positions[:, :, 0, None, None] + self.__offsets[:, None]
+        cols = positions[:, :, 1, None, None] + self.__offsets[None, :]
+        items = self.__items[envIndex, rows, cols]
+        occupants = self.__occupants[envIndex, rows, cols]
+        occupantTeams = self.__occupantTeams[occupants]
+        viewerTeams = self.agentTeams[None, :, None, None]
+
+        observations = np.empty((len(positions), len(self.agents)) + self.observationShape, dtype=np.uint8)
+        observations[:, :, :4] = items[:, :, None] == _ITEM_CHANNELS
+        observations[:, :, 4] = (occupantTeams == viewerTeams) & (occupants != self.__agentIds)
+        observations[:, :, 5] = (occupantTeams >= 0) & (occupantTeams != viewerTeams)
+        observations[:, :, 6] = occupants == self.__agentIds
+        observations[:, :, 7] = items == OUTSIDE
+        return observations
+
+    def __resetEnv(self, env: int):
+        r = self.visionRadius
+        game = self.games[env] = Game(self.playerNames, width=self.width, height=self.height, generator=self.generator,
+                                      seed=self.__seeds[env].getrandbits(63), visionRadius=r)
+        items = self.__items[env]
+        items[r:r + self.height, r:r + self.width] = EMPTY
+        for x in range(self.height):
+            for y in range(self.width):
+                code = _ITEM_CODES.get(type(game.map.get((x, y))))
+                if code is not None:
+                    items[x + r, y + r] = code
+
+        self.__occupants[env] = 0
+        for agent, name in enumerate(self.agents):
+            x, y = self.positions[env, agent] = game.all_players[name].loc
+            self.__occupants[env, x + r, y + r] = agent + 1
+        self.ticks[env] = 0
+        self.__scores[env] = 0
+
+
+if __name__ == '__main__':
+    import time
+
+    env = VecGameEnv(64, {'TeamA': ['A0', 'A1'], 'TeamB': ['B0', 'B1']})
+    env.reset(seed=0)
+    rng = np.random.default_rng(0)
+    steps = 2000
+    started = time.perf_counter()
+    for _ in range(steps):
+        env.step(rng.integers(len(ACTIONS), size=(env.numEnvs, len(env.agents))))
+    duration = time.perf_counter() - started
+    print(f'{steps * env.numEnvs / duration:.0f} env steps/s, {steps * env.numEnvs * len(env.agents) / duration:.0f} agent steps/s')
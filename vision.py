@@ -0,0 +1,48 @@
+from functools import lru_cache
+
+
+def _lineTo(dx: int, dy: int) -> list[tuple[int, int]]:
+    """
+    Bresenham line from (0,0) to (dx,dy), both ends included
+    """
+    cells = []
+    x, y = 0, 0
+    stepX = 1 if dx > 0 else -1
+    stepY = 1 if dy > 0 else -1
+    adx, ady = abs(dx), abs(dy)
+    err = adx - ady
+    while True:
+        cells.append((x, y))
+        if (x, y) == (dx, dy):
+            return cells
+        e2 = 2 * err
+        if e2 > -ady:
+            err -= ady
+            x += stepX
+        if e2 < adx:
+            err += adx
+            y += stepY
+
+
+@lru_cache(maxsize=None)
+def getVisibilityTable(visionRadius: int) -> tuple[tuple[int, int, int], ...]:
+    """
+    Precomputes the line of sight for a square window of the given radius.
+
+    Each offset of the window is linked to its parent, the previous cell on the line from
+    the viewer to it. An offset is visible if its parent is visible and isn't a wall, so one
+    pass over the table in order answers the whole window without casting any rays.
+    :return: ((dx, dy, parentIndex), ...) ordered so parents always come before their children,
+             the viewer itself is at index 0 with a parent of -1
+    """
+    assert isinstance(visionRadius, int) and visionRadius >= 0
+    offsets = [(dx, dy) for dx in range(-visionRadius, visionRadius + 1) for dy in range(-visionRadius, visionRadius + 1)]
+    offsets.sort(key=lambda offset: (max(abs(offset[0]), abs(offset[1])), offset))
+
+    index = {offset: i for i, offset in enumerate(offsets)}
+    table = []
+    for dx, dy in offsets:
+        line = _lineTo(dx, dy)
+        parent = index[line[-2]] if len(line) > 1 else -1
+        table.append((dx, dy, parent))
+    return tuple(table)
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from lazyImport import lazyImport
+from moveset import Moveset
+from vision import getVisibilityTable
+np = lazyImport('numpy') # loaded by the first WorldModel
+
+# Cell codes of the world model
+UNKNOWN = 0
+EMPTY = 1
+WALL = 2
+COIN1 = 3
+COIN2 = 4
+COIN3 = 5
+TEAMMATE = 6
+ENEMY = 7
+PLAYER = 8
+OUTSIDE = 9
+
+# Names used by the printed views and choose_direction, indexed by code
+CELL_NAMES = ('None', 'None', 'Wall', 'Coin1', 'Coin2', 'Coin3', 'Teammate', 'Enemy', 'Player', '.')
+
+# Codes of the cells a move can't enter, like Game.movePlayer
+BLOCKING = (WALL, TEAMMATE, ENEMY, PLAYER)
+
+# game_state keys and the code of the positions they list
+STATE_CODES = (('walls', WALL), ('coin1', COIN1), ('coin2', COIN2), ('coin3', COIN3),
+               ('teammatePositions', TEAMMATE), ('enemyPositions', ENEMY))
+
+
+class WorldModel:
+    def __init__(self, height: int = 10, width: int = 10, vision_radius: int = 2, line_of_sight: bool = False):
+        """
+        Everything a player has seen so far, merged from successive game_state messages.
+        :param height: height of the board
+        :param width: width of the board
+        :param vision_radius: vision radius the server uses for game_state messages
+        :param line_of_sight: whether the server hides the cells behind walls, only the cells in sight are updated then
+        """
+        self.vision_radius = vision_radius
+        self.line_of_sight = line_of_sight
+        self.tick = 0
+        self.position = None
+        self.predicted = None # position predict_move() expects the next game_state to confirm, None if nothing is predicted
+        self.predictions = 0
+        self.mispredictions = 0
+        self.resize(height, width)
+
+    def resize(self, height: int, width: int):
+        """
+        Starts over with an unknown board of the given size
+        """
+        self.height = height
+        self.width = width
+        self.grid = np.full((height, width), UNKNOWN, dtype=np.int8)
+        self.last_seen = np.full((height, width), -1, dtype=np.int32) # tick each cell was last in view, -1 if never
+
+    def update(self, game_state: dict):
+        """
+        Merges a game_state observation into the model.
+        Only the entities in view are touched from Python, the rest of the window is updated with NumPy slices.
+        """
+        self.tick += 1
+        self.position = tuple(game_state['currentPosition'])
+        self.__reconcile()
+        self.__merge(game_state, [self.position], {self.position: PLAYER})
+
+    def update_team(self, team_state: dict):
+        """
+        Merges a team game_state, the union of the views of every teammate, into the model.
+        The position of the player comes separately, see locate().
+        """
+        self.tick += 1
+        self.__merge(team_state, [tuple(loc) for loc in team_state['teammatePositions']], {})
+
+    def locate(self, position):
+        """
+        Moves the player to the position of a team vision game_state, which only holds the position
+        """
+        self.position = tuple(position)
+        self.__reconcile()
+
+    def predict_move(self, direction: str) -> tuple[int, int]:
+        """
+        Applies the player's own move to the model before the server resolves it, with the rules of Game.movePlayer.
+        Cells never seen are taken to be free. The next game_state tells whether the prediction held, it wins either way.
+        :param direction: UP, DOWN, LEFT or RIGHT
+        :return: the predicted position
+        """
+        assert self.position is not None
+        x, y = self.position
+        dx, dy = Moveset[direction].value
+        new_loc = x + dx, y + dy
+        if 0 <= new_loc[0] < self.height and 0 <= new_loc[1] < self.width and self.grid[new_loc] not in BLOCKING:
+            # A coin on the cell is picked up, a model shared by a team holds the player as a teammate
+            code = self.grid[self.position]
+            self.grid[self.position] = EMPTY
+            self.grid[new_loc] = code if code in (PLAYER, TEAMMATE) else PLAYER
+            self.position = new_loc
+        self.predicted = self.position
+        return self.position
+
+    def __reconcile(self):
+        if self.predicted is not None:
+            self.predictions += 1
+            if self.predicted != self.position:
+                self.mispredictions += 1
+            self.predicted = None
+
+    def __merge(self, game_state: dict, centers: list[tuple[int, int]], seen: dict[tuple[int, int], int]):
+        for key, code in STATE_CODES:
+            for loc in game_state.get(key, []):
+                seen[tuple(loc)] = code
+
+        r = self.vision_radius
+        for x, y in centers:
+            if self.line_of_sight:
+                self.__mergeInSight(x, y, seen)
+                continue
+            x0, x1 = max(x - r, 0), min(x + r + 1, self.height)
+            y0, y1 = max(y - r, 0), min(y + r + 1, self.width)
+            window = self.grid[x0:x1, y0:y1]
+            window[window == UNKNOWN] = EMPTY
+
+            # Entities we remember in view that the server didn't list anymore are gone, walls never move
+            for row, col in zip(*np.nonzero((window > EMPTY) & (window != WALL))):
+                loc = (int(row) + x0, int(col) + y0)
+                if loc not in seen:
+                    self.grid[loc] = EMPTY
+            self.last_seen[x0:x1, y0:y1] = self.tick
+
+        for loc, code in seen.items():
+            self.grid[loc] = code
+
+    def __mergeInSight(self, x: int, y: int, seen: dict[tuple[int, int], int]):
+        """
+        Updates the cells in sight of (x, y) like Game's line of sight. The first wall on every line is in sight,
+        so the walls the server listed are all it takes to tell which cells it left out
+        """
+        table = getVisibilityTable(self.vision_radius)
+        clear = [False] * len(table)
+        for i, (dx, dy, parent) in enumerate(table):
+            loc = (x + dx, y + dy)
+            if not (0 <= loc[0] < self.height and 0 <= loc[1] < self.width) or (parent >= 0 and not clear[parent]):
+                continue
+            clear[i] = seen.get(loc) != WALL
+            code = self.grid[loc]
+            if code == UNKNOWN or (code > EMPTY and code != WALL and loc not in seen):
+                self.grid[loc] = EMPTY
+            self.last_seen[loc] = self.tick
+
+    def age(self) -> np.ndarray:
+        """
+        :return: number of updates since each cell was last in view, -1 for cells never seen
+        """
+        return np.where(self.last_seen < 0, -1, self.tick - self.last_seen)
+
+    def codes(self, radius: int = None) -> np.ndarray:
+        """
+        :return: (2r+1, 2r+1) array of codes centered on the player, OUTSIDE past the edge of the board
+        """
+        r = self.vision_radius if radius is None else radius
+        size = 2 * r + 1
+        view = np.full((size, size), OUTSIDE, dtype=np.int8)
+        if self.position is None:
+            return view
+        x, y = self.position
+        x0, x1 = max(x - r, 0), min(x + r + 1, self.height)
+        y0, y1 = max(y - r, 0), min(y + r + 1, self.width)
+        view[x0 - x + r:x1 - x + r, y0 - y + r:y1 - y + r] = self.grid[x0:x1, y0:y1]
+        # A model shared by a team holds the player as a teammate
+        view[r, r] = PLAYER
+        return view
+
+    def view(self, radius: int = None) -> list[list[str]]:
+        """
+        :return: the codes() window as a list of rows of cell names, as printed by the clients
+        """
+        return [[CELL_NAMES[code] for code in row] for row in self.codes(radius).tolist()]